@@ -0,0 +1,24 @@
+# Sourced by the strace capture scripts. COMPRESS=gz|xz|zst pipes the strace output through
+# the compressor, the analyzers read the compressed trace directly.
+#
+#     . "$(dirname "$0")/../Common/compress.sh"
+#     strace_target "mysql-$(uname -r).strace"
+#     strace -f -p "$(pidof mysqld)" -o "$strace_output"
+#
+# strace_target sets trace_file, the file the trace ends up in (with a .gz, .xz or .zst
+# suffix when compressed), and strace_output, the -o argument that writes it.
+case "${COMPRESS:-}" in
+    gz) compressor="gzip -c" ;;
+    xz) compressor="xz -T0 -c" ;;
+    zst) compressor="zstd -q -c" ;;
+    "") compressor="" ;;
+    *) echo "COMPRESS must be gz, xz or zst"; exit 1 ;;
+esac
+
+strace_target() {
+    trace_file="$1${COMPRESS:+.$COMPRESS}"
+    strace_output="$trace_file"
+    if [ -n "$compressor" ]; then
+        strace_output="|$compressor > $trace_file"
+    fi
+}
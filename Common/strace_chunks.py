@@ -0,0 +1,77 @@
+"""
+Syscall counts of an strace capture, read in fixed-size chunks and optionally split
+over worker processes.
+
+Every syscall_graph.py passes the pattern of its capture format; the syscall name is
+the pattern's last group. Patterns must not let whitespace cross a newline, so that
+where the file is split cannot change the result.
+"""
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from trace_io import is_compressed, open_trace
+
+# Read the trace in fixed-size chunks so memory stays flat however large it is
+CHUNK_SIZE = 8 * 1024 * 1024
+
+def count_syscalls(pattern, data, counts):
+    """Add the syscalls found in a block of complete lines to counts"""
+    name = pattern.groups
+    counts.update(match.group(name) for match in pattern.finditer(data))
+
+def find_chunk_offsets(file_path, jobs):
+    """Split the file into `jobs` byte ranges that start and end on line boundaries"""
+    size = os.path.getsize(file_path)
+    offsets = [0]
+    with open(file_path, 'rb') as file:
+        for i in range(1, jobs):
+            file.seek(max(size * i // jobs, offsets[-1]))
+            file.readline()
+            offsets.append(min(file.tell(), size))
+    offsets.append(size)
+    return list(zip(offsets[:-1], offsets[1:]))
+
+def parse_strace_range(file_path, pattern, start, end, chunk_size=CHUNK_SIZE):
+    """
+    Stream bytes [start, end) of the trace and return a Counter of raw syscall names,
+    end None reads to the end of the file (the only way to read a compressed trace).
+    Chunks are cut at the last newline so no line is split between two reads.
+    """
+    counts = Counter()
+    remainder = b''
+    with open_trace(file_path) as file:
+        if start:
+            file.seek(start)
+        left = end - start if end is not None else float('inf')
+        while left > 0:
+            chunk = file.read(min(chunk_size, left))
+            if not chunk:
+                break
+            left -= len(chunk)
+            chunk = remainder + chunk
+            cut = chunk.rfind(b'\n') + 1
+            remainder = chunk[cut:]
+            count_syscalls(pattern, chunk[:cut], counts)
+    count_syscalls(pattern, remainder, counts)
+    return counts
+
+def parse_strace_file(file_path, pattern, jobs=1, chunk_size=CHUNK_SIZE):
+    """
+    Return a Counter of syscall names in the trace.
+    With jobs > 1 the file is split at line boundaries, each range is parsed in
+    its own process and the per-worker counters are merged. Compressed traces cannot be
+    split at byte offsets and are always read in one pass.
+    """
+    if jobs <= 1 or is_compressed(file_path):
+        counts = parse_strace_range(file_path, pattern, 0, None, chunk_size)
+    else:
+        ranges = find_chunk_offsets(file_path, jobs)
+        counts = Counter()
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(parse_strace_range, file_path, pattern, start, end, chunk_size)
+                       for start, end in ranges]
+            for future in futures:
+                counts.update(future.result())
+
+    return Counter({name.decode(): count for name, count in counts.items()})
@@ -0,0 +1,51 @@
+import math
+from array import array
+from collections import Counter, defaultdict
+
+from strace_parser import iter_records, pair_records
+
+def collect_latencies(file_path):
+    """
+    Pair every syscall in the trace and collect its duration in seconds.
+    Returns ({syscall: array of durations}, Counter of calls without any timing).
+    """
+    durations = defaultdict(lambda: array('d'))
+    untimed = Counter()
+    for pid, timestamp, syscall, duration in pair_records(iter_records(file_path)):
+        if duration is None:
+            untimed[syscall] += 1
+        else:
+            durations[syscall].append(duration)
+    return durations, untimed
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of an already sorted sequence
+    """
+    if not sorted_values:
+        return float('nan')
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize_latency(durations):
+    """
+    Build one row per syscall with total, mean, p50, p99 and max time in seconds,
+    ordered by total time spent in the syscall.
+    """
+    rows = []
+    for syscall, values in durations.items():
+        if len(values) == 0:
+            continue
+        ordered = sorted(values)
+        total = math.fsum(ordered)
+        rows.append({
+            'syscall': syscall,
+            'calls': len(ordered),
+            'total': total,
+            'mean': total / len(ordered),
+            'p50': percentile(ordered, 0.50),
+            'p99': percentile(ordered, 0.99),
+            'max': ordered[-1],
+        })
+    rows.sort(key=lambda row: row['total'], reverse=True)
+    return rows
@@ -0,0 +1,135 @@
+"""
+Frequent syscall sequences (n-grams) per thread, mined from an strace -f capture in
+one pass with bounded memory.
+
+Every thread's last n syscalls are kept, and each call completes one n-gram of that
+thread (futex -> futex, pread64 -> pwrite64 -> fsync, ...). The n-grams are counted with
+the space-saving algorithm (Metwally et al., "Efficient Computation of Frequent and
+Top-k Elements in Data Streams"): at most `capacity` sequences are monitored and, when a
+new one arrives while the table is full, it replaces the least counted one and inherits
+its count as an error bound. So for every reported sequence
+
+    count - error  <=  true count  <=  count
+
+and every sequence that occurs more than total / capacity times is in the table. Memory
+depends on capacity and the number of threads, never on the size of the trace.
+"""
+import heapq
+
+from strace_parser import CALL_START_PATTERN
+from trace_io import open_trace
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+class SpaceSaving:
+    """
+    Top-k counter over a stream with at most capacity entries. counts[key] is the
+    estimate, errors[key] how much of it may come from the evicted entry it replaced.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        # (count, key) entries, possibly stale: a count that has grown since it was pushed
+        # is fixed up when it reaches the top, so increments stay O(1)
+        self._heap = []
+
+    def add(self, key, amount=1):
+        self.total += amount
+        counts = self.counts
+        count = counts.get(key)
+        if count is not None:
+            counts[key] = count + amount
+            return
+        if len(counts) < self.capacity:
+            counts[key] = amount
+            self.errors[key] = 0
+            heapq.heappush(self._heap, (amount, key))
+            return
+        floor, evicted = self._pop_min()
+        del counts[evicted]
+        del self.errors[evicted]
+        counts[key] = floor + amount
+        self.errors[key] = floor
+        heapq.heappush(self._heap, (floor + amount, key))
+
+    def _pop_min(self):
+        heap = self._heap
+        while True:
+            count, key = heapq.heappop(heap)
+            current = self.counts.get(key)
+            if current == count:
+                return count, key
+            if current is not None:
+                heapq.heappush(heap, (current, key))
+
+    def top(self, k):
+        """[(key, count, error)] of the k largest estimates"""
+        keys = heapq.nlargest(k, self.counts, key=self.counts.get)
+        return [(key, self.counts[key], self.errors[key]) for key in keys]
+
+def mine_ngrams(file_path, n=3, capacity=10000, chunk_size=CHUNK_SIZE):
+    """
+    Stream the trace once and return (SpaceSaving of n-grams as tuples of syscall names,
+    number of threads seen). Lines without a pid prefix (the process strace attached to)
+    form one thread.
+    """
+    summary = SpaceSaving(capacity)
+    name_ids = {}
+    windows = {}        # pid -> tuple of the ids of its last n - 1 syscalls
+
+    def add(data):
+        add_ngram = summary.add
+        for bracketed, plain, name in CALL_START_PATTERN.findall(data):
+            pid = bracketed or plain
+            call = name_ids.get(name)
+            if call is None:
+                call = name_ids[name] = len(name_ids)
+            window = windows.get(pid, ()) + (call,)
+            if len(window) == n:
+                add_ngram(window)
+                window = window[1:]
+            windows[pid] = window
+
+    remainder = b''
+    with open_trace(file_path) as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            chunk = remainder + chunk
+            cut = chunk.rfind(b'\n') + 1
+            remainder = chunk[cut:]
+            add(chunk[:cut])
+    add(remainder)
+
+    # Back from ids to names, once per monitored sequence
+    names = [name.decode() for name in name_ids]
+    named = SpaceSaving(capacity)
+    named.total = summary.total
+    for key, count in summary.counts.items():
+        sequence = tuple(names[call] for call in key)
+        named.counts[sequence] = count
+        named.errors[sequence] = summary.errors[key]
+    return named, len(windows)
+
+def top_sequences(summary, k):
+    """Report rows of the k most frequent sequences with their error bounds"""
+    rows = []
+    for rank, (sequence, count, error) in enumerate(summary.top(k), 1):
+        rows.append({
+            'rank': rank,
+            'sequence': ' -> '.join(sequence),
+            'count': count,
+            'error': error,
+            'min_count': count - error,
+            'percentage': round(count / summary.total * 100, 2) if summary.total else 0.0,
+        })
+    return rows
+
+def print_sequences(label, rows, summary, threads, n):
+    print(f"\nMost frequent {n}-call sequences in {label}")
+    print("=" * 50)
+    print(f"{summary.total:,} sequences from {threads:,} threads, {len(summary.counts):,} monitored; "
+          f"counts are exact to within the error column")
+    print(f"{'rank':>4} {'count':>12} {'error':>10} {'share':>7}  sequence")
+    for row in rows:
+        print(f"{row['rank']:>4} {row['count']:>12,} {row['error']:>10,} {row['percentage']:>6.2f}%  {row['sequence']}")
@@ -0,0 +1,122 @@
+import re
+from collections import namedtuple
+
+from trace_io import open_trace
+
+# One parsed strace line. timestamp and duration are in seconds, or None when the
+# trace was not recorded with -tt/-ttt or -T.
+StraceRecord = namedtuple('StraceRecord', ['pid', 'timestamp', 'syscall', 'kind', 'duration'])
+
+COMPLETE = 'complete'
+UNFINISHED = 'unfinished'
+RESUMED = 'resumed'
+
+# Handles the prefixes produced by the capture scripts in this repo:
+#   [pid  1234] futex(...)              strace -f -p      (MySqlBenchmarking)
+#   1234  12:00:01.123456 read(...)     strace -f -tt -o  (MLBenchmarking, StraceAnalysis)
+#   1234  1700000000.123456 read(...)   strace -f -ttt -o
+LINE_PATTERN = re.compile(
+    r'^(?:\[pid\s+(?P<pid>\d+)\]\s+|(?P<opid>\d+)\s+)?'
+    r'(?:(?P<ts>\d+:\d+:\d+(?:\.\d+)?|\d+\.\d+)\s+)?'
+    r'(?:<\.\.\.\s+(?P<resumed>\w+)\s+resumed>|(?P<name>\w+)\()'
+)
+# The same prefixes over a whole block of lines (bytes), for the streaming analyses: the
+# pid of "[pid N]" or "N " and the name of every call that starts. Resumed halves are not
+# matched, so a call split by strace is counted once.
+CALL_START_PATTERN = re.compile(
+    rb'^(?:\[pid[^\S\n]+(\d+)\][^\S\n]+|(\d+)[^\S\n]+)?(?:\d+:\d+:\d+(?:\.\d+)?[^\S\n]+|\d+\.\d+[^\S\n]+)?(\w+)\(',
+    re.MULTILINE)
+DURATION_PATTERN = re.compile(r'<(\d+\.\d+)>\s*$')
+UNFINISHED_MARKER = '<unfinished ...>'
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+def parse_timestamp(ts):
+    """
+    Convert a -tt (HH:MM:SS.ffffff) or -ttt (epoch) timestamp to seconds
+    """
+    if ':' in ts:
+        hours, minutes, seconds = ts.split(':')
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    return float(ts)
+
+def parse_line(line):
+    """
+    Parse one strace line into a StraceRecord.
+    Returns None for signals, exit notices and anything else that is not a syscall.
+    """
+    match = LINE_PATTERN.match(line)
+    if not match:
+        return None
+
+    pid = match.group('pid') or match.group('opid')
+    pid = int(pid) if pid else None
+    ts = match.group('ts')
+    timestamp = parse_timestamp(ts) if ts else None
+
+    if match.group('resumed'):
+        syscall, kind = match.group('resumed'), RESUMED
+    elif line.rstrip().endswith(UNFINISHED_MARKER):
+        syscall, kind = match.group('name'), UNFINISHED
+    else:
+        syscall, kind = match.group('name'), COMPLETE
+
+    duration = None
+    if kind != UNFINISHED:
+        duration_match = DURATION_PATTERN.search(line)
+        if duration_match:
+            duration = float(duration_match.group(1))
+
+    return StraceRecord(pid, timestamp, syscall, kind, duration)
+
+def iter_records(file_path):
+    """
+    Stream StraceRecords from a trace file one line at a time
+    """
+    with open_trace(file_path, 'r') as file:
+        for line in file:
+            record = parse_line(line)
+            if record is not None:
+                yield record
+
+def pair_records(records):
+    """
+    Join `<unfinished ...>` and `<... name resumed>` halves of the same call per pid.
+
+    Yields (pid, start_timestamp, syscall, duration) once for every syscall that starts
+    in the trace, so the count of calls is the count of call starts, the same as the
+    streaming counters report. The duration comes from the -T suffix when present,
+    otherwise from the -tt timestamps of the unfinished and resumed lines, otherwise it
+    is None, as for calls still unfinished when the trace ends.
+    """
+    pending = {}
+    for record in records:
+        if record.kind == UNFINISHED:
+            left = pending.pop(record.pid, None)
+            if left is not None:
+                yield left.pid, left.timestamp, left.syscall, None
+            pending[record.pid] = record
+            continue
+
+        if record.kind == COMPLETE:
+            yield record.pid, record.timestamp, record.syscall, record.duration
+            continue
+
+        started = pending.pop(record.pid, None)
+        if started is not None and started.syscall != record.syscall:
+            yield started.pid, started.timestamp, started.syscall, None
+            started = None
+        if started is None:
+            # The start of this call happened before the trace was attached
+            continue
+        duration = record.duration
+        if duration is None and started.timestamp is not None and record.timestamp is not None:
+            duration = record.timestamp - started.timestamp
+            if duration < 0:
+                # -tt wall clock wrapped past midnight
+                duration += SECONDS_PER_DAY
+        yield record.pid, started.timestamp, record.syscall, duration
+
+    # Calls that never returned before strace detached
+    for started in pending.values():
+        yield started.pid, started.timestamp, started.syscall, None
@@ -0,0 +1,176 @@
+"""
+Per-thread syscall counts from strace -f captures.
+
+Syscall names and thread ids are interned to small integers as the trace is read, and
+each chunk's (thread, syscall) pairs are added to a threads x syscalls matrix with one
+bincount, instead of updating a Counter per line. The matrix holds one int64 per pair
+of thread and distinct syscall, so thousands of threads take a few megabytes.
+
+clone/clone3/fork/vfork results are followed to tell threads (CLONE_THREAD) from child
+processes, which is how PyTorch DataLoader workers show up in the ML traces. Lines
+without a pid prefix (the process strace was attached to, in `strace -f -p` captures)
+are counted under pid 0.
+"""
+import re
+from array import array
+
+import numpy as np
+
+from strace_parser import CALL_START_PATTERN
+from trace_io import open_trace
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# Both halves of the calls that create tasks, the new task's id is the return value
+CLONE_PATTERN = re.compile(
+    rb'^(?:\[pid[^\S\n]+(\d+)\][^\S\n]+|(\d+)[^\S\n]+)?(?:[\d:.]+[^\S\n]+)?(<\.\.\.[^\S\n]+)?'
+    rb'(?:clone3?|v?fork)\b([^\n]*)$', re.MULTILINE)
+RESULT_PATTERN = re.compile(rb'=[^\S\n]+(\d+)[^\S\n]*(?:<[\d.]+>)?[^\S\n]*$')
+UNFINISHED_MARKER = b'<unfinished ...>'
+
+THREAD = 'thread'
+PROCESS = 'process'
+
+class ThreadCounts:
+    """
+    counts[i, j] is how often thread tids[i] made syscall names[j]. parents and kinds
+    map a tid to the task that created it and to THREAD or PROCESS, for tasks whose
+    creation is in the trace.
+    """
+    def __init__(self, tids, names, counts, parents, kinds):
+        self.tids = tids
+        self.names = names
+        self.counts = counts
+        self.parents = parents
+        self.kinds = kinds
+
+    def process_of(self, tid):
+        """The process a thread belongs to: itself, or its nearest creator that is not a thread"""
+        seen = set()
+        while self.kinds.get(tid) == THREAD and tid in self.parents and tid not in seen:
+            seen.add(tid)
+            tid = self.parents[tid]
+        return tid
+
+def count_thread_syscalls(file_path, chunk_size=CHUNK_SIZE):
+    """Stream the trace once and return its ThreadCounts"""
+    tid_ids, name_ids = {}, {}
+    counts = np.zeros((0, 0), dtype=np.int64)
+    parents, kinds = {}, {}
+    pending_threads = {}    # pid -> whether its unfinished clone creates a thread
+
+    def add(data):
+        nonlocal counts
+        rows, columns = array('I'), array('I')
+        add_row, add_column = rows.append, columns.append
+        for bracketed, plain, name in CALL_START_PATTERN.findall(data):
+            pid = bracketed or plain or b'0'
+            row = tid_ids.get(pid)
+            if row is None:
+                row = tid_ids[pid] = len(tid_ids)
+            column = name_ids.get(name)
+            if column is None:
+                column = name_ids[name] = len(name_ids)
+            add_row(row)
+            add_column(column)
+
+        if b'clone' in data or b'fork' in data:
+            for match in CLONE_PATTERN.finditer(data):
+                pid = int(match.group(1) or match.group(2) or 0)
+                rest = match.group(4)
+                creates_thread = pending_threads.pop(pid, False) if match.group(3) else False
+                creates_thread = creates_thread or b'CLONE_THREAD' in rest
+                if rest.rstrip().endswith(UNFINISHED_MARKER):
+                    pending_threads[pid] = creates_thread
+                    continue
+                result = RESULT_PATTERN.search(rest)
+                if result and int(result.group(1)) > 0:
+                    child = int(result.group(1))
+                    parents[child] = pid
+                    kinds[child] = THREAD if creates_thread else PROCESS
+
+        if not rows:
+            return
+        shape = (len(tid_ids), len(name_ids))
+        if counts.shape != shape:
+            grown = np.zeros(shape, dtype=np.int64)
+            grown[:counts.shape[0], :counts.shape[1]] = counts
+            counts = grown
+        flat = np.frombuffer(rows, dtype=np.uint32).astype(np.int64) * shape[1] + np.frombuffer(columns, dtype=np.uint32)
+        counts += np.bincount(flat, minlength=shape[0] * shape[1]).reshape(shape)
+
+    remainder = b''
+    with open_trace(file_path) as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            chunk = remainder + chunk
+            cut = chunk.rfind(b'\n') + 1
+            remainder = chunk[cut:]
+            add(chunk[:cut])
+    add(remainder)
+
+    return ThreadCounts([int(pid) for pid in tid_ids], [name.decode() for name in name_ids], counts, parents, kinds)
+
+def store_thread_counts(store):
+    """ThreadCounts from the columnar cache of trace_store (which does not keep clone results)"""
+    names = store.tables['syscall']
+    pids = np.asarray(store.columns['pid'])
+    tids, rows = np.unique(pids, return_inverse=True)
+    flat = rows.astype(np.int64) * len(names) + np.asarray(store.columns['syscall'])
+    counts = np.bincount(flat, minlength=len(tids) * len(names)).reshape(len(tids), len(names))
+    # Unknown pids are -1 in the store, 0 here as in count_thread_syscalls
+    return ThreadCounts([max(0, int(tid)) for tid in tids], list(names), counts, {}, {})
+
+def rank_threads(thread_counts, top_syscalls=3):
+    """
+    One row per thread, busiest first: calls, share of all calls, the process it belongs
+    to and its most frequent syscalls.
+    """
+    counts = thread_counts.counts
+    totals = counts.sum(axis=1)
+    grand_total = int(totals.sum()) or 1
+    rows = []
+    for index in np.argsort(-totals, kind='stable'):
+        tid = thread_counts.tids[index]
+        busiest = np.argsort(-counts[index], kind='stable')[:top_syscalls]
+        rows.append({
+            'tid': tid,
+            'kind': thread_counts.kinds.get(tid, '-'),
+            'process': thread_counts.process_of(tid),
+            'calls': int(totals[index]),
+            'percentage': round(int(totals[index]) / grand_total * 100, 2),
+            'top_syscalls': {thread_counts.names[column]: int(counts[index, column])
+                             for column in busiest if counts[index, column]},
+        })
+    return rows
+
+def rank_processes(thread_counts, top_syscalls=3):
+    """
+    The same ranking per process (a process and all its threads), so that every child
+    process, such as a DataLoader worker, gets one row.
+    """
+    processes = [thread_counts.process_of(tid) for tid in thread_counts.tids]
+    ids, rows = np.unique(np.array(processes, dtype=np.int64), return_inverse=True)
+    per_process = np.zeros((len(ids), len(thread_counts.names)), dtype=np.int64)
+    np.add.at(per_process, rows, thread_counts.counts)
+    threads = np.bincount(rows, minlength=len(ids))
+    grouped = ThreadCounts([int(pid) for pid in ids], thread_counts.names, per_process,
+                           thread_counts.parents, thread_counts.kinds)
+    ranked = rank_threads(grouped, top_syscalls)
+    thread_numbers = dict(zip(grouped.tids, threads.tolist()))
+    for row in ranked:
+        row['threads'] = thread_numbers[row['tid']]
+        row['parent'] = thread_counts.parents.get(row['tid'])
+    return ranked
+
+def print_thread_ranking(rows, title, top):
+    print(f"\n{title}")
+    print("=" * 50)
+    grouped = bool(rows) and 'threads' in rows[0]
+    owner = 'threads' if grouped else 'process'
+    print(f"{'tid':>8} {'kind':>8} {owner:>8} {'calls':>12} {'share':>7}  top syscalls")
+    for row in rows[:top]:
+        syscalls = ', '.join(f"{name} {count:,}" for name, count in row['top_syscalls'].items())
+        print(f"{row['tid']:>8} {row['kind']:>8} {row[owner]:>8} {row['calls']:>12,} "
+              f"{row['percentage']:>6.2f}%  {syscalls}")
+    if len(rows) > top:
+        print(f"... {len(rows) - top} more")
@@ -0,0 +1,254 @@
+"""
+Syscall rate timelines from strace captures recorded with -tt or -ttt.
+
+The trace is read once, in fixed-size chunks, and every call is added to the window
+(bin) its start timestamp falls in: one array of counts per syscall, indexed by bin.
+Nothing but the counters is kept, so memory depends on the length of the run and the
+number of distinct syscalls, not on the size of the trace.
+
+Phases are found by binary segmentation of the per-window mix (log rates of the busiest
+syscalls and of all calls together): the split that explains the most variance is taken
+while it explains at least min_gain of the whole timeline's variance, clearly more than
+the window-to-window noise would, and leaves at least min_bins windows on each side.
+That separates e.g. sysbench's prepare from its run, or the DataLoader's warm-up from
+the steady state of training.
+
+Pure python, matplotlib is only imported by plot_timeline.
+"""
+import math
+import re
+from array import array
+
+from trace_io import open_trace
+
+CHUNK_SIZE = 8 * 1024 * 1024
+SECONDS_PER_DAY = 24 * 60 * 60
+# Refuse timelines that would need more windows than this (a trace spanning days at 1 ms)
+MAX_BINS = 10_000_000
+# How many times its noise (times log of the windows) a split has to explain to start a phase
+NOISE_PENALTY = 4.0
+
+# The start of every call: "[pid N] TS name(", "PID TS name(" or "TS name(", with TS in
+# -tt (HH:MM:SS.ffffff) or -ttt (epoch) form. "<... name resumed>" lines are not matched,
+# so a call split by strace is counted once, at its start.
+TIMESTAMP_PATTERN = re.compile(
+    rb'^(?:\[pid[^\S\n]+\d+\][^\S\n]+|\d+[^\S\n]+)?(\d+:\d+:\d+|\d+)(\.\d+)[^\S\n]+(\w+)\(', re.MULTILINE)
+
+class Timeline:
+    """
+    counts[syscall] is an array of calls per window, window seconds wide, the first
+    window starting at the trace's first timestamp (start, in seconds of the day or epoch).
+    """
+    def __init__(self, window):
+        self.window = window
+        self.start = None
+        self.counts = {}
+
+    @property
+    def bins(self):
+        return max((len(row) for row in self.counts.values()), default=0)
+
+    def series(self, syscall):
+        """Calls per second in every window"""
+        row = self.counts.get(syscall, ())
+        return [(row[i] if i < len(row) else 0) / self.window for i in range(self.bins)]
+
+    def total_series(self):
+        totals = [0] * self.bins
+        for row in self.counts.values():
+            for i, count in enumerate(row):
+                totals[i] += count
+        return [count / self.window for count in totals]
+
+    def busiest(self, top):
+        """The top syscalls by number of calls"""
+        return sorted(self.counts, key=lambda name: sum(self.counts[name]), reverse=True)[:top]
+
+def build_timeline(file_path, window=1.0, chunk_size=CHUNK_SIZE):
+    """
+    Stream the trace once and return its Timeline. Lines without a timestamp are
+    skipped; a ValueError is raised when there are none at all.
+    """
+    timeline = Timeline(window)
+    counts = {}
+    day_seconds = {}        # 'HH:MM:SS' or epoch seconds -> seconds, parsed once each
+    start = None
+    previous = 0.0
+    day_offset = 0.0
+
+    def add(data):
+        nonlocal start, previous, day_offset
+        for match in TIMESTAMP_PATTERN.finditer(data):
+            whole, fraction, name = match.groups()
+            base = day_seconds.get(whole)
+            if base is None:
+                if b':' in whole:
+                    hours, minutes, seconds = whole.split(b':')
+                    base = int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+                else:
+                    base = int(whole)
+                day_seconds[whole] = base
+            seconds = base + float(fraction) + day_offset
+            if seconds < previous - SECONDS_PER_DAY / 2:
+                # -tt wall clock wrapped past midnight
+                day_offset += SECONDS_PER_DAY
+                seconds += SECONDS_PER_DAY
+            previous = seconds
+            if start is None:
+                start = seconds
+            # Threads' lines are not strictly ordered, an early straggler goes to the first window
+            index = int((seconds - start) / window)
+            if index < 0:
+                index = 0
+            row = counts.get(name)
+            if row is None:
+                row = counts[name] = array('L')
+            if index >= len(row):
+                if index >= MAX_BINS:
+                    raise ValueError(f"the trace spans more than {MAX_BINS:,} windows of {window:g}s, "
+                                     f"use a larger window")
+                row.extend([0] * (index + 1 - len(row)))
+            row[index] += 1
+
+    remainder = b''
+    with open_trace(file_path) as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            chunk = remainder + chunk
+            cut = chunk.rfind(b'\n') + 1
+            remainder = chunk[cut:]
+            add(chunk[:cut])
+    add(remainder)
+
+    if start is None:
+        raise ValueError(f"no timestamps found in {file_path}, record the trace with -tt or -ttt")
+    timeline.start = start
+    timeline.counts = {name.decode(): row for name, row in counts.items()}
+    return timeline
+
+def noise_variance(values):
+    """Robust variance of the noise around a piecewise constant series (MAD of first differences)"""
+    steps = sorted(abs(b - a) for a, b in zip(values, values[1:]))
+    if not steps:
+        return 0.0
+    return (steps[len(steps) // 2] / 0.6745) ** 2 / 2
+
+def segment_cost(prefix, squares, begin, end):
+    """Sum of squared deviations from the mean of rows [begin, end), over every column"""
+    n = end - begin
+    cost = 0.0
+    for column_sum, column_squares in zip(prefix, squares):
+        total = column_sum[end] - column_sum[begin]
+        cost += column_squares[end] - column_squares[begin] - total * total / n
+    return cost
+
+def best_split(prefix, squares, begin, end, min_bins):
+    """(index, gain) of the best split of [begin, end), index None when it is too short"""
+    if end - begin < 2 * min_bins:
+        return None, 0.0
+    whole = segment_cost(prefix, squares, begin, end)
+    best, best_gain = None, 0.0
+    for index in range(begin + min_bins, end - min_bins + 1):
+        gain = whole - segment_cost(prefix, squares, begin, index) - segment_cost(prefix, squares, index, end)
+        if gain > best_gain:
+            best, best_gain = index, gain
+    return best, best_gain
+
+def detect_phases(timeline, top=8, min_bins=5, min_gain=0.05, max_phases=8):
+    """
+    Split the timeline into phases. Returns the bin index where every phase starts,
+    beginning with 0.
+    """
+    columns = [timeline.total_series()] + [timeline.series(name) for name in timeline.busiest(top)]
+    columns = [[math.log1p(rate) for rate in column] for column in columns]
+    prefix, squares = [], []
+    for column in columns:
+        running, running_squares = [0.0], [0.0]
+        for value in column:
+            running.append(running[-1] + value)
+            running_squares.append(running_squares[-1] + value * value)
+        prefix.append(running)
+        squares.append(running_squares)
+
+    bins = timeline.bins
+    if bins < 2 * min_bins:
+        return [0]
+    # A split must beat both a share of the total variance and what noise alone would
+    # explain: the per-window noise comes from the differences of neighbouring windows,
+    # which steps between phases barely move
+    noise = sum(noise_variance(column) for column in columns)
+    threshold = max(min_gain * segment_cost(prefix, squares, 0, bins), NOISE_PENALTY * math.log(bins) * noise)
+    segments = [(0, bins)]
+    while len(segments) < max_phases:
+        # Greedy: split the segment whose best split explains the most
+        candidates = [(best_split(prefix, squares, begin, end, min_bins), begin, end) for begin, end in segments]
+        (index, gain), begin, end = max(candidates, key=lambda candidate: candidate[0][1])
+        if index is None or gain <= threshold or gain <= 0:
+            break
+        segments.remove((begin, end))
+        segments += [(begin, index), (index, end)]
+    return sorted(begin for begin, _ in segments)
+
+def summarize_phases(timeline, starts, top=3):
+    """
+    One row per phase: its time range (seconds from the first call), calls per second,
+    the busiest syscalls and the syscall whose rate grew most against the previous phase
+    (None when no rate grew).
+    """
+    bins = timeline.bins
+    rows = []
+    previous_rates = {}
+    for number, (begin, end) in enumerate(zip(starts, starts[1:] + [bins]), 1):
+        seconds = (end - begin) * timeline.window
+        rates = {name: sum(row[begin:end]) / seconds for name, row in timeline.counts.items()}
+        rates = {name: rate for name, rate in rates.items() if rate}
+        busiest = sorted(rates, key=rates.get, reverse=True)[:top]
+        growth = {name: rate - previous_rates.get(name, 0.0) for name, rate in rates.items()}
+        rising = max(growth, key=growth.get, default=None)
+        if rising is not None and growth[rising] <= 0:
+            rising = None
+        rows.append({
+            'phase': number,
+            'start_s': round(begin * timeline.window, 3),
+            'end_s': round(end * timeline.window, 3),
+            'calls': int(round(sum(rates.values()) * seconds)),
+            'calls_per_s': round(sum(rates.values()), 1),
+            'busiest': [{'syscall': name, 'calls_per_s': round(rates[name], 1)} for name in busiest],
+            'rising': rising if number > 1 else None,
+        })
+        previous_rates = rates
+    return rows
+
+def print_phases(timeline, phases):
+    print(f"\nSyscall Timeline ({timeline.bins:,} windows of {timeline.window:g}s, "
+          f"{sum(sum(row) for row in timeline.counts.values()):,} calls)")
+    print("=" * 50)
+    print(f"{'phase':>5} {'start (s)':>10} {'end (s)':>10} {'calls/s':>12}  busiest syscalls (calls/s)")
+    for phase in phases:
+        busiest = ', '.join(f"{entry['syscall']} {entry['calls_per_s']:,.0f}" for entry in phase['busiest'])
+        rising = f"   [{phase['rising']} up]" if phase['rising'] else ''
+        print(f"{phase['phase']:>5} {phase['start_s']:>10.1f} {phase['end_s']:>10.1f} "
+              f"{phase['calls_per_s']:>12,.1f}  {busiest}{rising}")
+
+def plot_timeline(timeline, phases, output_file, top=8):
+    """Calls per second over time of the busiest syscalls, phase boundaries marked"""
+    import matplotlib.pyplot as plt
+
+    times = [i * timeline.window for i in range(timeline.bins)]
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(16, 10), sharex=True)
+    ax1.plot(times, timeline.total_series(), color='black', linewidth=1)
+    ax1.set_title('All System Calls', fontsize=14, pad=20)
+    ax1.set_ylabel('Calls per second', fontsize=12)
+    busiest = timeline.busiest(top)
+    for name in busiest:
+        ax2.plot(times, timeline.series(name), linewidth=1, label=name)
+    ax2.set_title(f'Busiest System Calls (top {len(busiest)})', fontsize=14, pad=20)
+    ax2.set_xlabel(f'Seconds since the first call ({timeline.window:g}s windows)', fontsize=12)
+    ax2.set_ylabel('Calls per second', fontsize=12)
+    ax2.set_yscale('symlog')
+    ax2.legend(loc='center left', bbox_to_anchor=(1, 0.5))
+    for phase in phases[1:]:
+        for ax in (ax1, ax2):
+            ax.axvline(phase['start_s'], color='red', linestyle='--', linewidth=1)
+    plt.tight_layout()
+    plt.savefig(output_file, bbox_inches='tight', dpi=300)
+    plt.close()
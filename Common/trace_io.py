@@ -0,0 +1,139 @@
+"""
+Open trace files the same way whether or not they are compressed.
+
+strace captures compress about 20:1, so the capture scripts can write them as .gz, .xz
+or .zst (COMPRESS=gz|xz|zst) and every analyzer reads them through open_trace without a
+temporary file. Decompression runs on a read-ahead thread that keeps a few blocks
+decoded ahead of the parser; zlib, lzma and zstd release the GIL while they work, so
+decompressing overlaps with parsing instead of adding to it.
+
+.zst needs Python 3.14's compression.zstd, the zstandard package, or the zstd command.
+Compressed files cannot be split at byte offsets, so the parallel (--jobs) parsers read
+them in a single pass.
+"""
+import gzip
+import io
+import lzma
+import queue
+import shutil
+import subprocess
+import threading
+
+COMPRESSED_SUFFIXES = ('.gz', '.xz', '.zst')
+READ_AHEAD_BLOCK = 4 * 1024 * 1024     # Decompressed bytes per block
+READ_AHEAD_DEPTH = 4                   # Blocks decoded ahead of the reader
+
+def is_compressed(file_path):
+    return str(file_path).endswith(COMPRESSED_SUFFIXES)
+
+class ZstdProcess(io.RawIOBase):
+    """Decompressed output of `zstd -dc`, for machines without a zstd module"""
+    def __init__(self, file_path):
+        self.process = subprocess.Popen(['zstd', '-dcq', str(file_path)], stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = self.process.stdout.readinto(buffer)
+        if count == 0 and self.process.wait() != 0:
+            raise OSError(f"zstd failed: {self.process.stderr.read().decode(errors='replace').strip()}")
+        return count
+
+    def close(self):
+        if not self.closed:
+            self.process.stdout.close()
+            if self.process.poll() is None:
+                self.process.kill()
+            self.process.wait()
+            self.process.stderr.close()
+        super().close()
+
+def open_zstd(file_path):
+    try:
+        from compression import zstd
+        return zstd.open(file_path, 'rb')
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        if shutil.which('zstd') is None:
+            raise OSError(f"cannot read {file_path}: install the zstandard package or the zstd command")
+        return io.BufferedReader(ZstdProcess(file_path), READ_AHEAD_BLOCK)
+    return zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), read_across_frames=True,
+                                                      closefd=True)
+
+def open_decompressed(file_path):
+    """Binary stream of the file's decompressed content"""
+    name = str(file_path)
+    if name.endswith('.gz'):
+        return gzip.open(file_path, 'rb')
+    if name.endswith('.xz'):
+        return lzma.open(file_path, 'rb')
+    return open_zstd(file_path)
+
+class ReadAheadReader(io.RawIOBase):
+    """Reads source on a background thread, READ_AHEAD_DEPTH blocks ahead of the consumer"""
+    def __init__(self, source, block_size=READ_AHEAD_BLOCK, depth=READ_AHEAD_DEPTH):
+        self.source = source
+        self.block_size = block_size
+        self.blocks = queue.Queue(maxsize=depth)
+        self.pending = memoryview(b'')
+        self.finished = False
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._fill, name='trace-read-ahead', daemon=True)
+        self.thread.start()
+
+    def _fill(self):
+        try:
+            while not self.stopping.is_set():
+                block = self.source.read(self.block_size)
+                self.blocks.put(block)
+                if not block:
+                    return
+        except BaseException as error:  # Handed to the reading thread
+            self.blocks.put(error)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.pending:
+            if self.finished:
+                return 0
+            block = self.blocks.get()
+            if isinstance(block, BaseException):
+                self.finished = True
+                raise block
+            if not block:
+                self.finished = True
+                return 0
+            self.pending = memoryview(block)
+        count = min(len(buffer), len(self.pending))
+        buffer[:count] = self.pending[:count]
+        self.pending = self.pending[count:]
+        return count
+
+    def close(self):
+        if not self.closed:
+            self.stopping.set()
+            # Unblock the filling thread if it waits on a full queue
+            while self.thread.is_alive():
+                try:
+                    self.blocks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self.source.close()
+        super().close()
+
+def open_trace(file_path, mode='rb', errors='replace'):
+    """
+    open(file_path, mode) for plain files; for .gz/.xz/.zst a read-ahead stream of the
+    decompressed content. mode is 'rb' or 'r' (text, decoded with errors).
+    """
+    if not is_compressed(file_path):
+        return open(file_path, mode) if 'b' in mode else open(file_path, mode, errors=errors)
+    stream = io.BufferedReader(ReadAheadReader(open_decompressed(file_path)), READ_AHEAD_BLOCK)
+    return stream if 'b' in mode else io.TextIOWrapper(stream, errors=errors)
@@ -0,0 +1,162 @@
+"""
+On-disk columnar cache for parsed trace and benchmark files.
+
+A parsed file is stored as one .npy array per column plus a meta.json holding
+the interned string tables and the key of the source it was built from.
+Columns are memory-mapped on reload, so re-analysing a large trace only touches
+the pages that are actually read.
+
+The cache lives in a .trace_cache directory next to the source file and is keyed
+by the source's absolute path, size, mtime and content hash. When size and mtime
+are unchanged the cache is used as is; otherwise the content hash decides whether
+the cache is still valid or has to be rebuilt.
+"""
+import hashlib
+import json
+import os
+import shutil
+from array import array
+from collections import Counter, namedtuple
+from pathlib import Path
+
+import numpy as np
+
+from strace_parser import iter_records, pair_records
+
+CACHE_DIR_NAME = '.trace_cache'
+FORMAT_VERSION = 2
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+TraceStore = namedtuple('TraceStore', ['columns', 'tables'])
+
+def file_digest(file_path):
+    """
+    BLAKE2b hash of the whole file, read in fixed-size blocks
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def store_dir_for(source_path, kind):
+    source_path = Path(source_path).resolve()
+    return source_path.parent / CACHE_DIR_NAME / f'{source_path.name}.{kind}'
+
+def read_meta(store_dir):
+    try:
+        with open(store_dir / 'meta.json') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def write_meta(store_dir, meta):
+    tmp_path = store_dir / 'meta.json.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(meta, file)
+    os.replace(tmp_path, store_dir / 'meta.json')
+
+def save_store(store_dir, columns, tables, meta):
+    """
+    Write the columns and tables to store_dir, replacing any previous store
+    """
+    tmp_dir = store_dir.with_name(store_dir.name + '.tmp')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    for name, values in columns.items():
+        np.save(tmp_dir / f'{name}.npy', np.ascontiguousarray(values))
+    write_meta(tmp_dir, dict(meta, columns=list(columns), tables=tables))
+    shutil.rmtree(store_dir, ignore_errors=True)
+    os.replace(tmp_dir, store_dir)
+
+def load_store(store_dir, meta):
+    columns = {name: np.load(store_dir / f'{name}.npy', mmap_mode='r') for name in meta['columns']}
+    return TraceStore(columns, meta['tables'])
+
+def load_or_build(source_path, kind, build):
+    """
+    Return the TraceStore for source_path, building it with build(source_path) if the
+    cache is missing or stale. build must return (columns, tables) where columns maps
+    names to numpy arrays of equal length and tables maps names to lists of strings.
+    """
+    source = Path(source_path).resolve()
+    stat = source.stat()
+    store_dir = store_dir_for(source, kind)
+    meta = read_meta(store_dir)
+
+    if (meta is not None and meta.get('version') == FORMAT_VERSION and meta.get('path') == str(source)
+            and meta.get('size') == stat.st_size):
+        if meta.get('mtime_ns') == stat.st_mtime_ns:
+            return load_store(store_dir, meta)
+        digest = file_digest(source)
+        if meta.get('digest') == digest:
+            # Touched but not modified, remember the new mtime
+            meta['mtime_ns'] = stat.st_mtime_ns
+            write_meta(store_dir, meta)
+            return load_store(store_dir, meta)
+    else:
+        digest = file_digest(source)
+
+    columns, tables = build(source)
+    meta = {
+        'version': FORMAT_VERSION,
+        'kind': kind,
+        'path': str(source),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'digest': digest,
+    }
+    save_store(store_dir, columns, tables, meta)
+    return load_store(store_dir, read_meta(store_dir))
+
+def build_strace_store(file_path):
+    """
+    Parse an strace file into one row per syscall started in it with columns
+    syscall (interned id), pid (-1 when unknown), timestamp and duration (NaN when unknown)
+    """
+    syscall_ids = {}
+    syscalls, pids = array('H'), array('i')
+    timestamps, durations = array('d'), array('d')
+    nan = float('nan')
+    for pid, timestamp, syscall, duration in pair_records(iter_records(file_path)):
+        syscalls.append(syscall_ids.setdefault(syscall, len(syscall_ids)))
+        pids.append(-1 if pid is None else pid)
+        timestamps.append(nan if timestamp is None else timestamp)
+        durations.append(nan if duration is None else duration)
+
+    columns = {
+        'syscall': np.frombuffer(syscalls, dtype=np.uint16),
+        'pid': np.frombuffer(pids, dtype=np.int32),
+        'timestamp': np.frombuffer(timestamps, dtype=np.float64),
+        'duration': np.frombuffer(durations, dtype=np.float64),
+    }
+    return columns, {'syscall': list(syscall_ids)}
+
+def load_strace_store(file_path):
+    return load_or_build(file_path, 'strace', build_strace_store)
+
+def store_syscall_counts(store):
+    """
+    Counter of calls per syscall name, a call split by strace counted once
+    """
+    names = store.tables['syscall']
+    counts = np.bincount(store.columns['syscall'], minlength=len(names))
+    return Counter({name: int(count) for name, count in zip(names, counts) if count})
+
+def store_syscall_durations(store):
+    """
+    Same result as strace_latency.collect_latencies, read from the columnar store
+    """
+    names = store.tables['syscall']
+    syscalls = np.asarray(store.columns['syscall'])
+    durations = np.asarray(store.columns['duration'])
+    timed = ~np.isnan(durations)
+    untimed = np.bincount(syscalls[~timed], minlength=len(names))
+
+    order = np.argsort(syscalls[timed], kind='stable')
+    sorted_ids = syscalls[timed][order]
+    sorted_durations = durations[timed][order]
+    bounds = np.searchsorted(sorted_ids, np.arange(len(names) + 1))
+    by_syscall = {names[i]: sorted_durations[bounds[i]:bounds[i + 1]]
+                  for i in range(len(names)) if bounds[i] < bounds[i + 1]}
+    return by_syscall, Counter({name: int(count) for name, count in zip(names, untimed) if count})
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Compare the function-graph traces of the same workload on two kernels.
+
+Both inputs are trace.dat files (or text reports) that go through tracecmd_to_flamegraph,
+or folded stacks it already wrote. Stacks are aligned by their function path and written
+as a differential folded file ("stack before after", the format flamegraph.pl colours
+by difference), and the time per kernel function is compared to rank the functions
+that account for the change:
+
+    python3 flamegraph_diff.py 5.15.0-X-test/trace_output/trace.dat 6.12.1-X-test/trace_output/trace.dat
+
+Self time is the time spent in a function itself and adds up to the total change;
+inclusive time also counts everything the function called. The share of a function is
+its change in self time over the sum of the absolute changes of all functions.
+"""
+import argparse
+import csv
+import json
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+from flamegraph_svg import write_svg
+from tracecmd_to_flamegraph import TARGET_FUNCTIONS, parse_tracecmd, self_times
+from tracedat_reader import TraceDatError
+
+REPORT_FIELDS = ['function', 'self_before', 'self_after', 'self_delta', 'inclusive_before',
+                 'inclusive_after', 'inclusive_delta', 'share_pct']
+
+def read_folded(input_file):
+    """Read folded stacks into {stack: value}, adding up repeated stacks"""
+    stacks = defaultdict(float)
+    with open(input_file, 'r') as folded:
+        for line in folded:
+            stack, _, value = line.rstrip('\n').rpartition(' ')
+            if stack:
+                stacks[stack] += float(value)
+    return dict(stacks)
+
+def load_stacks(input_file, targets=TARGET_FUNCTIONS, native=False, first_only=True):
+    """Self time per folded stack of a trace, or of a folded file as it is"""
+    if input_file.endswith('.folded'):
+        return read_folded(input_file)
+    stacks = {}
+    for target_stacks in parse_tracecmd(input_file, targets, native=native, first_only=first_only).values():
+        stacks.update(self_times(target_stacks))
+    return stacks
+
+def align_stacks(before, after, normalize=False):
+    """
+    {stack: (before, after)} over the stacks of both kernels, 0 where a stack is missing.
+    With normalize the after values are scaled to the same total as before.
+    """
+    scale = 1.0
+    if normalize and sum(after.values()):
+        scale = sum(before.values()) / sum(after.values())
+    return {stack: (before.get(stack, 0.0), after.get(stack, 0.0) * scale)
+            for stack in sorted(set(before) | set(after))}
+
+def write_diff_folded(aligned, output_file):
+    """Write "stack before after" lines, the input flamegraph.pl takes for a differential graph"""
+    with open(output_file, 'w') as f:
+        for stack, (before, after) in aligned.items():
+            f.write(f"{stack} {before:g} {after:g}\n")
+
+def frame_deltas(aligned):
+    """
+    Self and inclusive time of every function on both kernels, ranked by how much of
+    the total change its self time accounts for.
+    """
+    self_time = defaultdict(lambda: [0.0, 0.0])
+    inclusive = defaultdict(lambda: [0.0, 0.0])
+    for stack, values in aligned.items():
+        frames = stack.split(';')
+        for side, value in enumerate(values):
+            self_time[frames[-1]][side] += value
+            # A recursive function is only counted once per stack
+            for frame in set(frames):
+                inclusive[frame][side] += value
+
+    # Against the sum of absolute changes, so shares stay meaningful when gains and losses cancel out
+    moved = sum(abs(after - before) for before, after in self_time.values())
+    rows = []
+    for function in inclusive:
+        self_before, self_after = self_time.get(function, (0.0, 0.0))
+        inclusive_before, inclusive_after = inclusive[function]
+        self_delta = self_after - self_before
+        rows.append({
+            'function': function,
+            'self_before': round(self_before, 3),
+            'self_after': round(self_after, 3),
+            'self_delta': round(self_delta, 3),
+            'inclusive_before': round(inclusive_before, 3),
+            'inclusive_after': round(inclusive_after, 3),
+            'inclusive_delta': round(inclusive_after - inclusive_before, 3),
+            'share_pct': round(self_delta / moved * 100, 1) if moved else 0.0,
+        })
+    rows.sort(key=lambda row: abs(row['self_delta']), reverse=True)
+    return rows
+
+def print_report(rows, before_name, after_name, aligned, top):
+    before_total = sum(before for before, _ in aligned.values())
+    after_total = sum(after for _, after in aligned.values())
+    print(f"Before: {before_name} ({before_total:.2f}μs)")
+    print(f"After:  {after_name} ({after_total:.2f}μs)")
+    change = f" ({(after_total - before_total) / before_total * 100:+.1f}%)" if before_total else ""
+    print(f"Change: {after_total - before_total:+.2f}μs{change}")
+    print(f"\nFunctions ranked by change in self time (μs):")
+    print(f"{'function':<40} {'self before':>12} {'self after':>12} {'delta':>10} {'share':>7} {'incl. delta':>12}")
+    for row in rows[:top]:
+        print(f"{row['function']:<40} {row['self_before']:>12.2f} {row['self_after']:>12.2f} "
+              f"{row['self_delta']:>+10.2f} {row['share_pct']:>6.1f}% {row['inclusive_delta']:>+12.2f}")
+
+def write_report(rows, output, fmt):
+    if fmt == 'csv':
+        writer = csv.DictWriter(output, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        json.dump(rows, output, indent=2)
+        output.write('\n')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Differential flame graph and per-function deltas between two kernels")
+    parser.add_argument('before', help="trace.dat, text report or .folded file of the baseline kernel")
+    parser.add_argument('after', help="trace.dat, text report or .folded file of the kernel to compare")
+    parser.add_argument('-o', '--output', default='diff.folded', help="differential folded stacks (default: diff.folded)")
+    parser.add_argument('-t', '--target', action='append', dest='targets',
+                        help=f"root function to analyze in traces, may be repeated (default: {' '.join(TARGET_FUNCTIONS)})")
+    parser.add_argument('--native', action='store_true', help="decode trace.dat inputs directly")
+    parser.add_argument('--all', action='store_true', dest='all_calls',
+                        help="aggregate every call of the targets in traces instead of the first one")
+    parser.add_argument('--normalize', action='store_true', help="scale the after stacks to the total time of before")
+    parser.add_argument('--svg', help="also render the differential flame graph to this SVG file")
+    parser.add_argument('--top', type=int, default=20, help="functions shown in the text report (default: 20)")
+    parser.add_argument('--format', choices=['text', 'json', 'csv'], default='text')
+    parser.add_argument('--report', help="write the json or csv report to this file instead of stdout")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    targets = args.targets or TARGET_FUNCTIONS
+    try:
+        before = load_stacks(args.before, targets, args.native, not args.all_calls)
+        after = load_stacks(args.after, targets, args.native, not args.all_calls)
+    except TraceDatError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if not before or not after:
+        print(f"Error: no stacks found in {args.before if not before else args.after}", file=sys.stderr)
+        sys.exit(1)
+
+    aligned = align_stacks(before, after, args.normalize)
+    write_diff_folded(aligned, args.output)
+    if args.svg:
+        write_svg({stack: after for stack, (_, after) in aligned.items()}, args.svg,
+                  before={stack: before for stack, (before, _) in aligned.items()},
+                  title=f"{Path(args.before).name} -> {Path(args.after).name}", countname='microseconds')
+    rows = frame_deltas(aligned)
+
+    if args.format == 'text':
+        print_report(rows, args.before, args.after, aligned, args.top)
+        print(f"\nDifferential stacks written to {args.output}")
+        if args.svg:
+            print(f"Differential flame graph written to {args.svg}, red frames grew and blue frames shrank")
+        else:
+            print("Red frames grew and blue frames shrank in:")
+            print(f"python3 {Path(__file__).with_name('flamegraph_svg.py')} {args.output} -o diff.svg")
+    elif args.report:
+        with open(args.report, 'w', newline='') as output:
+            write_report(rows, output, args.format)
+    else:
+        write_report(rows, sys.stdout, args.format)
+
+if __name__ == '__main__':
+    main()
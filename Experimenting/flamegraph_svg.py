@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Render folded stacks as an interactive flame graph, icicle graph or differential
+flame graph SVG, without flamegraph.pl.
+
+    python3 flamegraph_svg.py output.folded -o flamegraph.svg
+    python3 flamegraph_svg.py output.folded -o icicle.svg --icicle
+    python3 flamegraph_svg.py diff.folded -o diff.svg
+
+Input is what write_folded_format writes ("stack value") or what flamegraph_diff writes
+("stack before after"); files with two values per line are drawn as a differential graph,
+sized by the second value and coloured red where it grew and blue where it shrank.
+Identical stack lines are added up first and the distinct stacks are merged into a trie of
+frames in sorted order, so each stack only walks the frames it does not share with the
+previous one. Frames narrower than --minwidth pixels are left out together with their
+children.
+
+In the SVG, click a frame to zoom into it, click the background to reset, and use
+Ctrl-F or the "Search" button to highlight frames matching a regular expression.
+"""
+import argparse
+import gc
+import itertools
+import sys
+import zlib
+from collections import defaultdict
+from html import escape
+
+FRAME_HEIGHT = 16
+FONT_SIZE = 12
+FONT_WIDTH = 0.59     # Average glyph width of the font, relative to its size
+PAD_TOP = 56
+PAD_BOTTOM = 32
+PAD_SIDE = 10
+
+class Frame:
+    """A node of the stack trie, value and before are inclusive of the children"""
+    __slots__ = ('value', 'before', 'children')
+
+    def __init__(self):
+        self.value = 0.0
+        self.before = 0.0
+        self.children = {}
+
+def read_folded(input_file):
+    """
+    Add up the folded stacks of a file or of stdin ('-').
+    Returns ({stack: value}, {stack: before value} or None for a plain folded file).
+    """
+    values = defaultdict(float)
+    before = defaultdict(float)
+    folded = sys.stdin if input_file == '-' else open(input_file, 'r')
+    try:
+        first = next(folded, '')
+        fields = first.split()
+        # Decided on the first line, like flamegraph.pl does
+        differential = len(fields) >= 3 and is_number(fields[-2])
+        for line in itertools.chain([first], folded):
+            if differential:
+                fields = line.rsplit(None, 2)
+                if len(fields) == 3:
+                    before[fields[0]] += float(fields[1])
+                    values[fields[0]] += float(fields[2])
+            else:
+                stack, _, value = line.rstrip().rpartition(' ')
+                if stack:
+                    values[stack] += float(value)
+    finally:
+        if folded is not sys.stdin:
+            folded.close()
+    return dict(values), (dict(before) if differential else None)
+
+def is_number(text):
+    try:
+        float(text)
+    except ValueError:
+        return False
+    return True
+
+def build_trie(values, before=None):
+    """Merge the stacks into a trie of frames. Returns the root, whose value is the total."""
+    root = Frame()
+    # Millions of small nodes would otherwise trigger the cyclic collector over and over
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        fill_trie(root, values, before)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return root
+
+def fill_trie(root, values, before):
+    # Sorted stacks share their prefix with the previous one, so only the new suffix is walked
+    path = [root]
+    previous = []
+    for stack in sorted(set(values) | set(before or ())):
+        frames = stack.split(';')
+        common = 0
+        limit = min(len(frames), len(previous))
+        while common < limit and frames[common] == previous[common]:
+            common += 1
+        del path[common + 1:]
+        node = path[-1]
+        for name in frames[common:]:
+            child = node.children.get(name)
+            if child is None:
+                child = node.children[name] = Frame()
+            path.append(child)
+            node = child
+        # Self values for now, made inclusive below
+        node.value += values.get(stack, 0.0)
+        if before:
+            node.before += before.get(stack, 0.0)
+        previous = frames
+
+    # Children are finished before their parent, so their totals can be added up in one pass
+    order = [root]
+    for node in order:
+        order.extend(node.children.values())
+    for node in reversed(order):
+        for child in node.children.values():
+            node.value += child.value
+            node.before += child.before
+
+def layout(root, width, minwidth):
+    """
+    Position every frame wide enough to draw, children sorted by name like flamegraph.pl.
+    Returns [(depth, x, width, name, frame)] and the maximum depth.
+    """
+    scale = (width - 2 * PAD_SIDE) / root.value if root.value else 0.0
+    boxes = []
+    max_depth = 0
+    # Explicit stack instead of recursion, kernel stacks can be deep
+    pending = [(root, 'all', 0, PAD_SIDE)]
+    while pending:
+        node, name, depth, x = pending.pop()
+        box_width = node.value * scale
+        if box_width < minwidth:
+            continue
+        boxes.append((depth, x, box_width, name, node))
+        max_depth = max(max_depth, depth)
+        child_x = x
+        children = []
+        for child_name in sorted(node.children):
+            child = node.children[child_name]
+            children.append((child, child_name, depth + 1, child_x))
+            child_x += child.value * scale
+        pending.extend(reversed(children))
+    return boxes, max_depth
+
+def flame_color(name):
+    """Warm colour that is stable for a function name across graphs"""
+    hashed = zlib.crc32(name.encode())
+    red = 205 + hashed % 50
+    green = (hashed >> 8) % 230
+    blue = (hashed >> 16) % 55
+    return f"rgb({red},{green},{blue})"
+
+def diff_color(delta, max_delta):
+    """Red for frames that grew, blue for frames that shrank, white for no change"""
+    if not max_delta or not delta:
+        return "rgb(250,250,250)"
+    fade = int(210 * (1 - min(abs(delta) / max_delta, 1.0)))
+    return f"rgb(255,{fade},{fade})" if delta > 0 else f"rgb({fade},{fade},255)"
+
+def frame_label(name, box_width):
+    """Name truncated to what fits in the box"""
+    fits = int((box_width - 6) / (FONT_SIZE * FONT_WIDTH))
+    if fits < 3:
+        return ''
+    return name if len(name) <= fits else name[:fits - 2] + '..'
+
+def render_svg(root, output, title, countname='samples', width=1200, minwidth=0.1,
+               icicle=False, differential=False):
+    """Write the trie as an SVG document to the file object output"""
+    boxes, max_depth = layout(root, width, minwidth)
+    height = PAD_TOP + (max_depth + 1) * FRAME_HEIGHT + PAD_BOTTOM
+    max_delta = max((abs(node.value - node.before) for depth, _, _, _, node in boxes if depth), default=0.0)
+    total = root.value or 1.0
+    script = SCRIPT % {'fontsize': FONT_SIZE, 'fontwidth': FONT_WIDTH, 'pad': PAD_SIDE,
+                       'icicle': 'true' if icicle else 'false'}
+
+    parts = [
+        '<?xml version="1.0" standalone="no"?>\n',
+        f'<svg version="1.1" width="{width}" height="{height}" onload="init(evt)" viewBox="0 0 {width} {height}" '
+        'xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink">\n',
+        f'<style>text {{ font-family: Verdana, sans-serif; font-size: {FONT_SIZE}px; fill: rgb(0,0,0); }} '
+        '#frames > g:hover rect { stroke: black; stroke-width: 0.5; cursor: pointer; } '
+        '.hidden { display: none; }</style>\n',
+        f'<script type="text/ecmascript"><![CDATA[{script}]]></script>\n',
+        f'<rect x="0" y="0" width="{width}" height="{height}" fill="rgb(248,248,240)" id="background"/>\n',
+        f'<text x="{width / 2}" y="24" text-anchor="middle" style="font-size:17px">'
+        f'{escape(title, quote=False)}</text>\n',
+        f'<text x="{PAD_SIDE}" y="{height - 10}" id="details"> </text>\n',
+        f'<text x="{PAD_SIDE}" y="24" id="unzoom" class="hidden" style="cursor:pointer">Reset Zoom</text>\n',
+        f'<text x="{width - PAD_SIDE}" y="24" text-anchor="end" id="search" style="cursor:pointer">Search</text>\n',
+        f'<text x="{width - PAD_SIDE}" y="{height - 10}" text-anchor="end" id="matched"> </text>\n',
+        '<g id="frames">\n',
+    ]
+    for depth, x, box_width, name, node in boxes:
+        if icicle:
+            y = PAD_TOP + depth * FRAME_HEIGHT
+        else:
+            y = height - PAD_BOTTOM - (depth + 1) * FRAME_HEIGHT
+        info = f"{name} ({node.value:,.2f} {countname}, {node.value / total * 100:.2f}%"
+        if differential:
+            delta = node.value - node.before
+            info += f", {delta:+,.2f} {countname} vs before"
+            color = diff_color(delta, max_delta) if depth else "rgb(250,250,250)"
+        else:
+            color = flame_color(name) if depth else "rgb(220,220,220)"
+        info += ")"
+        parts.append(
+            f'<g><title>{escape(info, quote=False)}</title>'
+            f'<rect x="{x:.2f}" y="{y}" width="{box_width:.2f}" height="{FRAME_HEIGHT - 1}" fill="{color}" rx="2"/>'
+            f'<text x="{x + 3:.2f}" y="{y + FRAME_HEIGHT - 4}" data-name="{escape(name)}">'
+            f'{escape(frame_label(name, box_width), quote=False)}</text></g>\n')
+    parts.append('</g>\n</svg>\n')
+    output.writelines(parts)
+
+# Zoom and search, kept small on purpose: frames are plain <g><title/><rect/><text/></g>
+SCRIPT = r"""
+var icicle = %(icicle)s;
+var details, searchbtn, unzoombtn, matchedtxt, svg, frames, searching = null;
+function init(evt) {
+    svg = document.documentElement;
+    details = document.getElementById("details").firstChild;
+    searchbtn = document.getElementById("search");
+    unzoombtn = document.getElementById("unzoom");
+    matchedtxt = document.getElementById("matched");
+    frames = document.getElementById("frames").children;
+    for (var i = 0; i < frames.length; i++) {
+        var r = frames[i].querySelector("rect");
+        r.setAttribute("data-x", r.getAttribute("x"));
+        r.setAttribute("data-width", r.getAttribute("width"));
+    }
+    document.getElementById("frames").addEventListener("click", function(e) {
+        var g = e.target.closest("g"); if (g && g.parentNode.id == "frames") zoom(g);
+    });
+    document.getElementById("frames").addEventListener("mouseover", function(e) {
+        var g = e.target.closest("g");
+        if (g && g.querySelector("title")) details.nodeValue = g.querySelector("title").textContent;
+    });
+    document.getElementById("background").addEventListener("click", unzoom);
+    unzoombtn.addEventListener("click", unzoom);
+    searchbtn.addEventListener("click", search_prompt);
+    window.addEventListener("keydown", function(e) {
+        if (e.keyCode === 114 || (e.ctrlKey && e.keyCode === 70)) { e.preventDefault(); search_prompt(); }
+    });
+}
+function place(g, x, w) {
+    var r = g.querySelector("rect"), t = g.querySelector("text"), name = t.getAttribute("data-name");
+    r.setAttribute("x", x); r.setAttribute("width", w);
+    t.setAttribute("x", x + 3);
+    var fits = Math.floor((w - 6) / (%(fontsize)s * %(fontwidth)s));
+    t.textContent = fits < 3 ? "" : (name.length <= fits ? name : name.substring(0, fits - 2) + "..");
+}
+function zoom(target) {
+    var tr = target.querySelector("rect");
+    var x0 = parseFloat(tr.getAttribute("data-x")), w0 = parseFloat(tr.getAttribute("data-width"));
+    var y0 = parseFloat(tr.getAttribute("y")), full = svg.width.baseVal.value - 2 * %(pad)s;
+    var ratio = full / w0;
+    for (var i = 0; i < frames.length; i++) {
+        var r = frames[i].querySelector("rect");
+        var x = parseFloat(r.getAttribute("data-x")), w = parseFloat(r.getAttribute("data-width"));
+        var y = parseFloat(r.getAttribute("y"));
+        var below = icicle ? y < y0 : y > y0;
+        if (x >= x0 - 0.0001 && x + w <= x0 + w0 + 0.0001 && !below) {
+            frames[i].classList.remove("hidden");
+            place(frames[i], (x - x0) * ratio + %(pad)s, w * ratio);
+        } else if (below && x <= x0 + 0.0001 && x + w >= x0 + w0 - 0.0001) {
+            frames[i].classList.remove("hidden");
+            place(frames[i], %(pad)s, full);
+        } else {
+            frames[i].classList.add("hidden");
+        }
+    }
+    unzoombtn.classList.remove("hidden");
+}
+function unzoom() {
+    for (var i = 0; i < frames.length; i++) {
+        var r = frames[i].querySelector("rect");
+        frames[i].classList.remove("hidden");
+        place(frames[i], parseFloat(r.getAttribute("data-x")), parseFloat(r.getAttribute("data-width")));
+    }
+    unzoombtn.classList.add("hidden");
+}
+function search_prompt() {
+    if (searching) { search(null); return; }
+    var term = prompt("Search for (regular expression):", "");
+    if (term) search(term);
+}
+function search(term) {
+    var re = term ? new RegExp(term) : null, matched = 0, total = 0;
+    for (var i = 0; i < frames.length; i++) {
+        var r = frames[i].querySelector("rect"), name = frames[i].querySelector("text").getAttribute("data-name");
+        if (!r.hasAttribute("data-fill")) r.setAttribute("data-fill", r.getAttribute("fill"));
+        var w = parseFloat(r.getAttribute("data-width"));
+        if (i == 0) total = w;
+        if (re && re.test(name)) { r.setAttribute("fill", "rgb(230,0,230)"); matched += w; }
+        else r.setAttribute("fill", r.getAttribute("data-fill"));
+    }
+    searching = re;
+    searchbtn.textContent = re ? "Reset Search" : "Search";
+    matchedtxt.textContent = re ? "Matched: " + (100 * matched / total).toFixed(1) + "%%" : " ";
+}
+"""
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Render folded stacks as an interactive flame graph SVG")
+    parser.add_argument('input_file', nargs='?', default='output.folded',
+                        help="folded stacks, \"stack before after\" lines for a differential graph, "
+                             "or - for stdin (default: output.folded)")
+    parser.add_argument('-o', '--output', default='flamegraph.svg', help="SVG file (default: flamegraph.svg)")
+    parser.add_argument('--icicle', action='store_true', help="draw the roots at the top")
+    parser.add_argument('--title', help="title of the graph")
+    parser.add_argument('--countname', default='microseconds', help="unit of the values (default: microseconds)")
+    parser.add_argument('--width', type=int, default=1200, help="image width in pixels (default: 1200)")
+    parser.add_argument('--minwidth', type=float, default=0.1, help="omit frames narrower than this many pixels")
+    return parser.parse_args()
+
+def write_svg(values, output_file, before=None, **options):
+    """Render {stack: value} (and {stack: before value} for a differential graph) to output_file"""
+    root = build_trie(values, before)
+    with open(output_file, 'w') as output:
+        render_svg(root, output, differential=before is not None, **options)
+
+def main():
+    args = parse_args()
+    values, before = read_folded(args.input_file)
+    if not values:
+        print(f"Error: no stacks found in {args.input_file}", file=sys.stderr)
+        sys.exit(1)
+    kind = 'Differential flame graph' if before is not None else ('Icicle graph' if args.icicle else 'Flame graph')
+    title = args.title or kind
+    write_svg(values, args.output, before, title=title, countname=args.countname, width=args.width,
+              minwidth=args.minwidth, icicle=args.icicle)
+    print(f"{kind} of {len(values):,} stacks written to {args.output}")
+
+if __name__ == '__main__':
+    main()
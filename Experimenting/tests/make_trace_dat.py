@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Write the trace.dat fixture and the `trace-cmd report` text of the same trace.
+
+trace-cmd is not needed: the file is laid out the way `trace-cmd record -p function_graph`
+writes a version 6, little-endian flyrecord file, from the call trees below, and the report
+is printed from the same calls in trace-cmd's function_graph layout. Rerun it after
+changing the calls; the test only reads the files it writes.
+
+    python3 make_trace_dat.py [output directory, default: data]
+"""
+import struct
+import sys
+from pathlib import Path
+
+BASE_TIMESTAMP = 1000 * 10**9
+
+def at(offset):
+    return BASE_TIMESTAMP + offset
+
+# (pid, call trees) per CPU; a call is (function, start ns, duration ns, children).
+# Leaves stay under 10 us, which trace-cmd would print as "+ N us" on the entry line.
+CALLS = [
+    (1234, [
+        ('filemap_fault', at(0), 800, []),
+        ('do_mmap', at(2000), 9500, [
+            ('get_unmapped_area', at(2500), 1200, []),
+            ('mmap_region', at(4000), 6000, [
+                ('vma_merge', at(4500), 700, []),
+                ('vm_area_alloc', at(5500), 50, []),
+                ('vma_link', at(6000), 2500, [
+                    ('__vma_link_rb', at(6500), 900, []),
+                ]),
+            ]),
+        ]),
+        ('do_mmap', at(20000), 14250, [
+            ('mmap_region', at(21000), 12000, [
+                ('vma_merge', at(22000), 3000, []),
+            ]),
+        ]),
+        ('do_mas_munmap', at(40000), 30000, [
+            ('unmap_region', at(41000), 25000, [
+                ('tlb_finish_mmu', at(42000), 6000, [
+                    ('flush_tlb_mm_range', at(43000), 2000, [
+                        ('native_flush_tlb_multi', at(43500), 1000, [
+                            ('smp_call_function_many_cond', at(43700), 500, []),
+                        ]),
+                    ]),
+                ]),
+            ]),
+        ]),
+    ]),
+    (1240, [
+        ('__do_munmap', at(3000), 8000, [
+            ('unmap_region', at(4000), 6000, [
+                ('free_pgtables', at(5000), 2000, []),
+            ]),
+        ]),
+        # Half a second later, more than a 27-bit delta, so the page needs a time extend
+        ('__do_munmap', at(500_000_000), 4000, [
+            ('unmap_region', at(500_001_000), 2000, []),
+        ]),
+    ]),
+]
+
+SYMBOLS = [(0xffffffff81000000 + index * 0x100, name) for index, name in enumerate(sorted({
+    'filemap_fault', 'do_mmap', 'get_unmapped_area', 'mmap_region', 'vma_merge', 'vm_area_alloc', 'vma_link',
+    '__vma_link_rb', 'do_mas_munmap', '__do_munmap', 'unmap_region', 'tlb_finish_mmu', 'flush_tlb_mm_range',
+    'native_flush_tlb_multi', 'smp_call_function_many_cond', 'free_pgtables'}))]
+
+PAGE_SIZE = 4096
+PAGE_HEADER_SIZE = 16
+TYPE_TIME_EXTEND = 30
+TS_SHIFT = 27
+ENTRY_ID = 11
+EXIT_ID = 10
+
+COMMON_FIELDS = (
+    "\tfield:unsigned short common_type;\toffset:0;\tsize:2;\tsigned:0;\n"
+    "\tfield:unsigned char common_flags;\toffset:2;\tsize:1;\tsigned:0;\n"
+    "\tfield:unsigned char common_preempt_count;\toffset:3;\tsize:1;\tsigned:0;\n"
+    "\tfield:int common_pid;\toffset:4;\tsize:4;\tsigned:1;\n\n"
+)
+HEADER_PAGE = (
+    "\tfield: u64 timestamp;\toffset:0;\tsize:8;\tsigned:0;\n"
+    "\tfield: local_t commit;\toffset:8;\tsize:8;\tsigned:1;\n"
+    "\tfield: int overwrite;\toffset:8;\tsize:1;\tsigned:1;\n"
+    f"\tfield: char data;\toffset:{PAGE_HEADER_SIZE};\tsize:{PAGE_SIZE - PAGE_HEADER_SIZE};\tsigned:1;\n"
+)
+HEADER_EVENT = (
+    "# compressed entry header\n"
+    "\ttype_len    :    5 bits\n"
+    "\ttime_delta  :   27 bits\n"
+    "\tarray       :   32 bits\n\n"
+    "\tpadding     : type == 29\n"
+    "\ttime_extend : type == 30\n"
+    "\ttime_stamp : type == 31\n"
+    "\tdata max type_len  == 28\n"
+)
+ENTRY_FORMAT = (
+    f"name: funcgraph_entry\nID: {ENTRY_ID}\nformat:\n" + COMMON_FIELDS +
+    "\tfield:unsigned long func;\toffset:8;\tsize:8;\tsigned:0;\n"
+    "\tfield:int depth;\toffset:16;\tsize:4;\tsigned:1;\n\n"
+    "print fmt: \"--> %ps (%d)\", REC->func, REC->depth\n"
+)
+EXIT_FORMAT = (
+    f"name: funcgraph_exit\nID: {EXIT_ID}\nformat:\n" + COMMON_FIELDS +
+    "\tfield:unsigned long func;\toffset:8;\tsize:8;\tsigned:0;\n"
+    "\tfield:int depth;\toffset:16;\tsize:4;\tsigned:1;\n"
+    "\tfield:unsigned int overrun;\toffset:20;\tsize:4;\tsigned:0;\n"
+    "\tfield:unsigned long long calltime;\toffset:24;\tsize:8;\tsigned:0;\n"
+    "\tfield:unsigned long long rettime;\toffset:32;\tsize:8;\tsigned:0;\n\n"
+    "print fmt: \"<-- %ps (%d) (start: %llx  end: %llx) over: %d\", REC->func, REC->depth, "
+    "REC->calltime, REC->rettime, REC->depth\n"
+)
+
+def flatten(cpu, pid, call, depth=0):
+    """
+    Events of one call tree in the order the CPU records them:
+    (cpu, pid, timestamp, event id, function, depth, calltime, rettime, leaf).
+    Entries carry the times of their call too, for the report; only exits record them.
+    """
+    name, start, duration, children = call
+    end = start + duration
+    events = [(cpu, pid, start, ENTRY_ID, name, depth, start, end, not children)]
+    for child in children:
+        events.extend(flatten(cpu, pid, child, depth + 1))
+    events.append((cpu, pid, end, EXIT_ID, name, depth, start, end, not children))
+    return events
+
+def encode_event(event, delta, addresses):
+    """Ring-buffer record of one event, preceded by a time extend when delta needs more than 27 bits"""
+    _, pid, _, event_id, name, depth, calltime, rettime, _ = event
+    record = b''
+    if delta >= 1 << TS_SHIFT:
+        record = struct.pack('<II', TYPE_TIME_EXTEND | (delta & ((1 << TS_SHIFT) - 1)) << 5, delta >> TS_SHIFT)
+        delta = 0
+    if event_id == ENTRY_ID:
+        payload = struct.pack('<HBBiQi4x', ENTRY_ID, 0, 0, pid, addresses[name], depth)
+    else:
+        payload = struct.pack('<HBBiQiIQQ', EXIT_ID, 0, 0, pid, addresses[name], depth, 0, calltime, rettime)
+    return record + struct.pack('<I', len(payload) // 4 | delta << 5) + payload
+
+def encode_pages(events, addresses, page_size=PAGE_SIZE):
+    """The ring-buffer pages of one CPU, each starting at the timestamp of its first event"""
+    pages = []
+    data, page_timestamp, previous = bytearray(), None, None
+    for event in events:
+        timestamp = event[2]
+        record = encode_event(event, timestamp - previous, addresses) if data else b''
+        if not data or PAGE_HEADER_SIZE + len(data) + len(record) > page_size:
+            if data:
+                pages.append(struct.pack('<QQ', page_timestamp, len(data)) + data)
+            page_timestamp = timestamp
+            data = bytearray()
+            record = encode_event(event, 0, addresses)
+        data += record
+        previous = timestamp
+    if data:
+        pages.append(struct.pack('<QQ', page_timestamp, len(data)) + data)
+    return b''.join(page + b'\0' * (page_size - len(page)) for page in pages)
+
+def section(data, size_bytes):
+    return len(data).to_bytes(size_bytes, 'little') + data
+
+def write_trace_dat(path, cpu_pages, header_page, header_event, ftrace_formats, kallsyms='', cmdlines='',
+                    page_size=PAGE_SIZE, systems=()):
+    """
+    A little-endian version 6 flyrecord trace.dat: the header texts as tracefs prints them,
+    ftrace_formats and (system, [formats]) pairs, and the raw ring-buffer pages of every CPU
+    """
+    header = bytearray(b'\x17\x08\x44tracing' + b'6\0' + bytes([0, 8]) + struct.pack('<I', page_size))
+    header += b'header_page\0' + section(header_page.encode(), 8)
+    header += b'header_event\0' + section(header_event.encode(), 8)
+    header += struct.pack('<I', len(ftrace_formats))
+    header += b''.join(section(event_format.encode(), 8) for event_format in ftrace_formats)
+    header += struct.pack('<I', len(systems))
+    for system, formats in systems:
+        header += system.encode() + b'\0' + struct.pack('<I', len(formats))
+        header += b''.join(section(event_format.encode(), 8) for event_format in formats)
+    header += section(kallsyms.encode(), 4)
+    header += section(b'', 4)  # printk formats
+    header += section(cmdlines.encode(), 8)
+    header += struct.pack('<I', len(cpu_pages))
+    header += b'options  \0' + struct.pack('<H', 0)
+    header += b'flyrecord\0'
+
+    # Pages start page-aligned after the per-CPU (offset, size) table
+    offset = -(-(len(header) + 16 * len(cpu_pages)) // page_size) * page_size
+    for pages in cpu_pages:
+        header += struct.pack('<QQ', offset, len(pages))
+        offset += len(pages)
+    header += b'\0' * (-len(header) % page_size)
+    path.write_bytes(bytes(header) + b''.join(cpu_pages))
+
+def write_funcgraph_trace_dat(path, events_by_cpu):
+    addresses = {name: address for address, name in SYMBOLS}
+    pids = sorted({event[1] for events in events_by_cpu for event in events})
+    write_trace_dat(path, [encode_pages(events, addresses) for events in events_by_cpu],
+                    HEADER_PAGE, HEADER_EVENT, [ENTRY_FORMAT, EXIT_FORMAT],
+                    kallsyms=''.join(f"{address:016x} T {name}\n" for address, name in SYMBOLS),
+                    cmdlines=''.join(f"{pid} fixture\n" for pid in pids))
+
+def format_duration(nanoseconds):
+    """trace-cmd's duration column, with its + marker for calls over 10 us"""
+    microseconds = nanoseconds / 1000
+    marker = '+ ' if microseconds > 10 else '  '
+    return f"{marker}{microseconds:.3f} us"
+
+def write_report(path, events_by_cpu):
+    lines = [f"cpus={len(events_by_cpu)}"]
+    events = sorted((event for cpu_events in events_by_cpu for event in cpu_events), key=lambda event: event[2])
+    for cpu, pid, timestamp, event_id, name, depth, calltime, rettime, leaf in events:
+        prefix = f"{'fixture-' + str(pid):>20} [{cpu:03d}] {timestamp / 1e9:.6f}: "
+        indent = '  ' * (depth + 1)
+        if event_id == ENTRY_ID and leaf:
+            lines.append(f"{prefix}funcgraph_entry:      {format_duration(rettime - calltime)}   |{indent}{name}();")
+        elif event_id == ENTRY_ID:
+            lines.append(f"{prefix}funcgraph_entry:                   |{indent}{name}() {{")
+        elif not leaf:
+            lines.append(f"{prefix}funcgraph_exit:       {format_duration(rettime - calltime)}   |{indent}}}")
+    path.write_text('\n'.join(lines) + '\n')
+
+def main():
+    output = Path(sys.argv[1] if len(sys.argv) > 1 else Path(__file__).with_name('data'))
+    output.mkdir(parents=True, exist_ok=True)
+    events_by_cpu = []
+    for cpu, (pid, calls) in enumerate(CALLS):
+        events = []
+        for call in calls:
+            events.extend(flatten(cpu, pid, call))
+        events_by_cpu.append(events)
+    write_funcgraph_trace_dat(output / 'trace.dat', events_by_cpu)
+    write_report(output / 'trace.report', events_by_cpu)
+    print(f"Wrote {output / 'trace.dat'} and {output / 'trace.report'}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Record the kernel.dat fixture from the running kernel's ring buffer, with the kernel's own
+text rendering of the same buffer (the tracefs `trace` file) next to it as kernel.trace.
+
+Unlike trace.dat, nothing here is encoded by hand: the pages are read back as the kernel
+wrote them from per_cpu/cpuN/trace_pipe_raw, and header_page, header_event and the event
+formats are copied from tracefs. Only the trace.dat container around them is written by
+make_trace_dat.write_trace_dat, the way trace-cmd lays it out. The events all come from
+this process, so the fixture does not depend on what else runs on the machine:
+trace_marker writes (long ones are long events, half-second pauses need time extends),
+getpid system calls and the fork and exit of one child.
+
+    sudo python3 record_tracefs.py [output directory, default: data]
+"""
+import os
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from make_trace_dat import write_trace_dat
+
+TRACEFS = Path('/sys/kernel/tracing')
+FTRACE_EVENTS = ['print', 'funcgraph_entry', 'funcgraph_exit']
+EVENTS = [('syscalls', 'sys_enter_getpid'), ('syscalls', 'sys_exit_getpid'),
+          ('sched', 'sched_process_fork'), ('sched', 'sched_process_exit')]
+BUFFER_SIZE_KB = 64
+MARKERS = 160
+# task-pid [cpu] at the start of every event line of the trace file
+TASK_PATTERN = re.compile(r'^\s*.*-(\d+)\s+\[\d+\]', re.MULTILINE)
+
+def tracefs(name, value=None, append=False):
+    if value is None:
+        return (TRACEFS / name).read_text()
+    # tracefs files do not seek, so no 'a' mode
+    fd = os.open(TRACEFS / name, os.O_WRONLY | (os.O_APPEND if append else os.O_TRUNC))
+    try:
+        os.write(fd, value.encode())
+    finally:
+        os.close(fd)
+
+def read_raw_pages(cpu, page_size):
+    """The ring-buffer pages of cpu, consumed from trace_pipe_raw"""
+    fd = os.open(TRACEFS / 'per_cpu' / f'cpu{cpu}' / 'trace_pipe_raw', os.O_RDONLY | os.O_NONBLOCK)
+    pages = []
+    try:
+        while True:
+            try:
+                page = os.read(fd, page_size)
+            except BlockingIOError:
+                break
+            if not page:
+                break
+            pages.append(page + b'\0' * (page_size - len(page)))
+    finally:
+        os.close(fd)
+    return b''.join(pages)
+
+def generate_events():
+    for index in range(MARKERS):
+        if index % 40 == 39:
+            time.sleep(0.5)
+        os.getpid()
+        # 8 to 200 characters, so some markers need more than the 112 bytes of a short event
+        tracefs('trace_marker', f"marker {index} " + 'x' * (index * 37 % 193))
+    subprocess.run(['true'], check=True)
+
+def record(output):
+    if not (TRACEFS / 'trace_marker').exists():
+        sys.exit(f"{TRACEFS} is not mounted, mount it with: mount -t tracefs nodev {TRACEFS}")
+    saved = {name: tracefs(name) for name in ['tracing_on', 'buffer_size_kb', 'set_event', 'set_event_pid']}
+    saved_options = {option: tracefs(f'options/{option}') for option in ['event-fork', 'overwrite']}
+    try:
+        tracefs('tracing_on', '0')
+        tracefs('set_event', '')
+        tracefs('buffer_size_kb', str(BUFFER_SIZE_KB))
+        tracefs('options/overwrite', '0')
+        tracefs('options/event-fork', '1')
+        tracefs('set_event_pid', str(os.getpid()))
+        for system, event in EVENTS:
+            tracefs(f'events/{system}/{event}/enable', '1')
+        tracefs('trace', '')
+        tracefs('tracing_on', '1')
+        generate_events()
+        tracefs('tracing_on', '0')
+
+        text = tracefs('trace')
+        page_size = os.sysconf('SC_PAGE_SIZE')
+        cpus = sorted(int(path.name[3:]) for path in (TRACEFS / 'per_cpu').glob('cpu*'))
+        cpu_pages = [read_raw_pages(cpu, page_size) for cpu in cpus]
+    finally:
+        tracefs('set_event', '')
+        for event in saved['set_event'].split():
+            tracefs('set_event', event, append=True)
+        for name in ['set_event_pid', 'buffer_size_kb', 'tracing_on']:
+            tracefs(name, saved[name].strip() or '\n')
+        for option, value in saved_options.items():
+            tracefs(f'options/{option}', value.strip())
+
+    ftrace_formats = [tracefs(f'events/ftrace/{event}/format') for event in FTRACE_EVENTS]
+    systems = {}
+    for system, event in EVENTS:
+        systems.setdefault(system, []).append(tracefs(f'events/{system}/{event}/format'))
+    pids = {int(pid) for pid in TASK_PATTERN.findall(text)}
+    cmdlines = ''.join(f"{pid} {comm}\n" for pid, comm in
+                       (line.split(' ', 1) for line in tracefs('saved_cmdlines').splitlines()) if int(pid) in pids)
+    write_trace_dat(output / 'kernel.dat', cpu_pages, tracefs('events/header_page'),
+                    tracefs('events/header_event'), ftrace_formats, cmdlines=cmdlines,
+                    page_size=page_size, systems=list(systems.items()))
+    (output / 'kernel.trace').write_text(text)
+
+def main():
+    output = Path(sys.argv[1] if len(sys.argv) > 1 else Path(__file__).with_name('data'))
+    output.mkdir(parents=True, exist_ok=True)
+    record(output)
+    print(f"Wrote {output / 'kernel.dat'} and {output / 'kernel.trace'}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""
+Decode trace.dat files natively and check them against a text rendering of the same trace:
+- trace.dat and trace.report, a function_graph trace and its `trace-cmd report` text, both
+  written by make_trace_dat.py
+- kernel.dat and kernel.trace, ring-buffer pages recorded from a running kernel and the
+  kernel's own text of the same buffer, written by record_tracefs.py
+- any trace_output directory of tracer.sh copied into data/, its trace.dat against the
+  ftrace_output.txt trace-cmd printed from it
+
+    python3 -m unittest discover Experimenting/tests
+"""
+import re
+import sys
+import tempfile
+import unittest
+from collections import Counter
+from pathlib import Path
+
+import make_trace_dat
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from tracedat_reader import ENTRY, TraceDat, iter_funcgraph_events
+from tracecmd_to_flamegraph import (aggregate_native, aggregate_tracecmd, iter_report_events, parse_tracecmd,
+                                    self_times)
+
+DATA = Path(__file__).resolve().with_name('data')
+TRACE_DAT = str(DATA / 'trace.dat')
+TRACE_REPORT = str(DATA / 'trace.report')
+KERNEL_DAT = str(DATA / 'kernel.dat')
+KERNEL_TRACE = DATA / 'kernel.trace'
+
+# task-pid [cpu] flags timestamp: text, an event line of the tracefs trace file
+KERNEL_LINE = re.compile(r'^\s*.*-(?P<pid>\d+)\s+\[(?P<cpu>\d+)\]\s+\S+\s+(?P<timestamp>\d+\.\d{6}): (?P<text>.*)$')
+
+def rounded(stacks):
+    return {stack: round(duration, 3) for stack, duration in stacks.items()}
+
+def folded(stacks):
+    return {stack: duration for target in stacks for stack, duration in self_times(stacks[target]).items()}
+
+def aggregates_match(test, native, report):
+    native_stacks, native_paths, native_latencies, native_invocations = native
+    report_stacks, report_paths, report_latencies, report_invocations = report
+    test.assertEqual(rounded(folded(native_stacks)), rounded(folded(report_stacks)))
+    test.assertEqual(rounded(native_paths), rounded(report_paths))
+    test.assertEqual({name: sorted(durations) for name, durations in native_latencies.items()},
+                     {name: sorted(durations) for name, durations in report_latencies.items()})
+    test.assertEqual({target: sorted(call[0] for call in calls) for target, calls in native_invocations.items()},
+                     {target: sorted(call[0] for call in calls) for target, calls in report_invocations.items()})
+
+def c_string(data):
+    return bytes(data).split(b'\0', 1)[0].decode()
+
+def kernel_text(trace, event, pos):
+    """The text the kernel prints for the events kernel.dat records"""
+    fields = event.fields
+    def value(name):
+        field = fields[name]
+        return int.from_bytes(trace.data[pos + field.offset:pos + field.offset + field.size], trace.byteorder,
+                              signed=field.signed)
+    def data_loc(name):
+        loc = value(name)
+        return c_string(trace.data[pos + (loc & 0xffff):pos + (loc & 0xffff) + (loc >> 16)])
+    if event.name == 'print':
+        return 'tracing_mark_write: ' + c_string(trace.data[pos + fields['buf'].offset:]).rstrip('\n')
+    if event.name == 'sys_enter_getpid':
+        return 'sys_getpid()'
+    if event.name == 'sys_exit_getpid':
+        return f"sys_getpid -> {value('ret'):#x}"
+    if event.name == 'sched_process_fork':
+        return (f"sched_process_fork: comm={data_loc('parent_comm')} pid={value('parent_pid')} "
+                f"child_comm={data_loc('child_comm')} child_pid={value('child_pid')}")
+    if event.name == 'sched_process_exit':
+        comm = c_string(trace.data[pos + fields['comm'].offset:pos + fields['comm'].offset + fields['comm'].size])
+        return (f"sched_process_exit: comm={comm} pid={value('pid')} prio={value('prio')} "
+                f"group_dead={'true' if value('group_dead') else 'false'}")
+    raise AssertionError(f"kernel.dat has an unexpected {event.name} event")
+
+def repeated_calls(repetitions, interval):
+    """make_trace_dat.CALLS repeated every interval ns, long enough for several pages per CPU"""
+    def shifted(call, offset):
+        name, start, duration, children = call
+        return name, start + offset, duration, [shifted(child, offset) for child in children]
+    return [(pid, [shifted(call, repetition * interval) for repetition in range(repetitions) for call in calls])
+            for pid, calls in make_trace_dat.CALLS]
+
+class TraceDatFixtureTest(unittest.TestCase):
+    def test_headers(self):
+        with TraceDat(TRACE_DAT) as trace:
+            self.assertEqual(trace.cpus, 2)
+            self.assertEqual(trace.page_size, 4096)
+            self.assertEqual(trace.cmdlines, {1234: 'fixture', 1240: 'fixture'})
+            self.assertEqual(sum(len(columns['kind']) for _, columns in trace.funcgraph_batches()), 44)
+
+    def test_calls_match_report(self):
+        native = Counter(name for _, _, kind, name, _ in iter_funcgraph_events(TRACE_DAT) if kind == ENTRY)
+        report = Counter(name for _, _, kind, name, _ in iter_report_events(TRACE_REPORT) if kind == ENTRY)
+        self.assertEqual(native, report)
+
+    def test_time_extend(self):
+        starts = [timestamp for cpu, timestamp, kind, name, _ in iter_funcgraph_events(TRACE_DAT)
+                  if kind == ENTRY and name == '__do_munmap']
+        self.assertEqual([round(start, 6) for start in starts], [1000.000003, 1000.5])
+
+    def test_first_call_stacks_match_report(self):
+        native = parse_tracecmd(TRACE_DAT, native=True)
+        report = parse_tracecmd(TRACE_REPORT)
+        self.assertEqual({target: rounded(stacks) for target, stacks in native.items()},
+                         {target: rounded(stacks) for target, stacks in report.items()})
+        # vm_area_alloc is under MIN_DURATION_US, so its time stays with mmap_region
+        self.assertEqual(rounded(self_times(native['do_mmap'])), {
+            'do_mmap': 2.3,
+            'do_mmap;get_unmapped_area': 1.2,
+            'do_mmap;mmap_region': 2.8,
+            'do_mmap;mmap_region;vma_merge': 0.7,
+            'do_mmap;mmap_region;vma_link': 1.6,
+            'do_mmap;mmap_region;vma_link;__vma_link_rb': 0.9,
+        })
+
+    def test_folded_stacks_match_report(self):
+        native = aggregate_tracecmd(TRACE_DAT, native=True)
+        aggregates_match(self, native, aggregate_tracecmd(TRACE_REPORT))
+        # Deeper than MAX_STACK_DEPTH: a path, but not a folded stack
+        self.assertIn('do_mas_munmap;unmap_region;tlb_finish_mmu;flush_tlb_mm_range;native_flush_tlb_multi;'
+                      'smp_call_function_many_cond', native[1])
+        self.assertEqual(folded(native[0])['__do_munmap;unmap_region'], 6.0)
+
+    def test_batches_match_report(self):
+        # Calls left open at the end of a batch are finished in the next one, whatever the batch size
+        with tempfile.TemporaryDirectory() as directory:
+            events_by_cpu = [[event for call in calls for event in make_trace_dat.flatten(cpu, pid, call)]
+                             for cpu, (pid, calls) in enumerate(repeated_calls(60, 600_000_000))]
+            trace_dat, report = Path(directory) / 'trace.dat', Path(directory) / 'trace.report'
+            make_trace_dat.write_funcgraph_trace_dat(trace_dat, events_by_cpu)
+            make_trace_dat.write_report(report, events_by_cpu)
+            with TraceDat(str(trace_dat)) as trace:
+                self.assertGreater(trace.cpu_buffers[0][1] // trace.page_size, 10)
+            expected = aggregate_tracecmd(str(report))
+            for pages_per_batch in (1, 3, 1024):
+                with self.subTest(pages_per_batch=pages_per_batch):
+                    aggregates_match(self, aggregate_native(str(trace_dat), pages_per_batch=pages_per_batch), expected)
+
+class KernelTraceTest(unittest.TestCase):
+    """Pages recorded from a running kernel, against the kernel's own text of the same buffer"""
+    def kernel_lines(self):
+        matches = (KERNEL_LINE.match(line) for line in KERNEL_TRACE.read_text().splitlines())
+        return [(int(match['cpu']), match['timestamp'], int(match['pid']), match['text']) for match in matches if match]
+
+    def test_events_match_kernel_text(self):
+        decoded = []
+        with TraceDat(KERNEL_DAT) as trace:
+            pid_field = trace.formats[next(iter(trace.formats))].fields['common_pid']
+            for cpu in range(trace.cpus):
+                for timestamp, event_id, pos in trace.iter_cpu_events(cpu):
+                    # The kernel prints timestamps rounded to the microsecond
+                    microseconds = (timestamp + 500) // 1000
+                    pid = int.from_bytes(trace.data[pos + pid_field.offset:pos + pid_field.offset + pid_field.size],
+                                         trace.byteorder, signed=True)
+                    decoded.append((cpu, f"{microseconds // 10**6}.{microseconds % 10**6:06d}", pid,
+                                    kernel_text(trace, trace.formats[event_id], pos)))
+        kernel = self.kernel_lines()
+        self.assertGreater(len(kernel), 400)
+        self.assertEqual(decoded, kernel)
+
+    def test_batches_match_page_walk(self):
+        import numpy as np
+        with TraceDat(KERNEL_DAT) as trace:
+            buffers = trace.page_buffers()
+            for cpu, (start, size) in enumerate(trace.cpu_buffers):
+                pages = np.arange(start, start + size, trace.page_size)
+                self.assertGreater(len(pages), 5)
+                expected = [(timestamp, pos) for timestamp, _, pos in trace.iter_cpu_events(cpu)]
+                for pages_per_batch in (1, 3, len(pages)):
+                    with self.subTest(cpu=cpu, pages_per_batch=pages_per_batch):
+                        walked = []
+                        for first in range(0, len(pages), pages_per_batch):
+                            _, timestamps, data_pos = trace.walk_pages(buffers, pages[first:first + pages_per_batch])
+                            walked.extend(zip(timestamps.tolist(), data_pos.tolist()))
+                        self.assertEqual(walked, expected)
+
+    def test_cmdlines(self):
+        with TraceDat(KERNEL_DAT) as trace:
+            self.assertEqual(set(trace.cmdlines), {pid for _, _, pid, _ in self.kernel_lines()})
+
+class TracerCaptureTest(unittest.TestCase):
+    """trace_output directories of tracer.sh copied into data/, if any"""
+    def test_captures_match_report(self):
+        captures = sorted(path.parent for path in DATA.glob('*/trace.dat')
+                          if (path.parent / 'ftrace_output.txt').exists())
+        if not captures:
+            self.skipTest("no tracer.sh trace_output directory in tests/data")
+        for capture in captures:
+            with self.subTest(capture=capture.name):
+                aggregates_match(self, aggregate_tracecmd(str(capture / 'trace.dat'), native=True),
+                                 aggregate_tracecmd(str(capture / 'ftrace_output.txt')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,12 +3,32 @@
 import sys
 import subprocess
 import re
-from collections import defaultdict
+import argparse
+import json
+import math
+from array import array
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from flamegraph_svg import write_svg
+from tracedat_reader import ENTRY, EXIT, PAGES_PER_BATCH, TraceDat, TraceDatError, iter_funcgraph_events
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'Common'))
+from strace_latency import percentile
+from trace_io import open_trace
 
 # Configuration
 MIN_DURATION_US = 0.1    # Minimum duration in microseconds to include a function
 MAX_STACK_DEPTH = 5      # Maximum depth of the call stack to track
-TARGET_FUNCTION = "do_mas_munmap"  # The root function we want to analyze
+# The root functions we want to analyze, tracer.sh graphs both munmap and mmap
+TARGET_FUNCTIONS = ["do_mas_munmap", "__do_munmap", "do_mmap"]
+
+# Regular expressions for matching function entry/exit
+CPU_PATTERN = re.compile(r'\[(\d+)\]')
+TIMESTAMP_PATTERN = re.compile(r'(\d+\.\d+):\s+funcgraph_')
+ENTRY_PATTERN = re.compile(r'funcgraph_entry:\s*(?:(\d+\.\d+)\s+us\s+)?\|\s*(\w+)\(\)\s*{')
+EXIT_PATTERN = re.compile(r'funcgraph_exit:\s*(?:[\+\!])?\s*(\d+\.\d+)\s+us\s*\|\s*}')
+SINGLE_LINE_PATTERN = re.compile(r'funcgraph_entry:\s*(\d+\.\d+)\s+us\s*\|\s*(\w+)\(\);')
 
 def parse_duration(duration_str):
     """Parse duration string and convert to microseconds"""
@@ -21,87 +41,371 @@ def parse_duration(duration_str):
     except ValueError:
         return 0.0
 
-def parse_tracecmd(input_file):
+def read_report(input_file):
+    """
+    Yield the lines of a trace-cmd report one at a time.
+    A .dat file is piped through `trace-cmd report`, '-' reads a report from stdin
+    and anything else is read as an already generated text report.
+    """
+    if input_file == '-':
+        yield from sys.stdin
+        return
+    if not input_file.endswith('.dat'):
+        with open_trace(input_file, 'r') as report:
+            yield from report
+        return
+
+    cmd = ['trace-cmd', 'report', input_file]
     try:
-        cmd = ['trace-cmd', 'report', input_file]
-        output = subprocess.check_output(cmd, universal_newlines=True)
-    except subprocess.CalledProcessError as e:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, universal_newlines=True, bufsize=1024 * 1024)
+    except OSError as e:
         print(f"Error running trace-cmd: {e}", file=sys.stderr)
         sys.exit(1)
 
-    # Process the output
-    stacks = defaultdict(float)  # Using float for duration accumulation
-    current_stack = []
-    in_target_function = False
-    found_first = False
-    
-    # Regular expressions for matching function entry/exit
-    entry_pattern = re.compile(r'funcgraph_entry:\s*(?:(\d+\.\d+)\s+us\s+)?\|\s*(\w+)\(\)\s*{')
-    exit_pattern = re.compile(r'funcgraph_exit:\s*(?:[\+\!])?\s*(\d+\.\d+)\s+us\s*\|\s*}')
-    single_line_pattern = re.compile(r'funcgraph_entry:\s*(\d+\.\d+)\s+us\s*\|\s*(\w+)\(\);')
-    
-    for line in output.split('\n'):
+    finished = False
+    try:
+        yield from process.stdout
+        finished = True
+    finally:
+        # The caller may stop early, in which case trace-cmd is not needed anymore
+        process.stdout.close()
+        if process.poll() is None:
+            process.terminate()
+        returncode = process.wait()
+    if finished and returncode != 0:
+        print(f"Error running trace-cmd: exit status {returncode}", file=sys.stderr)
+        sys.exit(1)
+
+def iter_report_events(input_file):
+    """
+    Yield (cpu, timestamp in seconds, kind, function name, duration in microseconds or None)
+    from the text of a trace-cmd report. A leaf call, printed on a single line, is yielded as an entry
+    immediately followed by its exit, the same way the kernel records it.
+    """
+    for line in read_report(input_file):
         line = line.strip()
         
         # Skip empty lines and CPU info
         if not line or line.startswith('CPU') or line.startswith('cpus='):
             continue
 
-        # If we've already processed the first instance and we're not in a stack, stop
-        if found_first and not current_stack:
-            break
+        # Function graph output is interleaved between CPUs, so each one is followed separately
+        cpu_match = CPU_PATTERN.search(line)
+        cpu = cpu_match.group(1) if cpu_match else None
+        timestamp_match = TIMESTAMP_PATTERN.search(line)
+        timestamp = float(timestamp_match.group(1)) if timestamp_match else None
 
         # Check for single-line function calls first
-        single_line_match = single_line_pattern.search(line)
+        single_line_match = SINGLE_LINE_PATTERN.search(line)
         if single_line_match:
-            duration = parse_duration(single_line_match.group(1))
             func_name = single_line_match.group(2)
-            
-            if in_target_function and duration >= MIN_DURATION_US:
-                # For single-line functions, create a temporary stack including this function
-                temp_stack = current_stack + [func_name]
-                if len(temp_stack) <= MAX_STACK_DEPTH:
-                    stack_str = ';'.join(temp_stack)
-                    stacks[stack_str] = duration
-            
-            # If this is our target function (unlikely as it's single-line, but possible)
-            if func_name == TARGET_FUNCTION:
-                found_first = True
-                in_target_function = False
+            yield cpu, timestamp, ENTRY, func_name, None
+            yield cpu, timestamp, EXIT, func_name, parse_duration(single_line_match.group(1))
             continue
 
         # Check for function entry
-        entry_match = entry_pattern.search(line)
+        entry_match = ENTRY_PATTERN.search(line)
         if entry_match:
-            func_name = entry_match.group(2)
-            
-            # Check for target function
-            if func_name == TARGET_FUNCTION and not in_target_function:
-                in_target_function = True
-                current_stack = []
-            
-            # Only add to stack if we're tracking and haven't reached max depth
-            if in_target_function and len(current_stack) < MAX_STACK_DEPTH:
-                current_stack.append(func_name)
+            yield cpu, timestamp, ENTRY, entry_match.group(2), None
+            continue
+
+        # Check for function exit, the report does not name the function that returns
+        exit_match = EXIT_PATTERN.search(line)
+        if exit_match:
+            yield cpu, timestamp, EXIT, None, parse_duration(exit_match.group(1))
+
+def iter_events(input_file, native=False):
+    """Function-graph events of a trace, decoded from trace.dat directly when native is set"""
+    if native:
+        return iter_funcgraph_events(input_file)
+    return iter_report_events(input_file)
+
+def iter_calls(input_file, targets=TARGET_FUNCTIONS, native=False, first_only=True):
+    """
+    Yield (frames, duration in microseconds, cpu, start timestamp) for every call that
+    returns inside a followed target, frames[0] being the target. With first_only only
+    the first call of every target is followed, and the trace is read no further than needed.
+    """
+    targets = set(targets)
+    cpu_stacks = defaultdict(list)  # Open frames per CPU, frame 0 is the target being followed
+    cpu_starts = defaultdict(list)  # Timestamps of the open frames
+    found_first = set()
+
+    events = iter_events(input_file, native)
+    try:
+        for cpu, timestamp, kind, func_name, duration in events:
+            # If we've already processed the first instance of every target and we're not in a stack, stop
+            if first_only and found_first == targets and not any(cpu_stacks.values()):
+                break
+
+            current_stack = cpu_stacks[cpu]
+            if kind == ENTRY:
+                # Start following a target, or descend into the one we follow
+                if current_stack or (func_name in targets and func_name not in found_first):
+                    current_stack.append(func_name)
+                    cpu_starts[cpu].append(timestamp)
+            elif current_stack:
+                yield tuple(current_stack), duration, cpu, cpu_starts[cpu].pop()
+                func_name = current_stack.pop()
+
+                # Stop following after completing the first call of the target
+                if first_only and not current_stack:
+                    found_first.add(func_name)
+    finally:
+        # Stops trace-cmd when the pass ends early
+        events.close()
+
+def parse_tracecmd(input_file, targets=TARGET_FUNCTIONS, native=False, first_only=True):
+    """
+    Extract the call tree of the first call of every target function in a single pass,
+    or of every call when first_only is False. Calls along the same path add up.
+    Returns {target: {folded stack: duration in microseconds}}.
+    """
+    stacks = {target: defaultdict(float) for target in targets}  # Using float for duration accumulation
+    for frames, duration, _, _ in iter_calls(input_file, targets, native, first_only):
+        if duration >= MIN_DURATION_US and len(frames) <= MAX_STACK_DEPTH:
+            stacks[frames[0]][';'.join(frames)] += duration
+    return {target: dict(target_stacks) for target, target_stacks in stacks.items()}
+
+def aggregate_tracecmd(input_file, targets=TARGET_FUNCTIONS, native=False):
+    """
+    Follow every call of the targets in a single pass.
+    Returns (stacks as parse_tracecmd with first_only=False,
+             {folded stack: inclusive duration} without the depth and duration limits,
+             {function: array of per-call durations},
+             {target: list of (duration, start timestamp, cpu) per call}).
+    A trace.dat read natively is aggregated by aggregate_native instead, on numpy columns.
+    """
+    if native:
+        return aggregate_native(input_file, targets)
+    stacks = {target: defaultdict(float) for target in targets}
+    paths = defaultdict(float)
+    latencies = defaultdict(lambda: array('d'))
+    invocations = {target: [] for target in targets}
+    for frames, duration, cpu, timestamp in iter_calls(input_file, targets, native, first_only=False):
+        stack = ';'.join(frames)
+        paths[stack] += duration
+        latencies[frames[-1]].append(duration)
+        if len(frames) == 1:
+            invocations[frames[0]].append((duration, timestamp, cpu))
+        if duration >= MIN_DURATION_US and len(frames) <= MAX_STACK_DEPTH:
+            stacks[frames[0]][stack] += duration
+    return ({target: dict(target_stacks) for target, target_stacks in stacks.items()},
+            dict(paths), dict(latencies), invocations)
+
+def small_ints(values):
+    """values as uint16 when they fit, which numpy sorts stably with a radix sort"""
+    import numpy as np
+    return values.astype(np.uint16) if len(values) and 0 <= values.min() and values.max() < 1 << 16 else values
+
+def last_entry_finder(is_entry, level):
+    """
+    Function mapping (levels, indices) to the index of the last entry pushed at each level
+    at or before each index, or -1 when there is none
+    """
+    import numpy as np
+    entries = np.flatnonzero(is_entry)
+    span = len(level) + 1
+    order = np.argsort(small_ints(level[entries]), kind='stable')
+    entries = entries[order]
+    keys = level[entries] * span + entries
+
+    def find(levels, indices):
+        found = np.searchsorted(keys, levels * span + indices, side='right') - 1
+        candidates = entries[np.maximum(found, 0)]
+        return np.where((found >= 0) & (level[candidates] == levels), candidates, -1)
+    return find, entries, keys // span
+
+def aggregate_native(input_file, targets=TARGET_FUNCTIONS, pages_per_batch=PAGES_PER_BATCH):
+    """
+    aggregate_tracecmd for a trace.dat, computed with numpy on the columns
+    TraceDat.funcgraph_batches decodes, without building a tuple per event.
+    Every CPU keeps one stack as in iter_calls: an entry is pushed, an exit pops the top
+    frame if there is one. So an exit closes the last entry pushed at its level, and the
+    parent of an entry is the last entry pushed one level below it. Frames still open at the
+    end of a batch are pushed again at the start of the next one.
+    """
+    import numpy as np
+    targets = list(targets)
+    names, name_ids = [], {}
+    path_keys, path_names, path_depths, path_roots = {}, [], [], []
+    path_totals, path_calls = np.zeros(0), np.zeros(0, dtype=np.int64)
+    stack_totals, stack_calls = np.zeros(0), np.zeros(0, dtype=np.int64)
+    latencies = defaultdict(lambda: array('d'))
+    invocations = {target: [] for target in targets}
+
+    def path_id(parent, name):
+        key = (parent, name)
+        if key not in path_keys:
+            path_keys[key] = len(path_names)
+            if parent < 0:
+                path_names.append(names[name])
+                path_depths.append(1)
+                path_roots.append(name)
+            else:
+                path_names.append(path_names[parent] + ';' + names[name])
+                path_depths.append(path_depths[parent] + 1)
+                path_roots.append(path_roots[parent])
+        return path_keys[key]
+
+    def name_id(name):
+        if name not in name_ids:
+            name_ids[name] = len(names)
+            names.append(name)
+        return name_ids[name]
+
+    def grow(values, size):
+        return np.concatenate((values, np.zeros(size - len(values), dtype=values.dtype)))
+
+    with TraceDat(input_file) as trace:
+        open_cpu, open_names, open_starts = None, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        for cpu, columns in trace.funcgraph_batches(pages_per_batch):
+            if cpu != open_cpu:
+                open_cpu, open_names, open_starts = cpu, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+            funcs, func_index = np.unique(columns['func'], return_inverse=True)
+            lookup = np.array([name_id(trace.function_name(func % (1 << 64))) for func in funcs.tolist()],
+                              dtype=np.int64)
+            name = np.concatenate((open_names, lookup[func_index.reshape(-1)]))
+            timestamp = np.concatenate((open_starts, columns['timestamp']))
+            duration = np.concatenate((np.full(len(open_names), -1), columns['duration']))
+            is_entry = np.concatenate((np.ones(len(open_names), dtype=bool), columns['kind'] == ENTRY))
+            if not len(name):
+                continue
+
+            # Stack height after every event, exits on an empty stack are dropped
+            height = np.cumsum(np.where(is_entry, 1, -1))
+            height -= np.minimum(np.minimum.accumulate(height), 0)
+            before = np.concatenate(([0], height[:-1]))
+            level = np.where(is_entry, before, before - 1)
+            find, entries, entry_levels = last_entry_finder(is_entry, level)
+
+            # Path of every followed entry, a level at a time so parents come first
+            entry_path = np.full(len(name), -1, dtype=np.int64)
+            is_target = np.array([candidate in targets for candidate in names])
+            bounds = np.searchsorted(entry_levels, np.arange(level.max() + 2))
+            for depth in range(len(bounds) - 1):
+                group = entries[bounds[depth]:bounds[depth + 1]]
+                if depth:
+                    parents = find(np.full(len(group), depth - 1), group)
+                    parent_path = np.where(parents >= 0, entry_path[parents], -1)
+                else:
+                    parent_path = np.full(len(group), -1)
+                followed = (parent_path >= 0) | is_target[name[group]]
+                group, parent_path = group[followed], parent_path[followed]
+                if not len(group):
+                    continue
+                keys, key_index = np.unique((parent_path + 1) * len(names) + name[group], return_inverse=True)
+                ids = np.array([path_id(key // len(names) - 1, key % len(names)) for key in keys.tolist()],
+                               dtype=np.int64)
+                entry_path[group] = ids[key_index.reshape(-1)]
+
+            # Every call that returns inside a followed target
+            exits = np.flatnonzero(~is_entry & (before > 0))
+            calls = find(level[exits], exits)
+            paths = entry_path[calls]
+            followed = paths >= 0
+            exits, calls, paths = exits[followed], calls[followed], paths[followed]
+            durations = duration[exits] / 1000.0
+
+            size = len(path_names)
+            depths = np.array(path_depths, dtype=np.int64)
+            path_totals = grow(path_totals, size) + np.bincount(paths, durations, minlength=size)
+            path_calls = grow(path_calls, size) + np.bincount(paths, minlength=size)
+            kept = (durations >= MIN_DURATION_US) & (depths[paths] <= MAX_STACK_DEPTH)
+            stack_totals = grow(stack_totals, size) + np.bincount(paths[kept], durations[kept], minlength=size)
+            stack_calls = grow(stack_calls, size) + np.bincount(paths[kept], minlength=size)
+
+            frames = name[calls]
+            order = np.argsort(small_ints(frames), kind='stable')
+            frame_ids, first = np.unique(frames[order], return_index=True)
+            for frame, group in zip(frame_ids.tolist(), np.split(durations[order], first[1:])):
+                latencies[names[frame]].frombytes(group.tobytes())
+            roots = depths[paths] == 1
+            cpu_name = str(cpu)
+            for frame, call_duration, start in zip(frames[roots].tolist(), durations[roots].tolist(),
+                                                   (timestamp[calls[roots]] / 1e9).tolist()):
+                invocations[names[frame]].append((call_duration, start, cpu_name))
+
+            # Frames still open carry over to the next batch of this CPU
+            open_calls = find(np.arange(height[-1]), np.full(height[-1], len(name) - 1))
+            open_names, open_starts = name[open_calls], timestamp[open_calls]
+
+    stacks = {target: {} for target in targets}
+    paths = {}
+    for index, stack in enumerate(path_names):
+        if path_calls[index]:
+            paths[stack] = float(path_totals[index])
+        if stack_calls[index]:
+            stacks[names[path_roots[index]]][stack] = float(stack_totals[index])
+    return stacks, paths, dict(latencies), invocations
+
+def function_statistics(paths, latencies):
+    """
+    One row per traced function with its number of calls, total and self time and
+    per-call p50, p99 and max, all in microseconds, ordered by self time.
+    Total time of a recursive function counts the nested calls again.
+    """
+    self_time = defaultdict(float)
+    for stack, duration in self_times(paths).items():
+        self_time[stack.rpartition(';')[2]] += duration
+
+    rows = []
+    for function, durations in latencies.items():
+        ordered = sorted(durations)
+        rows.append({
+            'function': function,
+            'calls': len(ordered),
+            'total': round(sum(ordered), 3),
+            'self': round(self_time[function], 3),
+            'p50': percentile(ordered, 0.50),
+            'p99': percentile(ordered, 0.99),
+            'max': ordered[-1],
+        })
+    rows.sort(key=lambda row: row['self'], reverse=True)
+    return rows
+
+def latency_histogram(durations):
+    """
+    Per-call latencies in power-of-two microsecond buckets.
+    Returns [(low, high, calls)] from the fastest bucket to the slowest.
+    """
+    buckets = Counter(math.floor(math.log2(duration)) if duration > 0 else None for duration in durations)
+    zero = buckets.pop(None, 0)
+    histogram = [(0.0, 0.0, zero)] if zero else []
+    if buckets:
+        for exponent in range(min(buckets), max(buckets) + 1):
+            histogram.append((2.0 ** exponent, 2.0 ** (exponent + 1), buckets[exponent]))
+    return histogram
+
+def find_outliers(invocations, limit=10):
+    """
+    Calls slower than the p99 of their target, slowest first, at most limit per target.
+    Returns [(target, duration, start timestamp, cpu, multiple of the p50)].
+    """
+    outliers = []
+    for target, calls in invocations.items():
+        if not calls:
             continue
+        ordered = sorted(duration for duration, _, _ in calls)
+        p50, p99 = percentile(ordered, 0.50), percentile(ordered, 0.99)
+        slowest = sorted((call for call in calls if call[0] > p99), reverse=True)[:limit]
+        outliers.extend((target, duration, timestamp, cpu, duration / p50 if p50 else float('inf'))
+                        for duration, timestamp, cpu in slowest)
+    return outliers
 
-        # Check for function exit
-        exit_match = exit_pattern.search(line)
-        if exit_match and current_stack:
-            duration = parse_duration(exit_match.group(1))
-            
-            if in_target_function and duration >= MIN_DURATION_US:
-                stack_str = ';'.join(current_stack)
-                stacks[stack_str] = duration
-            
-            func_name = current_stack.pop() if current_stack else None
-            
-            # Stop after completing the first target function
-            if func_name == TARGET_FUNCTION:
-                found_first = True
-                in_target_function = False
-
-    return stacks
+def self_times(stacks):
+    """
+    Turn {folded stack: inclusive duration} into the time spent in each frame itself,
+    which is what flamegraph.pl expects since it adds up the lines of a folded file.
+    Time in children that were not recorded (too short or too deep) stays with the parent.
+    """
+    own = dict(stacks)
+    for stack, duration in stacks.items():
+        parent, _, _ = stack.rpartition(';')
+        if parent in own:
+            own[parent] -= duration
+    # Clamp the rounding of the reported microseconds
+    return {stack: round(max(duration, 0.0), 3) for stack, duration in own.items()}
 
 def write_folded_format(stacks, output_file):
     """Write stacks in folded format required by flamegraph.pl"""
@@ -112,39 +416,140 @@ def write_folded_format(stacks, output_file):
             if samples > 0:
                 f.write(f"{stack} {samples}\n")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert a function_graph trace into folded stacks for a flame graph")
+    parser.add_argument('input_file', nargs='?', default='trace.dat',
+                        help="trace.dat, a text report from `trace-cmd report`, or - for stdin (default: trace.dat)")
+    parser.add_argument('-o', '--output', default='output.folded', help="folded stacks file (default: output.folded)")
+    parser.add_argument('-t', '--target', action='append', dest='targets',
+                        help=f"root function to analyze, may be repeated (default: {' '.join(TARGET_FUNCTIONS)})")
+    parser.add_argument('--native', action='store_true',
+                        help="decode trace.dat directly instead of piping it through `trace-cmd report`")
+    parser.add_argument('--all', action='store_true', dest='all_calls',
+                        help="aggregate every call of the targets instead of the first one, with latency statistics")
+    parser.add_argument('--outliers', type=int, default=10,
+                        help="slowest calls above p99 listed per target with --all (default: 10)")
+    parser.add_argument('--svg', help="also render the folded stacks as an SVG flame graph to this file")
+    parser.add_argument('--icicle', action='store_true', help="draw the SVG as an icicle graph, roots at the top")
+    parser.add_argument('--stats', help="with --all, also write the statistics as JSON to this file")
+    return parser.parse_args()
+
+def print_first_statistics(targets, stacks_by_target):
+    for target in targets:
+        target_stacks = stacks_by_target.get(target, {})
+        if not target_stacks:
+            print(f"\n{target}: not found in the trace")
+            continue
+        max_depth = max(stack.count(';') + 1 for stack in target_stacks.keys())
+        total_time = max(target_stacks.values())
+        
+        print(f"\nFirst {target} statistics:")
+        print(f"- Total time: {total_time:.2f}μs")
+        print(f"- Maximum stack depth: {max_depth}")
+        print(f"- Number of unique stacks: {len(target_stacks)}")
+
+def print_all_statistics(targets, functions, latencies, outliers):
+    rows = {row['function']: row for row in functions}
+    for target in targets:
+        if target not in rows:
+            print(f"\n{target}: not found in the trace")
+            continue
+        row = rows[target]
+        print(f"\nAll {target} statistics:")
+        print(f"- Calls: {row['calls']:,}")
+        print(f"- Total time: {row['total']:.2f}μs (self {row['self']:.2f}μs)")
+        print(f"- Per call: p50 {row['p50']:.2f}μs, p99 {row['p99']:.2f}μs, max {row['max']:.2f}μs")
+        print("- Latency histogram:")
+        histogram = latency_histogram(latencies[target])
+        widest = max(calls for _, _, calls in histogram)
+        for low, high, calls in histogram:
+            bar = '#' * math.ceil(calls / widest * 40) if calls else ''
+            print(f"  {low:>10.2f} - {high:>10.2f} μs {calls:>9,} {bar}")
+
+    if outliers:
+        print("\nOutliers (slower than p99):")
+        print(f"{'target':<20} {'duration (μs)':>14} {'x p50':>8} {'cpu':>4} {'timestamp':>16}")
+        for target, duration, timestamp, cpu, ratio in outliers:
+            when = f"{timestamp:.6f}" if timestamp is not None else '-'
+            print(f"{target:<20} {duration:>14.2f} {ratio:>8.1f} {cpu or '-':>4} {when:>16}")
+
+    print("\nTraced functions by self time (μs):")
+    print(f"{'function':<40} {'calls':>9} {'total':>12} {'self':>12} {'p50':>9} {'p99':>9} {'max':>9}")
+    for row in functions[:20]:
+        print(f"{row['function']:<40} {row['calls']:>9,} {row['total']:>12.2f} {row['self']:>12.2f} "
+              f"{row['p50']:>9.2f} {row['p99']:>9.2f} {row['max']:>9.2f}")
+
+def write_statistics(output_file, functions, latencies, outliers):
+    report = {
+        'functions': functions,
+        'histograms': {function: [{'low': low, 'high': high, 'calls': calls}
+                                  for low, high, calls in latency_histogram(durations)]
+                       for function, durations in latencies.items()},
+        'outliers': [{'target': target, 'duration': duration, 'timestamp': timestamp, 'cpu': cpu,
+                      'p50_multiple': ratio} for target, duration, timestamp, cpu, ratio in outliers],
+    }
+    with open(output_file, 'w') as f:
+        json.dump(report, f, indent=2)
+        f.write('\n')
+
 def main():
-    input_file = "trace.dat"
-    output_file = "output.folded"
+    args = parse_args()
+    input_file = args.input_file
+    output_file = args.output
+    targets = args.targets or TARGET_FUNCTIONS
+    if args.native and not input_file.endswith('.dat'):
+        print("Error: --native needs a trace.dat file", file=sys.stderr)
+        sys.exit(1)
+    which = 'All' if args.all_calls else 'First'
 
     print(f"Processing {input_file}...")
-    print(f"Analyzing first occurrence of: {TARGET_FUNCTION}")
+    print(f"Analyzing {which.lower()} {'calls' if args.all_calls else 'occurrence'} of: {', '.join(targets)}")
     print(f"Settings:")
     print(f"- Minimum duration: {MIN_DURATION_US}μs")
     print(f"- Maximum stack depth: {MAX_STACK_DEPTH}")
 
-    stacks = parse_tracecmd(input_file)
+    try:
+        if args.all_calls:
+            stacks_by_target, paths, latencies, invocations = aggregate_tracecmd(input_file, targets, args.native)
+        else:
+            stacks_by_target = parse_tracecmd(input_file, targets, native=args.native)
+    except TraceDatError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
     
-    # Print the actual stacks before writing to file
-    print("\nStack traces to be graphed:")
-    for stack, duration in sorted(stacks.items()):
-        print(f"{stack}: {duration:.2f}μs")
+    # Every target roots its own stacks, so they can share one folded file
+    stacks = {}
+    for target_stacks in stacks_by_target.values():
+        stacks.update(self_times(target_stacks))
+
+    if not args.all_calls:
+        # Print the actual stacks before writing to file
+        print("\nStack traces to be graphed:")
+        for stack, duration in sorted(stacks.items()):
+            print(f"{stack}: {duration:.2f}μs")
     
     write_folded_format(stacks, output_file)
     
     # Calculate stats
-    max_depth = max((stack.count(';') + 1 for stack in stacks.keys()), default=0)
-    total_time = max((duration for duration in stacks.values()), default=0)
-    
-    print(f"\nFirst instance statistics:")
-    print(f"- Total time: {total_time:.2f}μs")
-    print(f"- Maximum stack depth: {max_depth}")
-    print(f"- Number of unique stacks: {len(stacks)}")
+    if args.all_calls:
+        functions = function_statistics(paths, latencies)
+        outliers = find_outliers(invocations, args.outliers)
+        print_all_statistics(targets, functions, latencies, outliers)
+        if args.stats:
+            write_statistics(args.stats, functions, latencies, outliers)
+            print(f"\nStatistics written to {args.stats}")
+    else:
+        print_first_statistics(targets, stacks_by_target)
     
     print(f"\nOutput written to {output_file}")
-    print("\nNow you can generate the flame graph using:")
-    print(f"flamegraph.pl --width 800 --height 400 --minwidth 0.5 "
-          f"--title 'First {TARGET_FUNCTION} ({total_time:.0f}μs)' "
-          f"--countname 'microseconds' {output_file} > flamegraph.svg")
+    title = f"{which} {', '.join(targets)}"
+    if args.svg:
+        write_svg(stacks, args.svg, title=title, countname='microseconds', icicle=args.icicle)
+        print(f"{'Icicle' if args.icicle else 'Flame'} graph written to {args.svg}")
+    else:
+        print("\nNow you can generate the flame graph using:")
+        print(f"python3 {Path(__file__).with_name('flamegraph_svg.py')} {output_file} -o flamegraph.svg "
+              f"--title '{title}'")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
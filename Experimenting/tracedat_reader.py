@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+"""
+Reader for the binary trace.dat files that `trace-cmd record` writes (file format version 6).
+
+The file is memory-mapped and the per-CPU ring-buffer pages of the flyrecord section
+are decoded directly, so function-graph events reach the analysis without going
+through `trace-cmd report` and back through regexes. Only the funcgraph_entry and
+funcgraph_exit events are decoded: one at a time by iter_funcgraph_events, or a batch of
+pages at a time into numpy columns by TraceDat.funcgraph_batches.
+
+Run it as a script to check the decoder against `trace-cmd report` on real captures:
+
+    python3 tracedat_reader.py trace_output/trace.dat [more.dat ...]
+"""
+import bisect
+import heapq
+import mmap
+import operator
+import re
+import struct
+import subprocess
+import sys
+from collections import Counter, namedtuple
+
+MAGIC = b'\x17\x08\x44tracing'
+SUPPORTED_VERSION = 6
+
+# Ring buffer event types (see include/linux/ring_buffer.h)
+TYPE_PADDING = 29
+TYPE_TIME_EXTEND = 30
+TYPE_TIME_STAMP = 31
+TS_SHIFT = 27
+# High bits of the page commit field are missed-event flags, not part of the size
+COMMIT_MASK = (1 << 27) - 1
+# Ring-buffer pages decoded together by funcgraph_batches, 4 MB of trace with 4 KB pages
+PAGES_PER_BATCH = 1024
+
+ENTRY = 0
+EXIT = 1
+
+Field = namedtuple('Field', ['offset', 'size', 'signed'])
+EventFormat = namedtuple('EventFormat', ['id', 'system', 'name', 'fields'])
+
+FIELD_PATTERN = re.compile(r'field:(?P<decl>[^;]*);\s*offset:(?P<offset>\d+);\s*size:(?P<size>\d+);'
+                           r'(?:\s*signed:(?P<signed>\d+);)?')
+
+class TraceDatError(Exception):
+    pass
+
+def parse_fields(text):
+    """
+    Map field name to Field from the `field:...; offset:...; size:...;` lines of a format
+    """
+    fields = {}
+    for match in FIELD_PATTERN.finditer(text):
+        decl = match.group('decl').strip()
+        name = re.sub(r'\[.*\]$', '', decl.split()[-1])
+        fields[name] = Field(int(match.group('offset')), int(match.group('size')), match.group('signed') == '1')
+    return fields
+
+def parse_event_format(system, text):
+    name = re.search(r'^name:\s*(\S+)', text, re.MULTILINE)
+    event_id = re.search(r'^ID:\s*(\d+)', text, re.MULTILINE)
+    if not name or not event_id:
+        raise TraceDatError(f"Malformed event format in system {system}")
+    return EventFormat(int(event_id.group(1)), system, name.group(1), parse_fields(text))
+
+def parse_kallsyms(text):
+    """
+    Sorted (addresses, names) of the text symbols in the kallsyms section
+    """
+    symbols = []
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) >= 3 and parts[1] in 'tTwW':
+            symbols.append((int(parts[0], 16), parts[2]))
+    symbols.sort()
+    return [address for address, _ in symbols], [name for _, name in symbols]
+
+class TraceDat:
+    """
+    A memory-mapped trace.dat file. Use as a context manager or call close().
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.pos = 0
+        try:
+            self.parse_headers()
+        except (struct.error, IndexError, ValueError) as e:
+            self.close()
+            raise TraceDatError(f"{path}: truncated or corrupt trace.dat ({e})")
+        except TraceDatError:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.data is not None:
+            try:
+                self.data.close()
+            except BufferError:
+                # A suspended funcgraph_batches still holds numpy views, the map goes with them
+                pass
+            self.file.close()
+            self.data = None
+
+    # Low level readers for the header sections
+
+    def read(self, size):
+        chunk = self.data[self.pos:self.pos + size]
+        if len(chunk) != size:
+            raise TraceDatError(f"{self.path}: unexpected end of file")
+        self.pos += size
+        return chunk
+
+    def read_int(self, size):
+        return int.from_bytes(self.read(size), self.byteorder)
+
+    def read_string(self):
+        end = self.data.find(b'\0', self.pos)
+        if end < 0:
+            raise TraceDatError(f"{self.path}: unterminated string")
+        value = self.data[self.pos:end].decode()
+        self.pos = end + 1
+        return value
+
+    def expect(self, tag):
+        if self.read(len(tag)) != tag:
+            raise TraceDatError(f"{self.path}: expected section {tag!r}")
+
+    def parse_headers(self):
+        if self.read(len(MAGIC)) != MAGIC:
+            raise TraceDatError(f"{self.path}: not a trace-cmd trace.dat file")
+        version = int(self.read_string())
+        if version != SUPPORTED_VERSION:
+            raise TraceDatError(f"{self.path}: trace.dat version {version} is not supported, "
+                                f"record with `trace-cmd record --file-version {SUPPORTED_VERSION}` "
+                                f"or use the trace-cmd report path")
+        self.byteorder = 'big' if self.read(1)[0] else 'little'
+        self.endian = '>' if self.byteorder == 'big' else '<'
+        self.long_size = self.read(1)[0]
+        self.page_size = self.read_int(4)
+
+        self.expect(b'header_page\0')
+        page_fields = parse_fields(self.read(self.read_int(8)).decode(errors='replace'))
+        self.commit_field = page_fields.get('commit', Field(8, self.long_size, False))
+        self.page_data_offset = page_fields['data'].offset if 'data' in page_fields else 8 + self.commit_field.size
+        self.expect(b'header_event\0')
+        self.read(self.read_int(8))
+
+        self.formats = {}
+        for _ in range(self.read_int(4)):
+            event = parse_event_format('ftrace', self.read(self.read_int(8)).decode(errors='replace'))
+            self.formats[event.id] = event
+        for _ in range(self.read_int(4)):
+            system = self.read_string()
+            for _ in range(self.read_int(4)):
+                event = parse_event_format(system, self.read(self.read_int(8)).decode(errors='replace'))
+                self.formats[event.id] = event
+
+        self.symbol_addresses, self.symbol_names = parse_kallsyms(self.read(self.read_int(4)).decode(errors='replace'))
+        self.read(self.read_int(4))  # printk formats
+        self.cmdlines = {}
+        for line in self.read(self.read_int(8)).decode(errors='replace').splitlines():
+            pid, _, comm = line.partition(' ')
+            if pid.isdigit():
+                self.cmdlines[int(pid)] = comm
+
+        self.cpus = self.read_int(4)
+        section = self.read(10)
+        if section == b'options  \0':
+            while True:
+                option_id = self.read_int(2)
+                if option_id == 0:
+                    break
+                self.read(self.read_int(4))
+            section = self.read(10)
+        if section != b'flyrecord\0':
+            raise TraceDatError(f"{self.path}: only flyrecord traces are supported, found {section!r}")
+        self.cpu_buffers = [(self.read_int(8), self.read_int(8)) for _ in range(self.cpus)]
+        if any(start + size > len(self.data) for start, size in self.cpu_buffers):
+            raise TraceDatError(f"{self.path}: truncated trace.dat, CPU buffers run past the end of the file")
+
+    def function_name(self, address):
+        index = bisect.bisect_right(self.symbol_addresses, address) - 1
+        if index < 0:
+            return f'0x{address:x}'
+        return self.symbol_names[index]
+
+    def find_event(self, name):
+        for event in self.formats.values():
+            if event.name == name:
+                return event
+        return None
+
+    # Ring buffer decoding
+
+    def iter_cpu_events(self, cpu):
+        """
+        Yield (timestamp, event id, data offset) for every event recorded on cpu, in order
+        """
+        data = self.data
+        page_size = self.page_size
+        commit = self.commit_field
+        header = struct.Struct(self.endian + 'I')
+        start, size = self.cpu_buffers[cpu]
+        for page in range(start, start + size, page_size):
+            timestamp = int.from_bytes(data[page:page + 8], self.byteorder)
+            page_commit = int.from_bytes(data[page + commit.offset:page + commit.offset + commit.size], self.byteorder)
+            page_end = page + self.page_data_offset + (page_commit & COMMIT_MASK)
+            pos = page + self.page_data_offset
+            while pos + 4 <= page_end:
+                type_len_ts, = header.unpack_from(data, pos)
+                if self.byteorder == 'little':
+                    type_len, delta = type_len_ts & 0x1f, type_len_ts >> 5
+                else:
+                    type_len, delta = type_len_ts >> 27, type_len_ts & ((1 << 27) - 1)
+                pos += 4
+
+                if type_len == TYPE_PADDING:
+                    if delta == 0:
+                        # Rest of the page is unused
+                        break
+                    pos += header.unpack_from(data, pos)[0]
+                    continue
+                if type_len in (TYPE_TIME_EXTEND, TYPE_TIME_STAMP):
+                    extend = (header.unpack_from(data, pos)[0] << TS_SHIFT) + delta
+                    timestamp = extend if type_len == TYPE_TIME_STAMP else timestamp + extend
+                    pos += 4
+                    continue
+
+                if type_len == 0:
+                    length = header.unpack_from(data, pos)[0] - 4
+                    length = (length + 3) & ~3
+                    pos += 4
+                else:
+                    length = type_len * 4
+                timestamp += delta
+                event_id = int.from_bytes(data[pos:pos + 2], self.byteorder)
+                yield timestamp, event_id, pos
+                pos += length
+
+    def field_unpacker(self, event, names):
+        """
+        Function that unpacks the named fields of event, in the order given, from its data offset
+        """
+        codes = {(1, False): 'B', (1, True): 'b', (2, False): 'H', (2, True): 'h',
+                 (4, False): 'I', (4, True): 'i', (8, False): 'Q', (8, True): 'q'}
+        by_offset = sorted(names, key=lambda name: event.fields[name].offset)
+        fmt, position = self.endian, 0
+        for name in by_offset:
+            field = event.fields[name]
+            fmt += 'x' * (field.offset - position) + codes[(field.size, field.signed)]
+            position = field.offset + field.size
+        unpacker = struct.Struct(fmt)
+        reorder = operator.itemgetter(*[by_offset.index(name) for name in names])
+        return lambda data, pos: reorder(unpacker.unpack_from(data, pos))
+
+    def funcgraph_formats(self):
+        entry = self.find_event('funcgraph_entry')
+        exit_event = self.find_event('funcgraph_exit')
+        if entry is None or exit_event is None:
+            raise TraceDatError(f"{self.path}: no function_graph events, record with -p function_graph")
+        return entry, exit_event
+
+    def funcgraph_events(self, cpu):
+        """
+        Yield (timestamp in ns, cpu, kind (ENTRY/EXIT), func address, duration in ns or -1 for
+        entries) for every function-graph event recorded on cpu, in order, one page at a time
+        """
+        entry, exit_event = self.funcgraph_formats()
+        entry_fields = self.field_unpacker(entry, ['func', 'depth'])
+        exit_fields = self.field_unpacker(exit_event, ['func', 'calltime', 'rettime'])
+        for timestamp, event_id, pos in self.iter_cpu_events(cpu):
+            if event_id == entry.id:
+                func, _ = entry_fields(self.data, pos)
+                yield timestamp, cpu, ENTRY, func, -1
+            elif event_id == exit_event.id:
+                func, calltime, rettime = exit_fields(self.data, pos)
+                yield timestamp, cpu, EXIT, func, rettime - calltime
+
+    # Vectorized decoding, used to aggregate whole traces
+
+    def gather(self, buffers, offsets, size, signed=False):
+        """
+        The size-byte integers at the byte offsets in the file, in the trace's byte order, as
+        int64. buffers holds the file as uint8 and as 32-bit words; values that start on a
+        4-byte boundary are read a word at a time. Unsigned 8-byte values above 2**63 come
+        out negative.
+        """
+        import numpy as np
+        raw, words = buffers
+        little = self.byteorder == 'little'
+        if size in (2, 4, 8) and not (offsets & 3).any():
+            index = offsets >> 2
+            first = words[index].astype(np.uint64)
+            if size == 2:
+                value = first & np.uint64(0xffff) if little else first >> np.uint64(16)
+            elif size == 4:
+                value = first
+            else:
+                second = words[index + 1].astype(np.uint64)
+                low, high = (first, second) if little else (second, first)
+                value = low | (high << np.uint64(32))
+        else:
+            value = np.zeros(len(offsets), dtype=np.uint64)
+            for i in range(size):
+                byte = i if little else size - 1 - i
+                value |= raw[offsets + byte].astype(np.uint64) << np.uint64(8 * i)
+        value = value.view(np.int64)
+        if signed and size < 8:
+            value = np.where(value >= 1 << (8 * size - 1), value - (1 << (8 * size)), value)
+        return value
+
+    def page_buffers(self):
+        """The file as uint8 and as 32-bit words in the trace's byte order, for gather"""
+        import numpy as np
+        return (np.frombuffer(self.data, dtype=np.uint8),
+                np.frombuffer(self.data, dtype=self.endian + 'u4', count=len(self.data) // 4))
+
+    def walk_pages(self, buffers, pages):
+        """
+        (page index in pages, timestamp in ns, data offset) numpy columns of every event in the
+        ring-buffer pages starting at the byte offsets in pages, page after page.
+        The pages are walked in lockstep, one event of every page per step, the same way
+        iter_cpu_events walks a single page.
+        """
+        import numpy as np
+        page_timestamps = self.gather(buffers, pages, 8)
+        commit = self.commit_field
+        commits = self.gather(buffers, pages + commit.offset, commit.size) & COMMIT_MASK
+        ends = pages + self.page_data_offset + commits
+        pos = pages + self.page_data_offset
+        page_ids = np.arange(len(pages))
+        raw, words = buffers
+        if pos.size and (pos[0] & 3 or self.page_size & 3):
+            # Records are only word-aligned when pages are
+            words = None
+
+        # One record per data event or time extend/stamp of every page, step after step:
+        # (page, timestamp increment, data offset or -1, time stamp flags or None, time stamp values)
+        steps = []
+        while True:
+            live = pos + 4 <= ends
+            if not live.all():
+                pos, ends, page_ids = pos[live], ends[live], page_ids[live]
+            if not pos.size:
+                break
+            header = words[pos >> 2].astype(np.int64) if words is not None else self.gather(buffers, pos, 4)
+            if self.byteorder == 'little':
+                type_len, delta = header & 0x1f, header >> 5
+            else:
+                type_len, delta = header >> 27, header & ((1 << 27) - 1)
+
+            if not ((type_len == 0) | (type_len >= TYPE_PADDING)).any():
+                # Only ordinary events in this step
+                steps.append((page_ids, delta, pos + 4, None, None))
+                pos = pos + 4 + (type_len << 2)
+                continue
+
+            padding = type_len == TYPE_PADDING
+            time_stamp = type_len == TYPE_TIME_STAMP
+            time_event = (type_len == TYPE_TIME_EXTEND) | time_stamp
+            long_event = type_len == 0
+            array_value = np.zeros(len(pos), dtype=np.int64)
+            has_array = (padding & (delta != 0)) | time_event | long_event
+            array_value[has_array] = self.gather(buffers, pos[has_array] + 4, 4)
+
+            advance = np.where(long_event, 8 + ((array_value - 4 + 3) & ~3), 4 + type_len * 4)
+            advance = np.where(time_event, 8, advance)
+            advance = np.where(padding, 4 + array_value, advance)
+            data_pos = np.where(time_event, -1, np.where(long_event, pos + 8, pos + 4))
+            extend = (array_value << TS_SHIFT) + delta
+            # Added to the running timestamp; a time stamp replaces it instead
+            increment = np.where(time_event, np.where(time_stamp, 0, extend), delta)
+            record = ~padding
+            steps.append((page_ids[record], increment[record], data_pos[record], time_stamp[record], extend[record]))
+            # Padding without a length means the rest of the page is unused
+            more = ~(padding & (delta == 0))
+            pos, ends, page_ids = (pos + advance)[more], ends[more], page_ids[more]
+
+        if not steps:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        page_ids, increment, data_pos = (np.concatenate([step[i] for step in steps]) for i in range(3))
+        time_stamp = np.concatenate([step[3] if step[3] is not None else np.zeros(len(step[0]), dtype=bool)
+                                     for step in steps])
+        extend = np.concatenate([step[4] if step[4] is not None else step[1] for step in steps])
+        order = np.argsort(page_ids, kind='stable')
+        page_ids, increment, time_stamp, extend, data_pos = (
+            page_ids[order], increment[order], time_stamp[order], extend[order], data_pos[order])
+
+        # Running timestamps, restarting at every page and at every absolute time stamp
+        index = np.arange(len(page_ids))
+        restart = time_stamp.copy()
+        restart[0] = True
+        restart[1:] |= page_ids[1:] != page_ids[:-1]
+        start = np.maximum.accumulate(np.where(restart, index, 0))
+        total = np.cumsum(increment)
+        base = np.where(time_stamp[start], extend[start], page_timestamps[page_ids[start]])
+        timestamps = base + total - total[start] + increment[start]
+
+        events = data_pos >= 0
+        return page_ids[events], timestamps[events], data_pos[events]
+
+    def decode_pages(self, buffers, pages, entry, exit_event):
+        """
+        Function-graph events of the ring-buffer pages starting at the byte offsets in pages as
+        numpy columns, page after page: page (index in pages), timestamp (ns), kind (ENTRY/EXIT),
+        func (address) and duration (ns, -1 for entries)
+        """
+        import numpy as np
+        page_ids, timestamps, data_pos = self.walk_pages(buffers, pages)
+        event_ids = self.gather(buffers, data_pos, 2)
+        is_entry = event_ids == entry.id
+        keep = is_entry | (event_ids == exit_event.id)
+        page_ids = page_ids[keep]
+        timestamps, data_pos, is_entry = timestamps[keep], data_pos[keep], is_entry[keep]
+        columns = {'page': page_ids, 'timestamp': timestamps, 'kind': np.where(is_entry, ENTRY, EXIT).astype(np.uint8)}
+        columns['func'] = np.empty(len(data_pos), dtype=np.int64)
+        for event, selected in ((entry, is_entry), (exit_event, ~is_entry)):
+            func = event.fields['func']
+            columns['func'][selected] = self.gather(buffers, data_pos[selected] + func.offset, func.size)
+        exits = ~is_entry
+        calltime, rettime = exit_event.fields['calltime'], exit_event.fields['rettime']
+        columns['duration'] = np.full(len(data_pos), -1, dtype=np.int64)
+        columns['duration'][exits] = (self.gather(buffers, data_pos[exits] + rettime.offset, rettime.size) -
+                                      self.gather(buffers, data_pos[exits] + calltime.offset, calltime.size))
+        return columns
+
+    def funcgraph_batches(self, pages_per_batch=PAGES_PER_BATCH):
+        """
+        Yield (cpu, columns as decode_pages without page) CPU after CPU, in order.
+        Pages are decoded pages_per_batch at a time, a batch spanning CPUs when their buffers
+        are small, so memory depends on the batch size and not on the size of the trace.
+        """
+        import numpy as np
+        entry, exit_event = self.funcgraph_formats()
+        buffers = self.page_buffers()
+        cpu_pages = [np.arange(start, start + size, self.page_size, dtype=np.int64) for start, size in self.cpu_buffers]
+        pages = np.concatenate(cpu_pages) if cpu_pages else np.zeros(0, dtype=np.int64)
+        page_cpus = np.repeat(np.arange(self.cpus), [len(cpu_page) for cpu_page in cpu_pages])
+        for first in range(0, len(pages), pages_per_batch):
+            columns = self.decode_pages(buffers, pages[first:first + pages_per_batch], entry, exit_event)
+            cpus = page_cpus[first + columns.pop('page')]
+            for cpu in np.unique(page_cpus[first:first + pages_per_batch]).tolist():
+                low, high = np.searchsorted(cpus, [cpu, cpu + 1])
+                yield cpu, {name: values[low:high] for name, values in columns.items()}
+
+def iter_funcgraph_events(path):
+    """
+    Yield (cpu, timestamp in seconds, kind, function name, duration in microseconds or None)
+    for every function-graph event in the trace, merged across CPUs in timestamp order.
+    Every CPU is decoded lazily, so the trace is never held in memory.
+    """
+    with TraceDat(path) as trace:
+        events = heapq.merge(*(trace.funcgraph_events(cpu) for cpu in range(trace.cpus)),
+                             key=operator.itemgetter(0))
+        names = {}
+        for timestamp, cpu, kind, func, duration in events:
+            if func not in names:
+                names[func] = trace.function_name(func)
+            yield str(cpu), timestamp / 1e9, kind, names[func], duration / 1000.0 if duration >= 0 else None
+
+def compare_with_report(path):
+    """
+    Compare the number of calls per function decoded natively with the text of
+    `trace-cmd report`. Returns a list of mismatch descriptions.
+    """
+    # "func() {" and leaf "func();" lines are both one call
+    call_pattern = re.compile(r'funcgraph_entry:\s*(?:\d+\.\d+\s+us\s+)?\|\s*(\w+)\(\)')
+    report_calls = Counter()
+    try:
+        process = subprocess.Popen(['trace-cmd', 'report', path], stdout=subprocess.PIPE, universal_newlines=True)
+    except OSError as e:
+        raise TraceDatError(f"cannot run trace-cmd to compare with: {e}")
+    for line in process.stdout:
+        match = call_pattern.search(line)
+        if match:
+            report_calls[match.group(1)] += 1
+    if process.wait() != 0:
+        raise TraceDatError(f"trace-cmd report failed on {path}")
+
+    native_calls = Counter(name for _, _, kind, name, _ in iter_funcgraph_events(path) if kind == ENTRY)
+
+    mismatches = []
+    for name in sorted(set(report_calls) | set(native_calls)):
+        if report_calls[name] != native_calls[name]:
+            mismatches.append(f"{name}: report {report_calls[name]} calls, native {native_calls[name]}")
+    return mismatches
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python3 tracedat_reader.py <trace.dat> [more.dat ...]")
+        sys.exit(1)
+
+    failed = False
+    for path in sys.argv[1:]:
+        try:
+            with TraceDat(path) as trace:
+                events = sum(len(columns['kind']) for _, columns in trace.funcgraph_batches())
+                print(f"{path}: {trace.cpus} CPUs, page size {trace.page_size}, "
+                      f"{events:,} function-graph events")
+            mismatches = compare_with_report(path)
+        except TraceDatError as e:
+            print(f"  ERROR {e}")
+            failed = True
+            continue
+        for mismatch in mismatches:
+            print(f"  MISMATCH {mismatch}")
+        failed |= bool(mismatches)
+        print("  matches trace-cmd report" if not mismatches else f"  {len(mismatches)} mismatches")
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -6,12 +6,6 @@ if [ "$EUID" -ne 0 ]; then
     exit 1
 fi
 
-# # Check for FlameGraph tools
-# if [ ! -d "FlameGraph" ]; then
-#     echo "Downloading FlameGraph tools..."
-#     git clone https://github.com/brendangregg/FlameGraph.git
-# fi
-
 # Create test directory and files
 WORK_DIR=$(uname -r)"-X-test"
 mkdir -p $WORK_DIR
@@ -64,6 +58,10 @@ mv trace.dat trace_output/
 # To view the trace in readable format:
 trace-cmd report trace_output/trace.dat > trace_output/ftrace_output.txt
 
+# Folded stacks and flame graph, rendered in python so no FlameGraph checkout is needed
+python3 ../tracecmd_to_flamegraph.py trace_output/ftrace_output.txt -o trace_output/output.folded \
+    --svg trace_output/flamegraph.svg
+
 # # Process ftrace output for flamegraph
 # echo "Converting ftrace output to flamegraph format..."
 # cat trace_output/ftrace_output.txt | awk '
@@ -9,9 +9,81 @@
 #include <errno.h>
 #include <pthread.h>
 #include <unistd.h>
+#include <stdint.h>
+#include <string.h>
+#include <sys/utsname.h>
 
 int futex_var = 0;
 
+/*
+ * Log-linear latency histogram: values below HIST_SUB ns get a bucket each, above that
+ * every power of two is split into HIST_SUB equal buckets (at most 1/HIST_SUB = 3%
+ * relative error). Fixed size, so recording never allocates.
+ */
+#define HIST_SUB_BITS 5
+#define HIST_SUB (1 << HIST_SUB_BITS)
+#define HIST_MAX_BITS 40 // Values from 2^40 ns (about 18 minutes) on share the last bucket
+#define HIST_BUCKETS ((HIST_MAX_BITS - HIST_SUB_BITS + 1) * HIST_SUB)
+
+static uint64_t histogram[HIST_BUCKETS];
+static uint64_t outcome_woken, outcome_timeout, outcome_eagain, outcome_other;
+
+static inline unsigned hist_bucket(uint64_t ns) {
+    if (ns < HIST_SUB)
+        return ns;
+    unsigned msb = 63 - __builtin_clzll(ns);
+    if (msb >= HIST_MAX_BITS)
+        return HIST_BUCKETS - 1;
+    unsigned shift = msb - HIST_SUB_BITS;
+    return (shift + 1) * HIST_SUB + (unsigned)((ns >> shift) - HIST_SUB);
+}
+
+// Lowest value of a bucket, the bucket ends where the next one starts
+static uint64_t hist_bucket_low(unsigned bucket) {
+    if (bucket < HIST_SUB)
+        return bucket;
+    unsigned shift = bucket / HIST_SUB - 1;
+    return (uint64_t)(HIST_SUB + bucket % HIST_SUB) << shift;
+}
+
+// Upper bound of the bucket holding the given fraction of all recorded values
+static uint64_t hist_percentile(double fraction, uint64_t total) {
+    uint64_t rank = (uint64_t)(fraction * total + 0.999999);
+    uint64_t seen = 0;
+    for (unsigned i = 0; i < HIST_BUCKETS; i++) {
+        seen += histogram[i];
+        if (seen >= rank && histogram[i])
+            return hist_bucket_low(i + 1);
+    }
+    return 0;
+}
+
+// notes holds the run's own "# key=value" lines
+static void write_histogram(const char *path, int iterations, double elapsed_time, const char *notes) {
+    FILE *out = fopen(path, "w");
+    if (!out) {
+        perror("fopen histogram file");
+        exit(EXIT_FAILURE);
+    }
+    struct utsname uts;
+    uname(&uts);
+    // Comment lines carry the run's context, the analyzer skips them for the CSV itself
+    fprintf(out, "# kernel=%s\n# iterations=%d\n# elapsed_seconds=%.6f\n", uts.release, iterations, elapsed_time);
+    fprintf(out, "%slow_ns,high_ns,count\n", notes);
+    for (unsigned i = 0; i < HIST_BUCKETS; i++) {
+        if (histogram[i])
+            fprintf(out, "%lu,%lu,%lu\n", (unsigned long)hist_bucket_low(i),
+                    (unsigned long)hist_bucket_low(i + 1), (unsigned long)histogram[i]);
+    }
+    fclose(out);
+}
+
+static inline uint64_t now_ns(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (uint64_t)ts.tv_sec * 1000000000ull + ts.tv_nsec;
+}
+
 // Function to invoke the futex syscall
 static int futex(int *uaddr, int futex_op, int val, const struct timespec *timeout, int *uaddr2, int val3) {
     return syscall(SYS_futex, uaddr, futex_op, val, timeout, uaddr2, val3);
@@ -31,8 +103,8 @@ void *waker_thread(void *arg) {
     return NULL;
 }
 
-// Benchmarking function for futex
-void benchmark_futex(int iterations) {
+// Benchmarking function for futex, each wait is timed into the histogram when histogram_path is set
+void benchmark_futex(int iterations, const char *histogram_path) {
     pthread_t thread;
     if (pthread_create(&thread, NULL, waker_thread, &iterations) != 0) {
         perror("pthread_create failed");
@@ -44,12 +116,30 @@ void benchmark_futex(int iterations) {
     struct timespec start, end;
     clock_gettime(CLOCK_MONOTONIC, &start);
 
-    for (int i = 0; i < iterations; i++) {
-        futex_var = 0; // Reset futex_var before waiting
-        if (futex(&futex_var, FUTEX_WAIT, 0, &ts, NULL, 0) == -1 && errno != EAGAIN) {
-            //perror("futex_wait failed");
-	    continue;
-            exit(EXIT_FAILURE);
+    if (histogram_path) {
+        for (int i = 0; i < iterations; i++) {
+            futex_var = 0; // Reset futex_var before waiting
+            uint64_t before = now_ns();
+            int ret = futex(&futex_var, FUTEX_WAIT, 0, &ts, NULL, 0);
+            uint64_t after = now_ns();
+            histogram[hist_bucket(after - before)]++;
+            if (ret == 0)
+                outcome_woken++;
+            else if (errno == ETIMEDOUT)
+                outcome_timeout++;
+            else if (errno == EAGAIN)
+                outcome_eagain++;
+            else
+                outcome_other++;
+        }
+    } else {
+        for (int i = 0; i < iterations; i++) {
+            futex_var = 0; // Reset futex_var before waiting
+            if (futex(&futex_var, FUTEX_WAIT, 0, &ts, NULL, 0) == -1 && errno != EAGAIN) {
+                //perror("futex_wait failed");
+                continue;
+                exit(EXIT_FAILURE);
+            }
         }
     }
 
@@ -59,22 +149,231 @@ void benchmark_futex(int iterations) {
     double elapsed_time = (end.tv_sec - start.tv_sec) + (end.tv_nsec - start.tv_nsec) / 1e9;
     printf("Futex benchmark completed: %d iterations in %.6f seconds.\n", iterations, elapsed_time);
     printf("Average Futex syscall based on %d iterations is %.6f seconds.\n",iterations,elapsed_time/iterations);
+
+    if (histogram_path) {
+        uint64_t total = outcome_woken + outcome_timeout + outcome_eagain + outcome_other;
+        printf("Wait latency p50 %lu ns, p99 %lu ns, p99.9 %lu ns, max %lu ns "
+               "(woken %lu, timed out %lu, EAGAIN %lu).\n",
+               (unsigned long)hist_percentile(0.50, total), (unsigned long)hist_percentile(0.99, total),
+               (unsigned long)hist_percentile(0.999, total), (unsigned long)hist_percentile(1.0, total),
+               (unsigned long)outcome_woken, (unsigned long)outcome_timeout, (unsigned long)outcome_eagain);
+        char notes[256];
+        snprintf(notes, sizeof(notes), "# woken=%lu\n# timeout=%lu\n# eagain=%lu\n# other_error=%lu\n",
+                 (unsigned long)outcome_woken, (unsigned long)outcome_timeout,
+                 (unsigned long)outcome_eagain, (unsigned long)outcome_other);
+        write_histogram(histogram_path, iterations, elapsed_time, notes);
+        printf("Latency histogram written to %s\n", histogram_path);
+    }
+}
+
+/*
+ * Contention mode: threads take and release futex-based mutexes ("Futexes Are Tricky",
+ * mutex 3: 0 unlocked, 1 locked, 2 locked with waiters), thread i using word i % words.
+ * One word makes every thread contend on the same futex hash bucket and wake path,
+ * one word per thread takes contention away; in between the words are shared by groups.
+ */
+#define MAX_THREADS 256
+
+struct futex_word {
+    int value;
+    unsigned long counter; // Protected by value, the critical section
+} __attribute__((aligned(64))); // Own cache line, so sharded words do not false share
+
+struct contender {
+    pthread_t thread;
+    int id;
+    int cpu;                // -1 when not pinned
+    struct futex_word *word;
+    int iterations;
+    uint64_t waits, wakes;  // futex syscalls made
+    uint64_t start_ns, end_ns; // Own loop, the main thread may be scheduled much later
+    uint64_t histogram[HIST_BUCKETS];
+};
+
+static struct futex_word words[MAX_THREADS];
+static struct contender contenders[MAX_THREADS];
+static pthread_barrier_t start_barrier;
+
+static inline void mutex_lock(struct contender *self) {
+    int *value = &self->word->value;
+    int c = 0;
+    if (__atomic_compare_exchange_n(value, &c, 1, 0, __ATOMIC_ACQUIRE, __ATOMIC_RELAXED))
+        return;
+    if (c != 2)
+        c = __atomic_exchange_n(value, 2, __ATOMIC_ACQUIRE);
+    while (c != 0) {
+        futex(value, FUTEX_WAIT_PRIVATE, 2, NULL, NULL, 0);
+        self->waits++;
+        c = __atomic_exchange_n(value, 2, __ATOMIC_ACQUIRE);
+    }
+}
+
+static inline void mutex_unlock(struct contender *self) {
+    int *value = &self->word->value;
+    if (__atomic_fetch_sub(value, 1, __ATOMIC_RELEASE) != 1) {
+        __atomic_store_n(value, 0, __ATOMIC_RELEASE);
+        futex(value, FUTEX_WAKE_PRIVATE, 1, NULL, NULL, 0);
+        self->wakes++;
+    }
+}
+
+static void *contender_thread(void *arg) {
+    struct contender *self = arg;
+    if (self->cpu >= 0) {
+        cpu_set_t set;
+        CPU_ZERO(&set);
+        CPU_SET(self->cpu, &set);
+        if (pthread_setaffinity_np(pthread_self(), sizeof(set), &set) != 0) {
+            fprintf(stderr, "cannot pin thread %d to CPU %d\n", self->id, self->cpu);
+            exit(EXIT_FAILURE);
+        }
+    }
+    pthread_barrier_wait(&start_barrier);
+    self->start_ns = now_ns();
+    for (int i = 0; i < self->iterations; i++) {
+        uint64_t before = now_ns();
+        mutex_lock(self);
+        uint64_t acquired = now_ns();
+        self->word->counter++;
+        mutex_unlock(self);
+        self->histogram[hist_bucket(acquired - before)]++;
+    }
+    self->end_ns = now_ns();
+    return NULL;
+}
+
+// Parse "0,2,4-7" into cpus, returns how many were listed
+static int parse_cpu_list(const char *text, int *cpus, int max) {
+    int count = 0;
+    char *copy = strdup(text), *save = NULL;
+    for (char *part = strtok_r(copy, ",", &save); part; part = strtok_r(NULL, ",", &save)) {
+        int first, last;
+        int fields = sscanf(part, "%d-%d", &first, &last);
+        if (fields < 1) {
+            fprintf(stderr, "bad CPU list: %s\n", text);
+            exit(EXIT_FAILURE);
+        }
+        if (fields == 1)
+            last = first;
+        for (int cpu = first; cpu <= last && count < max; cpu++)
+            cpus[count++] = cpu;
+    }
+    free(copy);
+    return count;
+}
+
+void benchmark_contention(int iterations, int threads, int nwords, const char *cpu_list,
+                          const char *histogram_path) {
+    int cpus[MAX_THREADS];
+    int ncpus = cpu_list ? parse_cpu_list(cpu_list, cpus, MAX_THREADS) : 0;
+
+    pthread_barrier_init(&start_barrier, NULL, threads);
+    for (int i = 0; i < threads; i++) {
+        struct contender *c = &contenders[i];
+        c->id = i;
+        c->cpu = ncpus ? cpus[i % ncpus] : -1; // Threads are placed round robin over the list
+        c->word = &words[i % nwords];
+        c->iterations = iterations;
+        if (pthread_create(&c->thread, NULL, contender_thread, c) != 0) {
+            perror("pthread_create failed");
+            exit(EXIT_FAILURE);
+        }
+    }
+
+    // The run lasts from the first contender's start to the last one's end
+    uint64_t start = UINT64_MAX, end = 0;
+    for (int i = 0; i < threads; i++) {
+        pthread_join(contenders[i].thread, NULL);
+        if (contenders[i].start_ns < start)
+            start = contenders[i].start_ns;
+        if (contenders[i].end_ns > end)
+            end = contenders[i].end_ns;
+    }
+    double elapsed_time = (end - start) / 1e9;
+
+    uint64_t waits = 0, wakes = 0, total = 0;
+    for (int i = 0; i < threads; i++) {
+        waits += contenders[i].waits;
+        wakes += contenders[i].wakes;
+        for (unsigned b = 0; b < HIST_BUCKETS; b++)
+            histogram[b] += contenders[i].histogram[b];
+    }
+    total = (uint64_t)iterations * threads;
+
+    printf("Futex contention completed: %d threads x %d iterations on %d futex words in %.6f seconds.\n",
+           threads, iterations, nwords, elapsed_time);
+    // One line for scripts, see futex_sweep.py
+    printf("RESULT threads=%d words=%d cpus=%s ops=%lu seconds=%.6f ops_per_sec=%.1f "
+           "futex_waits=%lu futex_wakes=%lu p50_ns=%lu p99_ns=%lu p999_ns=%lu max_ns=%lu\n",
+           threads, nwords, cpu_list ? cpu_list : "-", (unsigned long)total, elapsed_time, total / elapsed_time,
+           (unsigned long)waits, (unsigned long)wakes,
+           (unsigned long)hist_percentile(0.50, total), (unsigned long)hist_percentile(0.99, total),
+           (unsigned long)hist_percentile(0.999, total), (unsigned long)hist_percentile(1.0, total));
+
+    if (histogram_path) {
+        char notes[512];
+        snprintf(notes, sizeof(notes), "# mode=contention\n# threads=%d\n# words=%d\n# cpus=%s\n"
+                 "# futex_waits=%lu\n# futex_wakes=%lu\n", threads, nwords, cpu_list ? cpu_list : "-",
+                 (unsigned long)waits, (unsigned long)wakes);
+        write_histogram(histogram_path, iterations, elapsed_time, notes);
+        printf("Latency histogram written to %s\n", histogram_path);
+    }
+}
+
+static void usage(const char *name) {
+    fprintf(stderr, "Usage: %s [-H histogram.csv] [-t threads [-w words] [-c cpus]] <iterations>\n", name);
+    fprintf(stderr, "  -H FILE  time every wait and write a log-linear latency histogram as CSV\n");
+    fprintf(stderr, "  -t N     contention mode: N threads lock and unlock futex mutexes, iterations each\n");
+    fprintf(stderr, "  -w N     futex words the threads are spread over (default 1, all contend)\n");
+    fprintf(stderr, "  -c LIST  pin thread i to the i-th CPU of LIST (round robin), e.g. 0,2 or 0-3\n");
 }
 
 int main(int argc, char *argv[]) {
-    if (argc != 2) {
-        fprintf(stderr, "Usage: %s <iterations>\n", argv[0]);
+    const char *histogram_path = NULL;
+    const char *cpu_list = NULL;
+    int threads = 0, nwords = 1;
+    int opt;
+    while ((opt = getopt(argc, argv, "H:t:w:c:")) != -1) {
+        switch (opt) {
+        case 'H':
+            histogram_path = optarg;
+            break;
+        case 't':
+            threads = atoi(optarg);
+            break;
+        case 'w':
+            nwords = atoi(optarg);
+            break;
+        case 'c':
+            cpu_list = optarg;
+            break;
+        default:
+            usage(argv[0]);
+            return EXIT_FAILURE;
+        }
+    }
+    if (optind != argc - 1) {
+        usage(argv[0]);
         return EXIT_FAILURE;
     }
 
-    int iterations = atoi(argv[1]);
+    int iterations = atoi(argv[optind]);
     if (iterations <= 0) {
         fprintf(stderr, "Iterations must be a positive integer.\n");
         return EXIT_FAILURE;
     }
 
+    if (threads) {
+        if (threads < 1 || threads > MAX_THREADS || nwords < 1 || nwords > threads) {
+            fprintf(stderr, "Threads must be 1-%d and words 1-threads.\n", MAX_THREADS);
+            return EXIT_FAILURE;
+        }
+        benchmark_contention(iterations, threads, nwords, cpu_list, histogram_path);
+        return EXIT_SUCCESS;
+    }
+
     printf("Starting futex benchmark with %d iterations...\n", iterations);
-    benchmark_futex(iterations);
+    benchmark_futex(iterations, histogram_path);
 
     return EXIT_SUCCESS;
 }
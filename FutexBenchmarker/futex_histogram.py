@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Compare futex wait latency percentiles across kernels from the histograms that
+`futex_benchmark -H futex_hist-$(uname -r).csv` writes (see run.sh).
+
+Histograms of the same kernel are added together. Percentiles are the upper bound of the
+bucket that holds them, so they overstate the latency by at most one bucket width (3%).
+
+    python3 futex_histogram.py                       # every futex_hist-*.csv in this folder
+    python3 futex_histogram.py --baseline 5.15.173 --format csv
+"""
+import argparse
+import csv
+import json
+import math
+import re
+import sys
+from collections import Counter, defaultdict
+from pathlib import Path
+
+PERCENTILES = [('p50', 0.50), ('p99', 0.99), ('p99.9', 0.999)]
+OUTCOMES = ['woken', 'timeout', 'eagain', 'other_error']
+
+def kernel_sort_key(kernel):
+    """Release strings in numeric order, 5.4.0-150-generic < 5.10.16 < 6.12.1"""
+    return [int(part) if part.isdigit() else part for part in re.split(r'[.-]', kernel)]
+
+def read_histogram(path):
+    """
+    Returns (metadata from the comment lines, Counter of {(low_ns, high_ns): waits}).
+    """
+    metadata = {}
+    buckets = Counter()
+    with open(path, newline='') as f:
+        lines = []
+        for line in f:
+            if line.startswith('#'):
+                key, _, value = line[1:].strip().partition('=')
+                metadata[key] = value
+            else:
+                lines.append(line)
+    for row in csv.DictReader(lines):
+        buckets[(int(row['low_ns']), int(row['high_ns']))] += int(row['count'])
+    if 'kernel' not in metadata:
+        metadata['kernel'] = Path(path).stem.replace('futex_hist-', '', 1)
+    return metadata, buckets
+
+def histogram_percentile(buckets, fraction):
+    """Upper bound of the bucket holding the nearest-rank percentile, in nanoseconds"""
+    total = sum(buckets.values())
+    # Rounded first so that 0.999 * 20000 is rank 19980, not 19981
+    rank = max(1, math.ceil(round(fraction * total, 6)))
+    seen = 0
+    for (low, high), count in sorted(buckets.items()):
+        seen += count
+        if seen >= rank:
+            return high
+    return float('nan')
+
+def summarize(buckets, outcomes):
+    total = sum(buckets.values())
+    row = {'waits': total}
+    for name, fraction in PERCENTILES:
+        row[name] = histogram_percentile(buckets, fraction) / 1000.0
+    row['max'] = max(high for low, high in buckets) / 1000.0
+    # Bucket midpoints, close enough for a mean
+    row['mean'] = round(sum((low + high) / 2 * count for (low, high), count in buckets.items()) / total / 1000.0, 3)
+    row.update(outcomes)
+    return row
+
+def load_kernels(paths):
+    """{kernel: summary row} with the histograms of every kernel merged"""
+    merged = defaultdict(Counter)
+    outcomes = defaultdict(Counter)
+    for path in paths:
+        metadata, buckets = read_histogram(path)
+        merged[metadata['kernel']].update(buckets)
+        outcomes[metadata['kernel']].update({name: int(metadata.get(name, 0)) for name in OUTCOMES})
+    return {kernel: dict(kernel=kernel, **summarize(merged[kernel], outcomes[kernel]))
+            for kernel in sorted(merged, key=kernel_sort_key)}
+
+def compare(rows, baseline):
+    """Percent change of every percentile against the baseline kernel"""
+    base = rows[baseline]
+    for row in rows.values():
+        for name in [name for name, _ in PERCENTILES] + ['max']:
+            row[f'{name}_change_pct'] = round((row[name] / base[name] - 1) * 100, 1) if base[name] else None
+    return list(rows.values())
+
+def print_report(rows, baseline):
+    print(f"\nFutex wait latency (μs, change vs {baseline})")
+    print("=" * 96)
+    print(f"{'kernel':<20} {'waits':>10} {'p50':>16} {'p99':>16} {'p99.9':>16} {'max':>16} {'timeouts':>9}")
+    for row in rows:
+        cells = [f"{row[name]:>8.1f} ({row[name + '_change_pct']:>+5.1f}%)" if row[name + '_change_pct'] is not None
+                 else f"{row[name]:>16.1f}" for name in ['p50', 'p99', 'p99.9', 'max']]
+        print(f"{row['kernel']:<20} {row['waits']:>10,} {' '.join(cells)} {row['timeout']:>9,}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare futex wait latency histograms across kernels")
+    parser.add_argument('files', nargs='*', help="histogram CSVs (default: futex_hist-*.csv next to this script)")
+    parser.add_argument('--baseline', help="kernel the others are compared with (default: the oldest)")
+    parser.add_argument('--format', choices=['text', 'json', 'csv'], default='text')
+    parser.add_argument('--output', help="write the json or csv report to this file instead of stdout")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    paths = args.files or sorted(Path(__file__).resolve().parent.glob('futex_hist-*.csv'))
+    if not paths:
+        print("Error: no histogram files found, run `futex_benchmark -H futex_hist-$(uname -r).csv N`",
+              file=sys.stderr)
+        sys.exit(1)
+    kernels = load_kernels(paths)
+    baseline = args.baseline or next(iter(kernels))
+    if baseline not in kernels:
+        print(f"Error: no histogram for baseline kernel {baseline}", file=sys.stderr)
+        sys.exit(1)
+    rows = compare(kernels, baseline)
+
+    if args.format == 'text':
+        print_report(rows, baseline)
+        return
+    output = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        if args.format == 'csv':
+            writer = csv.DictWriter(output, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            json.dump(rows, output, indent=2)
+            output.write('\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Futex contention sweep: how a kernel's futex hash and wake path scale with the number of
+contending threads, the number of futex words and where the threads run.
+
+Every point runs `futex_benchmark -t THREADS -w WORDS -c CPUS N` in a fresh process:
+
+    words    shared   all threads lock the same futex word
+             sharded  one word per thread, no contention on the lock itself
+    placement
+             same-core     every thread pinned to one logical CPU
+             smt           threads spread over the SMT siblings of one core
+             socket        one thread per physical core of one socket
+             cross-socket  physical cores taken alternately from two sockets
+
+Placements the machine cannot provide for a thread count (no SMT, a single socket, too
+few cores) are skipped. Results are appended to futex_sweep/futex_sweep-<kernel>.csv and
+the tables of every kernel swept so far are printed with --report:
+
+    python3 futex_sweep.py --threads 1,2,4,8 --iterations 200000
+    python3 futex_sweep.py --report
+"""
+import argparse
+import csv
+import os
+import platform
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+BENCHMARK = HERE / 'futex_benchmark'
+PLACEMENTS = ['same-core', 'smt', 'socket', 'cross-socket']
+WORDS = ['shared', 'sharded']
+# Taken from the RESULT line futex_benchmark prints
+MEASURED_FIELDS = ['ops', 'seconds', 'ops_per_sec', 'futex_waits', 'futex_wakes', 'p50_ns', 'p99_ns', 'p999_ns', 'max_ns']
+RESULT_FIELDS = ['kernel', 'threads', 'words', 'placement', 'cpus', 'iterations'] + MEASURED_FIELDS + ['status']
+
+def parse_int_list(text):
+    return [int(value) for value in text.split(',')]
+
+def parse_cpu_list(text):
+    """'0-3,8' -> [0, 1, 2, 3, 8]"""
+    cpus = []
+    for part in text.strip().split(','):
+        if part:
+            first, _, last = part.partition('-')
+            cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+def read_topology(allowed):
+    """{cpu: (socket, core)} for the CPUs this process may run on, from sysfs"""
+    topology = {}
+    for cpu in allowed:
+        base = Path(f'/sys/devices/system/cpu/cpu{cpu}/topology')
+        try:
+            socket = int((base / 'physical_package_id').read_text())
+            core = int((base / 'core_id').read_text())
+        except (OSError, ValueError):
+            socket, core = 0, cpu  # No topology exported, every CPU its own core
+        topology[cpu] = (socket, core)
+    return topology
+
+def placement_cpus(placement, threads, topology):
+    """
+    The CPUs thread i of a point is pinned to (futex_benchmark places them round robin),
+    or None when the machine cannot provide the placement for this many threads.
+    """
+    cores = defaultdict(list)           # (socket, core) -> logical CPUs
+    for cpu, key in sorted(topology.items()):
+        cores[key].append(cpu)
+    sockets = defaultdict(list)         # socket -> first logical CPU of each core
+    for (socket, core), cpus in sorted(cores.items()):
+        sockets[socket].append(cpus[0])
+
+    if placement == 'same-core':
+        return [min(topology)]
+    if placement == 'smt':
+        siblings = max(cores.values(), key=len)
+        # Single threaded points have nothing to share a core with
+        return siblings if len(siblings) > 1 and threads > 1 else None
+    if placement == 'socket':
+        socket = max(sockets.values(), key=len)
+        return socket[:threads] if len(socket) >= threads else None
+    if placement == 'cross-socket':
+        if len(sockets) < 2 or threads < 2:
+            return None
+        first, second = sorted(sockets.values(), key=len, reverse=True)[:2]
+        if len(first) + len(second) < threads or min(len(first), len(second)) < threads // 2:
+            return None
+        alternating = [cpu for pair in zip(first, second) for cpu in pair]
+        return alternating[:threads]
+    raise ValueError(placement)
+
+def build_benchmark():
+    """Compile futex_benchmark when it is missing or older than futex_bench.c"""
+    source = HERE / 'futex_bench.c'
+    if not BENCHMARK.exists() or BENCHMARK.stat().st_mtime < source.stat().st_mtime:
+        print(f"Building {BENCHMARK.name}...", file=sys.stderr)
+        subprocess.run(['gcc', '-O2', '-o', str(BENCHMARK), str(source), '-pthread'], check=True)
+
+def run_point(threads, words, cpus, iterations):
+    """Run one point, returns the key=value pairs of its RESULT line or None"""
+    cmd = [str(BENCHMARK), '-t', str(threads), '-w', str(words), '-c', ','.join(map(str, cpus)), str(iterations)]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    match = re.search(r'^RESULT (.*)$', result.stdout, re.M)
+    if result.returncode != 0 or not match:
+        print(result.stderr.strip() or "futex_benchmark failed", file=sys.stderr)
+        return None
+    return dict(pair.split('=', 1) for pair in match.group(1).split())
+
+def append_result(results_file, row):
+    new_file = not results_file.exists()
+    with open(results_file, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        if new_file:
+            writer.writeheader()
+        writer.writerow(row)
+
+def read_results(results_file):
+    with open(results_file, newline='') as f:
+        return [row for row in csv.DictReader(f) if row['status'] == 'ok']
+
+def print_sweep_table(kernel, rows):
+    """Lock operations/s and p99 acquire latency per (words, placement) and thread count"""
+    if not rows:
+        print(f"\nNo successful runs on {kernel}")
+        return
+    table = defaultdict(lambda: defaultdict(list))
+    threads = sorted({int(row['threads']) for row in rows})
+    for row in rows:
+        # Repeated points are averaged
+        table[(row['words'], row['placement'])][int(row['threads'])].append(row)
+
+    print(f"\nFutex contention on {kernel} (Mops/s / p99 ns to acquire):")
+    print(f"{'words':<8} {'placement':<13}" + ''.join(f"{f'{count} thr':>17}" for count in threads))
+    order = {name: position for position, name in enumerate(WORDS + PLACEMENTS)}
+    for config in sorted(table, key=lambda config: (order[config[0]], order[config[1]])):
+        line = f"{config[0]:<8} {config[1]:<13}"
+        for count in threads:
+            points = table[config].get(count)
+            if not points:
+                line += f"{'-':>17}"
+                continue
+            ops = sum(float(row['ops_per_sec']) for row in points) / len(points) / 1e6
+            p99 = sum(float(row['p99_ns']) for row in points) / len(points)
+            line += f"{ops:>8.2f} / {p99:>6.0f}"
+        print(line)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Futex contention sweep over threads, futex words and CPU placement")
+    parser.add_argument('--threads', type=parse_int_list, default=[1, 2, 4, 8], help="thread counts (default: 1,2,4,8)")
+    parser.add_argument('--words', type=lambda text: text.split(','), default=WORDS,
+                        help="shared and/or sharded (default: both)")
+    parser.add_argument('--placements', type=lambda text: text.split(','), default=PLACEMENTS,
+                        help=f"subset of {','.join(PLACEMENTS)} (default: all)")
+    parser.add_argument('--cpus', type=parse_cpu_list, help="CPUs the sweep may use (default: this process's affinity)")
+    parser.add_argument('--iterations', type=int, default=200000, help="lock/unlock pairs per thread (default: 200000)")
+    parser.add_argument('--repetitions', type=int, default=1, help="runs of every point (default: 1)")
+    parser.add_argument('--output-dir', default=str(HERE / 'futex_sweep'), help="where futex_sweep-<kernel>.csv is kept")
+    parser.add_argument('--report', action='store_true', help="only print the tables of the results already there")
+    args = parser.parse_args()
+    for name, allowed in [('words', WORDS), ('placements', PLACEMENTS)]:
+        unknown = set(getattr(args, name)) - set(allowed)
+        if unknown:
+            parser.error(f"unknown {name}: {', '.join(sorted(unknown))}")
+    return args
+
+def main():
+    args = parse_args()
+    output_dir = Path(args.output_dir)
+    if args.report:
+        results = sorted(output_dir.glob('futex_sweep-*.csv'))
+        if not results:
+            print(f"Error: no futex_sweep-*.csv files in {output_dir}", file=sys.stderr)
+            sys.exit(1)
+        for results_file in results:
+            print_sweep_table(results_file.stem[len('futex_sweep-'):], read_results(results_file))
+        return
+
+    build_benchmark()
+    kernel = platform.release()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    results_file = output_dir / f"futex_sweep-{kernel}.csv"
+    topology = read_topology(args.cpus or sorted(os.sched_getaffinity(0)))
+
+    points = [(threads, words, placement) for threads in args.threads for words in args.words
+              for placement in args.placements]
+    total = len(points) * args.repetitions
+    for number, (threads, words, placement) in enumerate(points * args.repetitions, 1):
+        cpus = placement_cpus(placement, threads, topology)
+        if cpus is None:
+            print(f"[{number}/{total}] skipping {threads} threads {placement}: "
+                  f"not available on this machine", file=sys.stderr)
+            continue
+        word_count = 1 if words == 'shared' else threads
+        print(f"[{number}/{total}] {threads} threads, {words} words, {placement} on CPUs {','.join(map(str, cpus))}")
+        stats = run_point(threads, word_count, cpus, args.iterations)
+        row = {field: '' for field in RESULT_FIELDS}
+        row.update(kernel=kernel, threads=threads, words=words, placement=placement,
+                   cpus=' '.join(map(str, cpus)), iterations=args.iterations, status='ok' if stats else 'failed')
+        if stats:
+            row.update({field: stats[field] for field in MEASURED_FIELDS})
+            print(f"    {float(stats['ops_per_sec']) / 1e6:.2f} Mops/s, p99 {stats['p99_ns']} ns, "
+                  f"{stats['futex_waits']} waits")
+        append_result(results_file, row)
+
+    print(f"\nResults appended to {results_file}")
+    print_sweep_table(kernel, read_results(results_file))
+
+if __name__ == '__main__':
+    main()
@@ -2,3 +2,9 @@
 gcc -o futex_benchmark futex_bench.c -pthread
 
 ./futex_benchmark 1000000 > futex_benchmark-$(uname -r).txt
+
+# Same workload with every wait timed, for tail latency (compare kernels with futex_histogram.py)
+./futex_benchmark -H futex_hist-$(uname -r).csv 1000000 > futex_benchmark-hist-$(uname -r).txt
+
+# Contention scaling over threads, shared/sharded futex words and CPU placement (futex_sweep/)
+python3 futex_sweep.py
@@ -1,10 +1,18 @@
 import pandas as pd
 import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
 from pathlib import Path
 import re
 from packaging import version
+import sys
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'Common'))
+from trace_store import load_or_build
+
+METRICS = ['kbest', 'average']
+# Repetitions a version needs on both sides of a comparison before its noise can be judged
+MIN_REPETITIONS = 2
 
 def extract_version(filename):
     """
@@ -65,62 +73,156 @@ def test_name_sort_key(test_name):
     
     return (group_order, number, clean_name)
 
-def read_benchmark_csv(file_path):
+def extract_kernel(filename):
+    """
+    Extract the full kernel release from a LEBench output filename
+    Example: 'LEBenchoutput.5.4.0-84-generic.csv' -> '5.4.0-84-generic'
+    """
+    name = Path(filename).name
+    name = re.sub(r'^LEBenchoutput\.', '', name)
+    return re.sub(r'\.csv$', '', name)
+
+def parse_benchmark_csv(file_path):
+    """
+    Parse a benchmark CSV file with vectorized string operations.
+    Returns a DataFrame with columns test, metric ('kbest'/'average') and value.
+    """
+    # Read CSV, skip the first row which contains the header
+    df = pd.read_csv(file_path, header=0, names=['test', 'value', 'empty'], dtype=str)
+
+    # Split "   getpid          kbest:" into test name and type (kbest/average)
+    parts = df['test'].str.strip().str.extract(r'^(?P<test>.*?)\s*(?P<metric>kbest|average):$')
+    values = pd.to_numeric(df['value'].str.strip(), errors='coerce')
+
+    rows = parts['metric'].notna()
+    bad = rows & values.isna()
+    for test_name, raw in zip(parts.loc[bad, 'test'], df.loc[bad, 'value']):
+        print(f"Warning: Could not convert value for {test_name}: {raw}")
+
+    rows &= values.notna() & ~np.isinf(values)
+    return pd.DataFrame({
+        'test': parts.loc[rows, 'test'].to_numpy(),
+        'metric': parts.loc[rows, 'metric'].to_numpy(),
+        'value': values[rows].to_numpy(dtype=np.float64),
+    })
+
+def build_lebench_store(file_path):
+    """
+    Columnar form of a benchmark CSV for the trace store: interned test and metric ids plus values
     """
-    Read and process a benchmark CSV file.
-    Returns a dictionary of test names and their 'kbest' values.
+    df = parse_benchmark_csv(file_path)
+    test_ids, tests = pd.factorize(df['test'])
+    columns = {
+        'test': test_ids.astype(np.uint16),
+        'metric': df['metric'].map(METRICS.index).to_numpy(dtype=np.uint8),
+        'value': df['value'].to_numpy(dtype=np.float64),
+    }
+    return columns, {'test': list(tests), 'metric': METRICS}
+
+def read_benchmark_frame(file_path):
+    """
+    Read one benchmark CSV file through the trace store cache.
+    Returns a long-format DataFrame with columns kernel, test, metric, value and source.
     """
     try:
-        # Read CSV, skip the first row which contains the header
-        df = pd.read_csv(file_path, header=0, names=['test', 'value', 'empty'])
-        
-        # Initialize dictionary to store results
-        results = {}
-        
-        # Process each row
-        for _, row in df.iterrows():
-            # Get test name and type (kbest/average)
-            test_info = str(row['test']).strip()
-            if not isinstance(test_info, str) or pd.isna(test_info):
-                continue
-            
-            # Split into test name and type
-            if 'kbest:' in test_info:
-                test_name = test_info.replace('kbest:', '').strip()
-                try:
-                    value = float(row['value'])
-                    if not (pd.isna(value) or np.isinf(value)):
-                        results[test_name] = value
-                except (ValueError, TypeError) as e:
-                    print(f"Warning: Could not convert value for {test_name}: {row['value']}")
-                    continue
-        
-        return results
+        store = load_or_build(file_path, 'lebench', build_lebench_store)
     except Exception as e:
         print(f"Error reading {file_path}: {e}")
-        return {}
+        return pd.DataFrame(columns=['kernel', 'test', 'metric', 'value', 'source'])
 
-def combine_version_data(data):
+    tests = np.array(store.tables['test'], dtype=object)
+    metrics = np.array(store.tables['metric'], dtype=object)
+    return pd.DataFrame({
+        'kernel': extract_kernel(file_path),
+        'test': tests[np.asarray(store.columns['test'], dtype=np.intp)],
+        'metric': metrics[np.asarray(store.columns['metric'], dtype=np.intp)],
+        'value': np.asarray(store.columns['value']),
+        'source': Path(file_path).name,
+    })
+
+def load_benchmark_frame(csv_files, jobs=None):
     """
-    Combine multiple measurements for the same major.minor version by taking the minimum value
+    Load all benchmark CSV files into one long-format DataFrame, parsing files in parallel.
+    Both the 'kbest' and 'average' metrics are kept.
     """
-    combined_data = {}
-    for version, measurements in data.items():
-        if version not in combined_data:
-            combined_data[version] = measurements
-        else:
-            # For each test, take the minimum value (best performance)
-            for test, value in measurements.items():
-                if test in combined_data[version]:
-                    combined_data[version][test] = min(combined_data[version][test], value)
-                else:
-                    combined_data[version][test] = value
-    return combined_data
+    csv_files = list(csv_files)
+    jobs = min(jobs or os.cpu_count() or 1, len(csv_files))
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            frames = list(executor.map(read_benchmark_frame, csv_files))
+    else:
+        frames = [read_benchmark_frame(file) for file in csv_files]
+
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=['kernel', 'test', 'metric', 'value', 'source'])
+    return pd.concat(frames, ignore_index=True)
 
-def create_heatmap(csv_folder, center_version):
+def collect_repetitions(frame, metric='kbest'):
     """
-    Create a heatmap showing relative performance differences.
+    Group every repetition of each (major.minor version, test) pair.
+    Each CSV file is one repetition, so files that map to the same version
+    (e.g. 5.4.0-84-generic and 5.4.0-150-generic) are all kept.
+    Returns {(version, test): numpy array of values}.
     """
+    rows = frame[frame['metric'] == metric]
+    versions = rows['source'].map(extract_version)
+    return {key: group.to_numpy(dtype=np.float64)
+            for key, group in rows['value'].groupby([versions, rows['test']], sort=False)}
+
+def bootstrap_medians(values, n_boot, rng):
+    """
+    Medians of n_boot bootstrap resamples of values
+    """
+    samples = rng.choice(values, size=(n_boot, len(values)), replace=True)
+    return np.median(samples, axis=1)
+
+def aggregate_repetitions(repetitions, n_boot=2000, confidence=0.95, seed=0):
+    """
+    Summarize the repetitions of each (version, test) pair with the median,
+    spread (IQR, min, max) and a bootstrap confidence interval of the median.
+    """
+    rng = np.random.default_rng(seed)
+    alpha = (1 - confidence) / 2
+    rows = []
+    for (version, test), values in repetitions.items():
+        medians = bootstrap_medians(values, n_boot, rng)
+        q1, q3 = np.percentile(values, [25, 75])
+        rows.append({
+            'version': version,
+            'test': test,
+            'n': len(values),
+            'median': np.median(values),
+            'iqr': q3 - q1,
+            'min': values.min(),
+            'max': values.max(),
+            'ci_low': np.quantile(medians, alpha),
+            'ci_high': np.quantile(medians, 1 - alpha),
+        })
+    return pd.DataFrame(rows)
+
+def relative_change(values, center_values, n_boot=2000, confidence=0.95, rng=None):
+    """
+    Percentage change of the median of values against the median of center_values,
+    with a bootstrap confidence interval of that change.
+    Returns (change, ci_low, ci_high).
+    """
+    rng = rng if rng is not None else np.random.default_rng(0)
+    alpha = (1 - confidence) / 2
+    center = np.median(center_values)
+    change = (np.median(values) - center) / center * 100
+    boot_changes = (bootstrap_medians(values, n_boot, rng) / bootstrap_medians(center_values, n_boot, rng) - 1) * 100
+    return change, np.quantile(boot_changes, alpha), np.quantile(boot_changes, 1 - alpha)
+
+def create_heatmap(csv_folder, center_version, summary_file='performance_summary.csv'):
+    """
+    Create a heatmap showing relative performance differences, and write the per-version
+    median, spread and confidence interval of every test to summary_file.
+    """
+    # Plotting libraries are only loaded when an image is requested
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+
     # Get all CSV files
     csv_folder = Path(csv_folder)
     csv_files = sorted(csv_folder.glob('*.csv'))
@@ -128,47 +230,67 @@ def create_heatmap(csv_folder, center_version):
     if not csv_files:
         raise ValueError(f"No CSV files found in {csv_folder}")
     
-    # Read all data
-    data = {}
-    for file in csv_files:
-        version = extract_version(file.name)
-        file_data = read_benchmark_csv(file)
-        if file_data:  # Only add if we got valid data
-            data[version] = file_data
+    # Read all data, keeping every repetition of each version
+    frame = load_benchmark_frame(csv_files)
+    repetitions = collect_repetitions(frame)
     
-    if not data:
+    if not repetitions:
         raise ValueError("No valid data could be read from CSV files")
     
-    # Combine data for same major.minor versions
-    data = combine_version_data(data)
+    summary = aggregate_repetitions(repetitions)
+    summary = summary.sort_values(['version', 'test'], key=lambda column: column.map(
+        version_key if column.name == 'version' else test_name_sort_key))
+    summary.to_csv(summary_file, index=False)
+    
+    data_versions = {version for version, _ in repetitions}
     
     # Verify center version exists
-    if center_version not in data:
-        raise ValueError(f"Center version {center_version} not found in data. Available versions: {list(data.keys())}")
+    if center_version not in data_versions:
+        raise ValueError(f"Center version {center_version} not found in data. Available versions: {sorted(data_versions, key=version_key)}")
     
     # Get all unique tests and sort them using the custom sorting function
-    all_tests = sorted(set().union(*[set(d.keys()) for d in data.values()]), key=test_name_sort_key)
+    all_tests = sorted({test for _, test in repetitions}, key=test_name_sort_key)
     
     # Sort versions properly using version_key function
-    versions = sorted(data.keys(), key=version_key)
+    versions = sorted(data_versions, key=version_key)
     
-    # Create DataFrame for relative differences
+    # Create DataFrames for relative differences of the medians, for cells within noise and
+    # for cells with too few repetitions to tell
     df_relative = pd.DataFrame(index=all_tests, columns=versions, dtype=float)
+    df_noise = pd.DataFrame(False, index=all_tests, columns=versions)
+    df_insufficient = pd.DataFrame(False, index=all_tests, columns=versions)
     
     # Calculate relative differences
-    center_data = data[center_version]
+    rng = np.random.default_rng(0)
     for test in all_tests:
-        if test in center_data and center_data[test] != 0:  # Avoid division by zero
-            center_value = center_data[test]
-            for version in versions:
-                if test in data[version]:
-                    # Calculate percentage difference
-                    relative_diff = ((data[version][test] - center_value) / center_value) * 100
-                    df_relative.at[test, version] = relative_diff
+        center_values = repetitions.get((center_version, test))
+        if center_values is None or np.median(center_values) == 0:  # Avoid division by zero
+            continue
+        for version in versions:
+            values = repetitions.get((version, test))
+            if values is None:
+                continue
+            change, ci_low, ci_high = relative_change(values, center_values, rng=rng)
+            df_relative.at[test, version] = change
+            if version == center_version:
+                continue
+            # With a single repetition on either side the bootstrap interval collapses to
+            # a point, which says nothing about noise
+            if min(len(values), len(center_values)) < MIN_REPETITIONS:
+                df_insufficient.at[test, version] = True
+            # The change is noise when its confidence interval spans zero
+            elif ci_low <= 0 <= ci_high:
+                df_noise.at[test, version] = True
     
     # Fill NaN values with 0 for better visualization
     df_relative = df_relative.fillna(0)
     
+    # Cells whose change is within run-to-run noise are shown in parentheses, cells without
+    # enough repetitions to tell are marked with *
+    annotations = df_relative.apply(lambda column: column.map('{:.0f}'.format))
+    annotations = annotations.where(~df_noise, '(' + annotations + ')')
+    annotations = annotations.where(~df_insufficient, annotations + '*')
+    
     # Create heatmap
     plt.figure(figsize=(20, 12))
     sns.heatmap(df_relative, 
@@ -176,11 +298,13 @@ def create_heatmap(csv_folder, center_version):
                 center=0,
                 vmin=-50,
                 vmax=150,
-                annot=True,
-                fmt='.0f',
+                annot=annotations,
+                fmt='',
                 cbar_kws={'label': 'Percentage Change'})
     
-    plt.title(f'Percentage Change in Test Latency Relative to {center_version}')
+    plt.title(f'Percentage Change in Median Test Latency Relative to {center_version}\n'
+              f'(values in parentheses are within run-to-run noise: their 95% bootstrap confidence interval '
+              f'includes 0;\n* marks insufficient data: fewer than {MIN_REPETITIONS} repetitions on either side)')
     plt.xlabel('Linux Version')
     plt.ylabel('Test Name')
     plt.xticks(rotation=45)
@@ -198,6 +322,7 @@ if __name__ == "__main__":
     try:
         create_heatmap(csv_folder, center_version)
         print("Heatmap created successfully as 'performance_heatmap.png'")
+        print("Per-version medians and confidence intervals written to 'performance_summary.csv'")
     except Exception as e:
         print(f"Error: {str(e)}")
         print("\nDebug information:")
@@ -0,0 +1,155 @@
+"""
+Detect changepoints in LEBench latency across kernel versions.
+
+For every test the per-version median latencies are ordered with version_key and
+split recursively (binary segmentation) where the split explains the most variance
+of log latency. A split is kept when a permutation test says it is significant and
+the step is larger than --min-change percent. Each changepoint is reported with the
+first kernel of the new level, the size of the step and its p-value, as JSON or CSV.
+"""
+import argparse
+import csv
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from Grapher import collect_repetitions, load_benchmark_frame, test_name_sort_key, version_key
+
+REPORT_FIELDS = ['test', 'kernel', 'previous_kernel', 'magnitude_pct', 'p_value', 'direction',
+                 'before_median', 'after_median']
+
+def split_gains(series, min_size):
+    """
+    Reduction in the sum of squared errors from fitting two means instead of one,
+    for every allowed split of each row of series.
+    Returns (split positions, gains) with gains shaped like series[..., positions].
+    """
+    n = series.shape[-1]
+    positions = np.arange(min_size, n - min_size + 1)
+    prefix = np.cumsum(series, axis=-1)
+    total = prefix[..., -1:]
+    mean = total / n
+    left_mean = prefix[..., positions - 1] / positions
+    right_mean = (total - prefix[..., positions - 1]) / (n - positions)
+    return positions, positions * (left_mean - mean) ** 2 + (n - positions) * (right_mean - mean) ** 2
+
+def best_split(values, min_size):
+    """
+    Best single split of values into two segments.
+    Returns (split index, gain); index is None if the series is too short to split.
+    """
+    if len(values) < 2 * min_size:
+        return None, 0.0
+    positions, gains = split_gains(values, min_size)
+    best = np.argmax(gains)
+    return int(positions[best]), float(gains[best])
+
+def permutation_p_value(values, observed_gain, min_size, permutations, rng):
+    """
+    Fraction of shuffled series whose best split explains at least as much as the observed one
+    """
+    shuffled = rng.permuted(np.tile(values, (permutations, 1)), axis=1)
+    _, gains = split_gains(shuffled, min_size)
+    hits = np.count_nonzero(gains.max(axis=1) >= observed_gain * (1 - 1e-9))
+    return (hits + 1) / (permutations + 1)
+
+def find_changepoints(values, min_size=2, alpha=0.01, permutations=999, rng=None, offset=0):
+    """
+    Binary segmentation of a series of log latencies.
+    Returns a sorted list of (index, p_value) where index is the first point of a new segment.
+    """
+    rng = rng if rng is not None else np.random.default_rng(0)
+    index, gain = best_split(values, min_size)
+    if index is None or gain <= 0:
+        return []
+    p_value = permutation_p_value(values, gain, min_size, permutations, rng)
+    if p_value > alpha:
+        return []
+    left = find_changepoints(values[:index], min_size, alpha, permutations, rng, offset)
+    right = find_changepoints(values[index:], min_size, alpha, permutations, rng, offset + index)
+    return left + [(offset + index, p_value)] + right
+
+def detect_regressions(repetitions, min_size=2, alpha=0.01, permutations=999, min_change=5.0, seed=0):
+    """
+    Walk the version-ordered median series of every test and report its changepoints.
+    Returns a list of report rows (dicts with REPORT_FIELDS).
+    """
+    rng = np.random.default_rng(seed)
+    tests = sorted({test for _, test in repetitions}, key=test_name_sort_key)
+    report = []
+    for test in tests:
+        versions = sorted((version for version, name in repetitions if name == test), key=version_key)
+        medians = np.array([np.median(repetitions[(version, test)]) for version in versions])
+        if np.any(medians <= 0):
+            # Log scale needs positive latencies
+            continue
+        log_medians = np.log(medians)
+
+        changepoints = find_changepoints(log_medians, min_size, alpha, permutations, rng)
+        bounds = [0] + [index for index, _ in changepoints] + [len(versions)]
+        for k, (index, p_value) in enumerate(changepoints):
+            # Compare the level of the segment before the step with the one after it
+            before = np.exp(np.median(log_medians[bounds[k]:index]))
+            after = np.exp(np.median(log_medians[index:bounds[k + 2]]))
+            magnitude = (after - before) / before * 100
+            if abs(magnitude) < min_change:
+                continue
+            report.append({
+                'test': test,
+                'kernel': versions[index],
+                'previous_kernel': versions[index - 1],
+                'magnitude_pct': round(float(magnitude), 2),
+                'p_value': round(float(p_value), 4),
+                'direction': 'regression' if magnitude > 0 else 'improvement',
+                'before_median': float(before),
+                'after_median': float(after),
+            })
+    return report
+
+def write_report(report, output, fmt):
+    if fmt == 'csv':
+        writer = csv.DictWriter(output, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(report)
+    else:
+        json.dump(report, output, indent=2)
+        output.write('\n')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Detect latency changepoints across kernel versions in LEBench results")
+    parser.add_argument('csv_folder', nargs='?', default='.', help="folder with LEBenchoutput.*.csv files")
+    parser.add_argument('--metric', choices=['kbest', 'average'], default='kbest')
+    parser.add_argument('--alpha', type=float, default=0.01, help="significance level of a changepoint (default: 0.01)")
+    parser.add_argument('--permutations', type=int, default=999, help="permutations per significance test")
+    parser.add_argument('--min-size', type=int, default=2, help="minimum number of versions in a segment")
+    parser.add_argument('--min-change', type=float, default=5.0, help="ignore steps smaller than this percentage")
+    parser.add_argument('--format', choices=['json', 'csv'], default='json')
+    parser.add_argument('--output', help="write the report to this file instead of stdout")
+    parser.add_argument('--fail-on-regression', type=float, metavar='PCT',
+                        help="exit with status 1 if any regression is at least PCT percent")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    csv_files = sorted(Path(args.csv_folder).glob('*.csv'))
+    if not csv_files:
+        print(f"Error: No CSV files found in {args.csv_folder}", file=sys.stderr)
+        sys.exit(2)
+
+    repetitions = collect_repetitions(load_benchmark_frame(csv_files), args.metric)
+    report = detect_regressions(repetitions, args.min_size, args.alpha, args.permutations, args.min_change)
+
+    if args.output:
+        with open(args.output, 'w', newline='') as output:
+            write_report(report, output, args.format)
+    else:
+        write_report(report, sys.stdout, args.format)
+
+    if args.fail_on_regression is not None:
+        if any(row['direction'] == 'regression' and row['magnitude_pct'] >= args.fail_on_regression for row in report):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,523 @@
+#!/usr/bin/env python3
+"""
+Resumable kernel sweep: runs a manifest of (kernel, suite, repetition) jobs across reboots.
+
+kernel_switcher only cycles GRUB entries; this keeps track of what has been measured.
+Every job start and finish is appended (and fsynced) to journal.csv in the state
+directory, so after a reboot, a crash or a kernel that hangs mid-job the scheduler picks
+up where it stopped: finished jobs are never rerun, a job that did not finish is retried
+up to --attempts times, and a kernel that fails to boot that often is given up on.
+
+After every boot the analyses of the kernels that are finished (syscall counts, thread
+rankings, timelines, futex percentiles) run in the background at idle priority while the
+new kernel settles, and are waited for before the first measurement so they cannot
+disturb it. Then the pending jobs of the running kernel are run and the machine reboots
+into the next kernel that has jobs left.
+
+    python3 experiment_scheduler.py init --from-grub --suites futex,sysbench --repetitions 3
+    sudo python3 experiment_scheduler.py run          # installs a systemd unit, reboots as needed
+    python3 experiment_scheduler.py status
+
+The reboot is pluggable: --reboot grub (default, GRUB_DEFAULT + update-grub + reboot like
+kernel_switcher), --reboot simulate (no reboot, the "running kernel" is kept in the state
+directory, for testing the scheduler on one machine) or --reboot MODULE:CLASS. A manifest
+can replace any suite's command, e.g. with a cheap stand-in while testing.
+"""
+import argparse
+import csv
+import importlib
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, namedtuple
+from datetime import datetime
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+ROOT = HERE.parent
+DEFAULT_STATE_DIR = HERE / 'kernel_sweep'
+JOURNAL_FIELDS = ['time', 'event', 'kernel', 'suite', 'repetition', 'returncode', 'seconds', 'detail']
+
+GRUB_CFG = Path('/boot/grub/grub.cfg')
+GRUB_DEFAULTS = Path('/etc/default/grub')
+SERVICE_NAME = 'kernel-sweep.service'
+SERVICE_FILE = Path('/etc/systemd/system') / SERVICE_NAME
+# Where kernel_switcher ran LEBench from, a manifest's "commands" can point elsewhere
+LEBENCH_BINARY = '/home/bigwhoman/Downloads/LEBench/LEBench/TEST_DIR/OS_Eval'
+
+# directory: where the command runs, relative to the repository (None: the job's own
+# directory). artifacts: files the command leaves there, moved into the job's directory
+# when the job wrote them (older files of the same kernel, e.g. committed logs, stay).
+# Commands and patterns may use {kernel}, {job_dir} and {root}.
+Suite = namedtuple('Suite', ['directory', 'command', 'output', 'artifacts'])
+SUITES = {
+    'lebench': Suite(None, [LEBENCH_BINARY, '0', '{kernel}'], '{kernel}.out', []),
+    'futex': Suite('FutexBenchmarker', ['bash', 'run.sh'], 'output.log',
+                   ['futex_benchmark-{kernel}.txt', 'futex_benchmark-hist-{kernel}.txt', 'futex_hist-{kernel}.csv',
+                    'futex_sweep/futex_sweep-{kernel}.csv']),
+    'sysbench': Suite('MySqlBenchmarking', ['bash', 'run_benchmarking.sh'], 'output.log',
+                      ['mysql-{kernel}.strace*', 'mysql-{kernel}.psamp', '{kernel}-log.txt']),
+    'ml': Suite('MLBenchmarking', ['bash', 'run_benchmark.sh', '--dataset', 'synthetic'], 'output.log',
+                ['strace_log-{kernel}-*', 'benchmark_log-{kernel}-*']),
+    'fgraph': Suite('Experimenting', ['bash', 'tracer.sh'], 'output.log', ['{kernel}-X-test']),
+}
+
+# Reports written to <job_dir>/analysis once a kernel is finished, one per file matching
+# inputs (or one per job when inputs is None). The command is a script of this repository.
+Analysis = namedtuple('Analysis', ['name', 'inputs', 'command'])
+ANALYSES = {
+    'futex': [Analysis('futex_histogram', 'futex_hist-*.csv',
+                       ['FutexBenchmarker/futex_histogram.py', '{input}', '--format', 'json'])],
+    'sysbench': [Analysis('sysbench', None, ['linux_eval.py', 'sysbench', '{job_dir}', '--format', 'json']),
+                 Analysis('threads', 'mysql-*.strace*', ['linux_eval.py', 'threads', '{input}', '--format', 'json']),
+                 Analysis('ngrams', 'mysql-*.strace*', ['linux_eval.py', 'ngrams', '{input}', '--format', 'json'])],
+    'ml': [Analysis('syscalls', 'strace_log-*', ['linux_eval.py', 'syscalls', '{input}', '--trace-format', 'ml',
+                                                 '--format', 'json']),
+           Analysis('timeline', 'strace_log-*', ['linux_eval.py', 'timeline', '{input}', '--format', 'json']),
+           Analysis('processes', 'strace_log-*', ['linux_eval.py', 'threads', '{input}', '--processes',
+                                                  '--format', 'json'])],
+}
+
+Job = namedtuple('Job', ['kernel', 'suite', 'repetition'])
+
+def kernel_sort_key(kernel):
+    """Release strings in numeric order, 5.4.0-150-generic < 5.10.16 < 6.12.1"""
+    return [int(part) if part.isdigit() else part for part in re.split(r'[.-]', kernel)]
+
+def expand(text, **values):
+    """Fill in {name} placeholders, leaving any other braces (shell code) alone"""
+    for name, value in values.items():
+        text = text.replace('{' + name + '}', str(value))
+    return text
+
+def grub_kernels(grub_cfg=GRUB_CFG):
+    """{kernel release: menu entry title} of the bootable, non-recovery entries"""
+    entries = {}
+    with open(grub_cfg, errors='replace') as f:
+        for title in re.findall(r"menuentry '([^']*with Linux ([^' ]+))'", f.read()):
+            if 'recovery mode' not in title[0] and not title[1].endswith('.old'):
+                entries[title[1]] = title[0]
+    return entries
+
+class Journal:
+    """Append-only CSV of what happened; every row is on disk before append returns"""
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+
+    def rows(self):
+        if not self.path.exists():
+            return []
+        with open(self.path, newline='') as f:
+            return list(csv.DictReader(f))
+
+    def append(self, event, kernel, suite='', repetition='', returncode='', seconds='', detail=''):
+        with self.lock:
+            new_file = not self.path.exists()
+            with open(self.path, 'a', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=JOURNAL_FIELDS)
+                if new_file:
+                    writer.writeheader()
+                writer.writerow({'time': datetime.now().isoformat(timespec='seconds'), 'event': event,
+                                 'kernel': kernel, 'suite': suite, 'repetition': repetition,
+                                 'returncode': returncode, 'seconds': seconds, 'detail': detail})
+                f.flush()
+                os.fsync(f.fileno())
+            if new_file:
+                directory = os.open(self.path.parent, os.O_RDONLY)
+                try:
+                    os.fsync(directory)
+                finally:
+                    os.close(directory)
+
+class SweepState:
+    """Where every job of the manifest stands, from the journal"""
+    def __init__(self, manifest, rows, attempts):
+        self.manifest = manifest
+        self.attempts = attempts
+        self.started = Counter()
+        self.done = set()
+        self.boot_failures = Counter()
+        self.analyzed = set()
+        for row in rows:
+            if row['event'] in ('start', 'done'):
+                job = Job(row['kernel'], row['suite'], int(row['repetition']))
+                if row['event'] == 'start':
+                    self.started[job] += 1
+                else:
+                    self.done.add(job)
+            elif row['event'] == 'boot_failed':
+                self.boot_failures[row['kernel']] += 1
+            elif row['event'] == 'analyzed':
+                self.analyzed.add(row['kernel'])
+        self.last_event = rows[-1] if rows else None
+
+    def jobs(self, kernel=None):
+        kernels = [kernel] if kernel else self.manifest['kernels']
+        return [Job(name, suite, repetition)
+                for name in kernels if name in self.manifest['kernels']
+                for repetition in range(1, self.manifest['repetitions'] + 1)
+                for suite in self.manifest['suites']]
+
+    def given_up(self, job):
+        return (job not in self.done and self.started[job] >= self.attempts) or \
+               self.boot_failures[job.kernel] >= self.attempts
+
+    def pending(self, kernel=None):
+        return [job for job in self.jobs(kernel) if job not in self.done and not self.given_up(job)]
+
+    def finished_kernels(self):
+        """Kernels with nothing left to run, in manifest order"""
+        return [kernel for kernel in self.manifest['kernels'] if not self.pending(kernel)]
+
+class GrubReboot:
+    """Boots the next kernel the way kernel_switcher does and resumes from a systemd unit"""
+    continues = False       # The scheduler's process ends with the reboot
+
+    def __init__(self, state_dir):
+        self.state_dir = Path(state_dir)
+
+    def current_kernel(self):
+        return platform.release()
+
+    def prepare(self, command):
+        """Make command run after every boot"""
+        if os.geteuid() != 0:
+            raise PermissionError("rebooting through GRUB needs root")
+        quoted = ' '.join('"' + part.replace('\\', '\\\\').replace('"', '\\"') + '"' for part in command)
+        SERVICE_FILE.write_text(f"""[Unit]
+Description=Resumable kernel sweep
+After=network.target
+
+[Service]
+Type=oneshot
+ExecStart={quoted}
+WorkingDirectory={HERE}
+User=root
+RemainAfterExit=yes
+
+[Install]
+WantedBy=multi-user.target
+""")
+        subprocess.run(['systemctl', 'daemon-reload'], check=True)
+        subprocess.run(['systemctl', 'enable', SERVICE_NAME], check=True)
+
+    def finish(self):
+        if SERVICE_FILE.exists():
+            subprocess.run(['systemctl', 'disable', SERVICE_NAME])
+            SERVICE_FILE.unlink()
+            subprocess.run(['systemctl', 'daemon-reload'])
+
+    def reboot_into(self, kernel):
+        entries = grub_kernels()
+        if kernel not in entries:
+            raise ValueError(f"no GRUB entry boots {kernel}")
+        with open(GRUB_CFG, errors='replace') as f:
+            submenu = re.search(r"submenu '([^']*)'", f.read())
+        entry = f"{submenu.group(1)}>{entries[kernel]}" if submenu else entries[kernel]
+        settings = GRUB_DEFAULTS.read_text()
+        GRUB_DEFAULTS.write_text(re.sub(r'^GRUB_DEFAULT=.*$', f'GRUB_DEFAULT="{entry}"', settings, flags=re.MULTILINE))
+        subprocess.run(['update-grub'], check=True)
+        os.sync()
+        subprocess.run(['reboot'], check=True)
+
+class SimulatedReboot(GrubReboot):
+    """Stand-in that switches a recorded kernel name instead of rebooting"""
+    continues = True        # The next "boot" happens in the same process
+
+    @property
+    def kernel_file(self):
+        return self.state_dir / 'simulated_kernel'
+
+    def current_kernel(self):
+        return self.kernel_file.read_text().strip() if self.kernel_file.exists() else platform.release()
+
+    def prepare(self, command):
+        pass
+
+    def finish(self):
+        pass
+
+    def reboot_into(self, kernel):
+        self.kernel_file.write_text(kernel + '\n')
+
+REBOOTS = {'grub': GrubReboot, 'simulate': SimulatedReboot}
+
+def make_reboot(spec, state_dir):
+    """grub, simulate, or MODULE:CLASS with the same methods as GrubReboot"""
+    if spec in REBOOTS:
+        return REBOOTS[spec](state_dir)
+    module, _, name = spec.partition(':')
+    if not name:
+        raise ValueError(f"--reboot must be one of {', '.join(REBOOTS)} or MODULE:CLASS, not {spec!r}")
+    return getattr(importlib.import_module(module), name)(state_dir)
+
+def modified_since(path, since):
+    """Whether path, or for a directory anything in it, was written at or after since"""
+    if path.stat().st_mtime >= since:
+        return True
+    return path.is_dir() and any(child.stat().st_mtime >= since for child in path.rglob('*'))
+
+def job_dir(state_dir, job):
+    return Path(state_dir) / 'results' / job.kernel / f'{job.suite}-{job.repetition}'
+
+def run_job(manifest, state_dir, job):
+    """Run one job with its output and artifacts in its own directory. Returns (returncode, detail)."""
+    suite = SUITES[job.suite]
+    directory = job_dir(state_dir, job)
+    if directory.exists():
+        shutil.rmtree(directory)    # Left by an attempt that did not finish
+    directory.mkdir(parents=True)
+    values = {'kernel': job.kernel, 'job_dir': directory, 'root': ROOT}
+    command = [expand(part, **values) for part in manifest.get('commands', {}).get(job.suite, suite.command)]
+    cwd = ROOT / suite.directory if suite.directory else directory
+    # A second of slack for file systems with coarse timestamps
+    started = time.time() - 1
+    try:
+        with open(directory / expand(suite.output, **values), 'w') as output:
+            returncode = subprocess.run(command, cwd=cwd, stdout=output, stderr=subprocess.STDOUT).returncode
+    except OSError as error:
+        return None, str(error)
+
+    moved = 0
+    if suite.directory:
+        for pattern in suite.artifacts:
+            for path in cwd.glob(expand(pattern, **values)):
+                if not modified_since(path, started):
+                    continue
+                shutil.move(str(path), str(directory / path.name))
+                moved += 1
+    # The results must survive the reboot that follows
+    os.sync()
+    return returncode, f"{moved} artifacts"
+
+def lower_priority():
+    os.nice(19)
+    try:
+        os.sched_setscheduler(0, os.SCHED_IDLE, os.sched_param(0))
+    except (AttributeError, OSError):
+        pass
+
+def analyze_kernel(state, state_dir, kernel):
+    """Write the reports of every finished job of a kernel. Returns (written, failed)."""
+    written = failed = 0
+    for job in state.jobs(kernel):
+        if job not in state.done:
+            continue
+        directory = job_dir(state_dir, job)
+        for analysis in ANALYSES.get(job.suite, []):
+            inputs = sorted(directory.glob(analysis.inputs)) if analysis.inputs else [None]
+            for input_path in inputs:
+                script, *arguments = analysis.command
+                command = [sys.executable, str(ROOT / script)] + [
+                    expand(part, input=input_path, job_dir=directory) for part in arguments]
+                name = f'{analysis.name}-{input_path.name}' if input_path else analysis.name
+                report = directory / 'analysis' / f'{name}.json'
+                report.parent.mkdir(exist_ok=True)
+                with open(report, 'w') as output:
+                    result = subprocess.run(command, cwd=ROOT, stdout=output, stderr=subprocess.PIPE,
+                                            universal_newlines=True, preexec_fn=lower_priority)
+                if result.returncode == 0:
+                    written += 1
+                else:
+                    failed += 1
+                    report.with_suffix('.err').write_text(result.stderr)
+    return written, failed
+
+class BackgroundAnalysis(threading.Thread):
+    """Analyses of finished kernels, run one after the other at idle priority"""
+    def __init__(self, state, state_dir, journal, kernels):
+        super().__init__(name='kernel-analysis', daemon=True)
+        self.state = state
+        self.state_dir = state_dir
+        self.journal = journal
+        self.kernels = kernels
+
+    def run(self):
+        for kernel in self.kernels:
+            start = time.perf_counter()
+            written, failed = analyze_kernel(self.state, self.state_dir, kernel)
+            self.journal.append('analyzed', kernel, seconds=round(time.perf_counter() - start, 1),
+                                detail=f"{written} reports, {failed} failed")
+            print(f"Analysed {kernel}: {written} reports, {failed} failed")
+
+def load_manifest(state_dir):
+    path = Path(state_dir) / 'manifest.json'
+    if not path.exists():
+        raise FileNotFoundError(f"no manifest in {state_dir}, create one with the init command")
+    with open(path) as f:
+        return json.load(f)
+
+def run_sweep(args):
+    state_dir = Path(args.state_dir).resolve()
+    manifest = load_manifest(state_dir)
+    journal = Journal(state_dir / 'journal.csv')
+    reboot = make_reboot(args.reboot, state_dir)
+    command = [sys.executable, str(Path(__file__).resolve()), 'run', '--state-dir', str(state_dir),
+               '--reboot', args.reboot, '--settle', str(args.settle), '--attempts', str(args.attempts)]
+
+    while True:
+        booted = time.monotonic()
+        kernel = reboot.current_kernel()
+        state = SweepState(manifest, journal.rows(), args.attempts)
+        last = state.last_event
+        if last and last['event'] == 'boot' and last['kernel'] != kernel:
+            journal.append('boot_failed', last['kernel'], detail=f"came up in {kernel}")
+            print(f"Booting {last['kernel']} failed, running {kernel}", file=sys.stderr)
+        journal.append('booted', kernel)
+        state = SweepState(manifest, journal.rows(), args.attempts)
+
+        # The finished kernels are analysed while this one settles, never during a measurement
+        unanalyzed = [name for name in state.finished_kernels() if name not in state.analyzed]
+        analysis = BackgroundAnalysis(state, state_dir, journal, unanalyzed)
+        analysis.start()
+        pending = state.pending(kernel)
+        if pending:
+            time.sleep(max(0.0, args.settle - (time.monotonic() - booted)))
+            if analysis.is_alive():
+                print(f"Waiting for the analysis of {', '.join(unanalyzed)}")
+            analysis.join()
+
+        total = len(state.jobs())
+        for job in pending:
+            number = total - len(state.pending()) + 1
+            print(f"[{number}/{total}] {job.suite} #{job.repetition} on {job.kernel}")
+            journal.append('start', job.kernel, job.suite, job.repetition)
+            state.started[job] += 1
+            start = time.perf_counter()
+            returncode, detail = run_job(manifest, state_dir, job)
+            seconds = round(time.perf_counter() - start, 1)
+            if returncode == 0:
+                journal.append('done', job.kernel, job.suite, job.repetition, returncode, seconds, detail)
+                state.done.add(job)
+            else:
+                journal.append('failed', job.kernel, job.suite, job.repetition, returncode, seconds, detail)
+                print(f"    failed ({detail if returncode is None else f'exit status {returncode}'})",
+                      file=sys.stderr)
+
+        remaining = [name for name in manifest['kernels'] if state.pending(name)]
+        if not remaining:
+            analysis.join()
+            state = SweepState(manifest, journal.rows(), args.attempts)
+            last_kernels = [name for name in state.finished_kernels() if name not in state.analyzed]
+            BackgroundAnalysis(state, state_dir, journal, last_kernels).run()
+            reboot.finish()
+            print(f"\nSweep complete, results in {state_dir / 'results'}")
+            print_status(SweepState(manifest, journal.rows(), args.attempts))
+            return 0
+
+        # A kernel whose jobs keep failing would be rebooted into forever otherwise
+        next_kernel = next((name for name in remaining if name != kernel), remaining[0])
+        if next_kernel == kernel:
+            continue
+        print(f"\n{len(state.pending())} jobs left, rebooting into {next_kernel}")
+        analysis.join()
+        reboot.prepare(command)
+        journal.append('boot', next_kernel)
+        reboot.reboot_into(next_kernel)
+        if not reboot.continues:
+            return 0
+
+def status_rows(state):
+    rows = []
+    for kernel in state.manifest['kernels']:
+        jobs = state.jobs(kernel)
+        rows.append({
+            'kernel': kernel,
+            'jobs': len(jobs),
+            'done': sum(job in state.done for job in jobs),
+            'failed': sum(state.given_up(job) for job in jobs),
+            'pending': len(state.pending(kernel)),
+            'boot_failures': state.boot_failures[kernel],
+            'analyzed': kernel in state.analyzed,
+        })
+    return rows
+
+def print_status(state, output_format='text'):
+    rows = status_rows(state)
+    if output_format == 'json':
+        json.dump(rows, sys.stdout, indent=2)
+        print()
+        return
+    manifest = state.manifest
+    print(f"\nKernel sweep: {', '.join(manifest['suites'])} x {manifest['repetitions']} repetition(s)")
+    print("=" * 50)
+    print(f"{'kernel':<24} {'done':>6} {'failed':>7} {'pending':>8} {'boots failed':>13} {'analysed':>9}")
+    for row in rows:
+        print(f"{row['kernel']:<24} {row['done']:>3}/{row['jobs']:<2} {row['failed']:>7} {row['pending']:>8} "
+              f"{row['boot_failures']:>13} {'yes' if row['analyzed'] else 'no':>9}")
+
+def init_manifest(args):
+    state_dir = Path(args.state_dir)
+    suites = args.suites.split(',')
+    unknown = [suite for suite in suites if suite not in SUITES]
+    if unknown:
+        print(f"Error: unknown suites {', '.join(unknown)} (known: {', '.join(SUITES)})", file=sys.stderr)
+        return 1
+    kernels = args.kernels.split(',') if args.kernels else sorted(grub_kernels(), key=kernel_sort_key)
+    if not kernels:
+        print("Error: no kernels given or found in GRUB", file=sys.stderr)
+        return 1
+
+    path = state_dir / 'manifest.json'
+    manifest = {'kernels': kernels, 'suites': suites, 'repetitions': args.repetitions}
+    if path.exists():
+        # Keep the command overrides; finished jobs stay finished since the journal is kept
+        with open(path) as f:
+            manifest['commands'] = json.load(f).get('commands', {})
+    state_dir.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+        print(file=f)
+    print(f"{len(kernels)} kernels x {len(suites)} suites x {args.repetitions} repetition(s) "
+          f"= {len(kernels) * len(suites) * args.repetitions} jobs in {path}")
+    return 0
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Resumable benchmark sweep over kernels")
+    parser.add_argument('--state-dir', default=str(DEFAULT_STATE_DIR),
+                        help="manifest, journal and results (default: kernel_sweep next to this script)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    sub = subparsers.add_parser('init', help="write the manifest (finished jobs of an earlier one are kept)")
+    source = sub.add_mutually_exclusive_group(required=True)
+    source.add_argument('--kernels', help="comma separated kernel releases, as uname -r prints them")
+    source.add_argument('--from-grub', action='store_true', help="every kernel with a GRUB entry")
+    sub.add_argument('--suites', default=','.join(SUITES), help=f"default: {','.join(SUITES)}")
+    sub.add_argument('--repetitions', type=int, default=1, help="runs of every suite on every kernel (default: 1)")
+
+    sub = subparsers.add_parser('run', help="run the running kernel's jobs, then reboot into the next kernel")
+    sub.add_argument('--reboot', default='grub', help="grub, simulate or MODULE:CLASS (default: grub)")
+    sub.add_argument('--settle', type=float, default=60.0,
+                     help="seconds after boot before the first measurement, used for analysis (default: 60)")
+    sub.add_argument('--attempts', type=int, default=2,
+                     help="tries of a job, or boots of a kernel, before giving up on it (default: 2)")
+
+    sub = subparsers.add_parser('status', help="progress of every kernel")
+    sub.add_argument('--attempts', type=int, default=2, help="as given to run (default: 2)")
+    sub.add_argument('--format', choices=['text', 'json'], default='text')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.command == 'init':
+        return init_manifest(args)
+    try:
+        if args.command == 'status':
+            manifest = load_manifest(args.state_dir)
+            state = SweepState(manifest, Journal(Path(args.state_dir) / 'journal.csv').rows(), args.attempts)
+            print_status(state, args.format)
+            return 0
+        return run_sweep(args)
+    except (FileNotFoundError, PermissionError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,21 +3,22 @@ import torch.nn as nn
 import torch.optim as optim
 from torchvision import datasets, transforms
 from torch.utils.data import DataLoader
+import argparse
+import json
+import os
+import platform
+import sys
 import time
+from pathlib import Path
 
-# Device configuration
-
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'Common'))
+from strace_latency import percentile
+from synthetic_data import in_memory_dataset, mapped_dataset
 
-transform = transforms.Compose(
-    [transforms.ToTensor(),
-     transforms.Normalize((0.5, 0.5, 0.5), (0.5, 0.5, 0.5))])
+DATASETS = ['cifar10', 'synthetic', 'synthetic-ram']
 
-batch_size = 32
-
-trainset = datasets.CIFAR10(root='./data', train=True, download=True, transform=transform)
+# Device configuration
 
-trainloader = torch.utils.data.DataLoader(trainset, batch_size=batch_size,
-                                          shuffle=True, num_workers=2)
 
 cfg = {
    'VGG11': [64, 'M', 128, 'M', 256, 256, 'M', 512, 512, 'M', 512, 512, 'M'],
@@ -49,42 +50,186 @@ class VGG(nn.Module):
         layers += [nn.AvgPool2d(kernel_size=1, stride=1)]
         return nn.Sequential(*layers)
 
+# Parts of a training iteration, each timed separately
+PHASES = ['dataloader', 'h2d_copy', 'forward', 'backward', 'optimizer']
+
+def synchronize(device):
+    """Wait for queued GPU work so that it is charged to the phase that issued it"""
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+
+def summarize_phases(timings):
+    """Total, mean, p50, p99 and max of every phase in seconds"""
+    summary = {}
+    for phase, durations in timings.items():
+        ordered = sorted(durations)
+        summary[phase] = {
+            'total': sum(ordered),
+            'mean': sum(ordered) / len(ordered) if ordered else float('nan'),
+            'p50': percentile(ordered, 0.50),
+            'p99': percentile(ordered, 0.99),
+            'max': ordered[-1] if ordered else float('nan'),
+        }
+    return summary
+
+def print_phase_table(summary, iteration_total):
+    print("\nPer-iteration time by phase:")
+    print(f"{'phase':<12} {'p50 (ms)':>10} {'p99 (ms)':>10} {'max (ms)':>10} {'share':>7}")
+    for phase, row in summary.items():
+        share = row['total'] / iteration_total * 100 if iteration_total else 0.0
+        print(f"{phase:<12} {row['p50'] * 1e3:>10.2f} {row['p99'] * 1e3:>10.2f} {row['max'] * 1e3:>10.2f} {share:>6.1f}%")
+
 # Benchmarking function
-def benchmark_training(device, train_loader, num_epochs):
+def benchmark_training(device, train_loader, num_epochs, json_path=None, run_info=None):
     device = torch.device(device)
     model = VGG('VGG11').to(device)
     model.train()
     total_time = 0
+    total_samples = 0
     criterion = nn.CrossEntropyLoss()
     optimizer = optim.Adam(model.parameters(), lr=0.001)
+    timings = {phase: [] for phase in PHASES}
+    batch_sizes = []
+    epochs = []
     for epoch in range(num_epochs):
-        start_time = time.time()
-        for i, (images, labels) in enumerate(train_loader):
+        # perf_counter is monotonic, unlike time.time() it does not jump with NTP adjustments
+        start_time = time.perf_counter()
+        samples = 0
+        batches = iter(train_loader)
+        while True:
+            fetch_start = time.perf_counter()
+            try:
+                images, labels = next(batches)
+            except StopIteration:
+                break
+            fetched = time.perf_counter()
             images, labels = images.to(device), labels.to(device)
+            synchronize(device)
+            copied = time.perf_counter()
 
             # Forward pass
             outputs = model(images)
             loss = criterion(outputs, labels)
+            synchronize(device)
+            forwarded = time.perf_counter()
 
             # Backward pass and optimization
             optimizer.zero_grad()
+            zeroed = time.perf_counter()
             loss.backward()
+            synchronize(device)
+            backwarded = time.perf_counter()
             optimizer.step()
-
-        end_time = time.time()
+            synchronize(device)
+            stepped = time.perf_counter()
+
+            timings['dataloader'].append(fetched - fetch_start)
+            timings['h2d_copy'].append(copied - fetched)
+            timings['forward'].append(forwarded - copied)
+            timings['backward'].append(backwarded - zeroed)
+            timings['optimizer'].append(zeroed - forwarded + stepped - backwarded)
+            batch_sizes.append(len(labels))
+            samples += len(labels)
+
+        end_time = time.perf_counter()
         epoch_time = end_time - start_time
         total_time += epoch_time
-        print(f"Epoch [{epoch + 1}/{num_epochs}], Time Taken: {epoch_time:.2f} seconds")
+        total_samples += samples
+        epochs.append({'epoch': epoch + 1, 'time': epoch_time, 'samples': samples,
+                       'samples_per_second': samples / epoch_time if epoch_time else 0.0})
+        print(f"Epoch [{epoch + 1}/{num_epochs}], Time Taken: {epoch_time:.2f} seconds, "
+              f"{samples / epoch_time:.1f} samples/s")
 
     avg_time_per_epoch = total_time / num_epochs
     print(f"\nAverage Time per Epoch: {avg_time_per_epoch:.2f} seconds")
     print(f"\nTotal time: {total_time:.2f} seconds")
+    print(f"Throughput: {total_samples / total_time:.1f} samples/s")
+
+    summary = summarize_phases(timings)
+    print_phase_table(summary, sum(row['total'] for row in summary.values()))
+
+    if json_path:
+        stats = {
+            'kernel': platform.release(),
+            **(run_info or {}),
+            'device': str(device),
+            'batch_size': train_loader.batch_size,
+            'num_workers': train_loader.num_workers,
+            'epochs': epochs,
+            'total_time': total_time,
+            'samples': total_samples,
+            'samples_per_second': total_samples / total_time if total_time else 0.0,
+            'phases': summary,
+            # Per-iteration seconds, so that stalls can be found after the fact
+            'iterations': dict(timings, batch_size=batch_sizes),
+        }
+        with open(json_path, 'w') as f:
+            json.dump(stats, f, indent=2)
+            f.write('\n')
+        print(f"Per-iteration statistics written to {json_path}")
     return avg_time_per_epoch
 
+def load_dataset(name, data_dir='./data', samples=50000, seed=0):
+    """
+    CIFAR-10 through torchvision (downloaded on first use), or the deterministic
+    synthetic data, memory-mapped from data_dir or generated in RAM.
+    """
+    if name == 'synthetic':
+        return mapped_dataset(data_dir, samples, seed)
+    if name == 'synthetic-ram':
+        return in_memory_dataset(samples, seed)
+    transform = transforms.Compose(
+        [transforms.ToTensor(),
+         transforms.Normalize((0.5, 0.5, 0.5), (0.5, 0.5, 0.5))])
+    return datasets.CIFAR10(root=data_dir, train=True, download=True, transform=transform)
+
+def parse_cpu_list(text):
+    """CPUs from a list like "0-3,8", the format taskset -c and /sys use"""
+    cpus = set()
+    for part in text.split(','):
+        first, _, last = part.partition('-')
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="VGG11 training benchmark on CIFAR-10")
+    parser.add_argument('--epochs', type=int, default=2)
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--dataset', choices=DATASETS, default='cifar10',
+                        help="cifar10 (downloads if missing), synthetic (generated once, memory-mapped) "
+                             "or synthetic-ram (generated in memory)")
+    parser.add_argument('--data-dir', default='./data', help="where CIFAR-10 or the synthetic files live")
+    parser.add_argument('--samples', type=int, default=50000, help="size of the synthetic dataset")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the synthetic dataset")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--num-workers', type=int, default=2)
+    parser.add_argument('--pin-memory', action='store_true', help="DataLoader pin_memory")
+    parser.add_argument('--persistent-workers', action='store_true', help="DataLoader persistent_workers")
+    parser.add_argument('--threads', type=int, help="torch intra-op threads (default: torch's choice)")
+    parser.add_argument('--cpus', help="pin the benchmark and its DataLoader workers to these CPUs, e.g. 0-3")
+    parser.add_argument('--json', help="per-iteration statistics file "
+                        "(default: benchmark_log-<kernel>-<timestamp>.json)")
+    return parser.parse_args()
+
 # Run the benchmark
 
 if __name__ == "__main__":
+    args = parse_args()
+    json_path = args.json or f"benchmark_log-{platform.release()}-{time.strftime('%Y%m%d_%H%M%S')}.json"
+    if args.cpus:
+        # Before torch starts its thread pool, DataLoader workers inherit the mask
+        os.sched_setaffinity(0, parse_cpu_list(args.cpus))
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    trainset = load_dataset(args.dataset, args.data_dir, args.samples, args.seed)
+    trainloader = torch.utils.data.DataLoader(trainset, batch_size=args.batch_size,
+                                              shuffle=True, num_workers=args.num_workers,
+                                              pin_memory=args.pin_memory,
+                                              persistent_workers=args.persistent_workers and args.num_workers > 0)
     #print("Benchmarking on GPU:")
     #benchmark_training("cuda", trainloader, 10)
-    print("Benchmarking on CPU:")
-    benchmark_training("cpu", trainloader, 2)
+    print(f"Benchmarking on {args.device.upper()}:")
+    benchmark_training(args.device, trainloader, args.epochs, json_path,
+                       run_info={'dataset': args.dataset, 'seed': args.seed, 'threads': torch.get_num_threads(),
+                                 'cpus': sorted(os.sched_getaffinity(0)), 'pin_memory': args.pin_memory,
+                                 'persistent_workers': args.persistent_workers})
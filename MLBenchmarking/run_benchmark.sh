@@ -18,17 +18,24 @@ fi
 timestamp=$(date +%Y%m%d_%H%M%S)
 kernel_version=$(uname -r)
 
-# Run the Python benchmark script with strace
+# COMPRESS=gz|xz|zst compresses the strace output, see Common/compress.sh
+. "$(dirname "$0")/../Common/compress.sh"
+strace_target "strace_log-${kernel_version}-${timestamp}.txt"
+
+# Run the Python benchmark script with strace, arguments are passed on to benchmark.py
+# (e.g. ./run_benchmark.sh --dataset synthetic for the offline, memory-mapped data)
 echo "Starting PyTorch Benchmark with syscall tracking..."
 
 # Use strace with the following flags:
 # -f: trace child processes
 # -tt: add time stamps with microsecond precision
-# -o: output to file
-strace -f -o "strace_log-${kernel_version}-${timestamp}.txt" \
-    python3 benchmark.py > "benchmark_log-${kernel_version}-${timestamp}.txt" 2>&1
+# -o: output to file (or to the compressor)
+strace -f -tt -o "$strace_output" \
+    python3 benchmark.py "$@" --json "benchmark_log-${kernel_version}-${timestamp}.json" \
+    > "benchmark_log-${kernel_version}-${timestamp}.txt" 2>&1
 
 # Output completion message
 echo "PyTorch Benchmark Completed!"
 echo "Benchmark output saved to: benchmark_log-${kernel_version}-${timestamp}.txt"
-echo "Syscall trace saved to: strace_log-${kernel_version}-${timestamp}.txt"
+echo "Per-iteration statistics saved to: benchmark_log-${kernel_version}-${timestamp}.json"
+echo "Syscall trace saved to: $trace_file"
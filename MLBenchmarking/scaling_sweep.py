@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Thread and DataLoader worker scaling sweep for benchmark.py.
+
+Every point of the grid (torch threads x num_workers x pin_memory x persistent_workers x
+batch size) runs benchmark.py in a fresh process, so thread pools, worker processes and
+the allocator start cold each time. With --pin, a point with T threads and W workers is
+restricted to the first T + W CPUs the sweep may use, which makes the thread count the
+number of cores the run gets. Results are appended to sweep-<kernel>.csv, one file per
+kernel, and the throughput-vs-cores table is printed at the end:
+
+    python3 scaling_sweep.py --threads 1,2,4,8 --workers 0,2,4 --pin
+    python3 scaling_sweep.py --report          # tables of every sweep-*.csv found
+
+Arguments after -- are passed on to benchmark.py (by default the synthetic dataset is used
+so that no download is needed and every kernel reads the same data).
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+BENCHMARK = Path(__file__).resolve().with_name('benchmark.py')
+RESULT_FIELDS = ['kernel', 'threads', 'num_workers', 'pin_memory', 'persistent_workers', 'batch_size',
+                 'cpus', 'samples_per_second', 'total_time', 'dataloader_p99', 'status']
+
+def parse_int_list(text):
+    return [int(value) for value in text.split(',')]
+
+def parse_bool_list(text):
+    return [value.strip().lower() in ('1', 'true', 'yes', 'on') for value in text.split(',')]
+
+def sweep_points(threads, workers, pin_memory, persistent_workers, batch_sizes):
+    """Grid points as dicts, without persistent_workers for points that have no workers"""
+    for point in itertools.product(threads, workers, pin_memory, persistent_workers, batch_sizes):
+        point = dict(zip(['threads', 'num_workers', 'pin_memory', 'persistent_workers', 'batch_size'], point))
+        if point['persistent_workers'] and point['num_workers'] == 0:
+            continue
+        yield point
+
+def point_cpus(point, available):
+    """The CPUs a point is pinned to, or None when the machine has too few"""
+    needed = point['threads'] + point['num_workers']
+    if needed > len(available):
+        return None
+    return ','.join(str(cpu) for cpu in available[:needed])
+
+def run_point(point, cpus, benchmark_args):
+    """Run benchmark.py for one point in a fresh process. Returns its JSON statistics or None."""
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = Path(tmp) / 'point.json'
+        cmd = [sys.executable, str(BENCHMARK), '--epochs', '1', *benchmark_args,
+               '--threads', str(point['threads']), '--num-workers', str(point['num_workers']),
+               '--batch-size', str(point['batch_size']), '--json', str(json_path)]
+        if point['pin_memory']:
+            cmd.append('--pin-memory')
+        if point['persistent_workers']:
+            cmd.append('--persistent-workers')
+        if cpus:
+            cmd += ['--cpus', cpus]
+        result = subprocess.run(cmd, cwd=BENCHMARK.parent, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        if result.returncode != 0 or not json_path.exists():
+            print(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "benchmark failed",
+                  file=sys.stderr)
+            return None
+        with open(json_path) as f:
+            return json.load(f)
+
+def append_result(results_file, row):
+    new_file = not results_file.exists()
+    with open(results_file, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        if new_file:
+            writer.writeheader()
+        writer.writerow(row)
+
+def read_results(results_file):
+    with open(results_file, newline='') as f:
+        return [row for row in csv.DictReader(f) if row['status'] == 'ok']
+
+def print_scaling_table(kernel, rows):
+    """Samples/s per configuration (rows) and thread count (columns), with efficiency against the fewest threads"""
+    if not rows:
+        print(f"\nNo successful runs on {kernel}")
+        return
+    table = defaultdict(dict)
+    threads = set()
+    for row in rows:
+        config = (int(row['batch_size']), int(row['num_workers']), row['pin_memory'], row['persistent_workers'])
+        # Repeated points are averaged
+        table[config].setdefault(int(row['threads']), []).append(float(row['samples_per_second']))
+        threads.add(int(row['threads']))
+    threads = sorted(threads)
+
+    print(f"\nThroughput vs cores on {kernel} (samples/s, scaling efficiency vs {threads[0]} thread(s)):")
+    header = f"{'batch':>6} {'workers':>8} {'pin':>6} {'persist':>8}"
+    print(header + ''.join(f"{f'{count} thr':>18}" for count in threads))
+    for config in sorted(table):
+        batch_size, num_workers, pin_memory, persistent = config
+        means = {count: sum(values) / len(values) for count, values in table[config].items()}
+        base_count = min(means)
+        line = f"{batch_size:>6} {num_workers:>8} {pin_memory:>6} {persistent:>8}"
+        for count in threads:
+            if count not in means:
+                line += f"{'-':>18}"
+                continue
+            efficiency = means[count] / (means[base_count] * count / base_count) * 100
+            line += f"{means[count]:>10.1f} ({efficiency:>3.0f}%)"
+        print(line)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Thread and worker scaling sweep of the training benchmark")
+    parser.add_argument('--threads', type=parse_int_list, default=[1, 2, 4], help="torch threads (default: 1,2,4)")
+    parser.add_argument('--workers', type=parse_int_list, default=[0, 2], help="DataLoader num_workers (default: 0,2)")
+    parser.add_argument('--pin-memory', type=parse_bool_list, default=[False], help="pin_memory values (default: 0)")
+    parser.add_argument('--persistent-workers', type=parse_bool_list, default=[False],
+                        help="persistent_workers values (default: 0)")
+    parser.add_argument('--batch-sizes', type=parse_int_list, default=[32], help="batch sizes (default: 32)")
+    parser.add_argument('--repetitions', type=int, default=1, help="runs of every point (default: 1)")
+    parser.add_argument('--pin', action='store_true', help="pin each point to threads + workers CPUs")
+    parser.add_argument('--output-dir', default='sweep_results', help="where sweep-<kernel>.csv is kept")
+    parser.add_argument('--report', action='store_true', help="only print the tables of the results already there")
+    parser.add_argument('benchmark_args', nargs=argparse.REMAINDER,
+                        help="arguments for benchmark.py after -- (default: --dataset synthetic --samples 10000)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    output_dir = Path(args.output_dir)
+    if args.report:
+        results = sorted(output_dir.glob('sweep-*.csv'))
+        if not results:
+            print(f"Error: no sweep-*.csv files in {output_dir}", file=sys.stderr)
+            sys.exit(1)
+        for results_file in results:
+            print_scaling_table(results_file.stem[len('sweep-'):], read_results(results_file))
+        return
+
+    benchmark_args = args.benchmark_args[1:] if args.benchmark_args[:1] == ['--'] else args.benchmark_args
+    benchmark_args = benchmark_args or ['--dataset', 'synthetic', '--samples', '10000']
+    kernel = platform.release()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    results_file = output_dir / f"sweep-{kernel}.csv"
+    available = sorted(os.sched_getaffinity(0))
+
+    points = list(sweep_points(args.threads, args.workers, args.pin_memory, args.persistent_workers,
+                               args.batch_sizes))
+    for number, point in enumerate(points * args.repetitions, 1):
+        cpus = point_cpus(point, available) if args.pin else None
+        if args.pin and cpus is None:
+            print(f"[{number}/{len(points) * args.repetitions}] skipping {point}: "
+                  f"needs {point['threads'] + point['num_workers']} CPUs", file=sys.stderr)
+            continue
+        print(f"[{number}/{len(points) * args.repetitions}] {point}" + (f" on CPUs {cpus}" if cpus else ''))
+        stats = run_point(point, cpus, benchmark_args)
+        row = dict(point, kernel=kernel, cpus=cpus or '', status='ok' if stats else 'failed',
+                   samples_per_second='', total_time='', dataloader_p99='')
+        if stats:
+            row.update(samples_per_second=round(stats['samples_per_second'], 2),
+                       total_time=round(stats['total_time'], 3),
+                       dataloader_p99=stats['phases']['dataloader']['p99'])
+            print(f"    {stats['samples_per_second']:.1f} samples/s")
+        append_result(results_file, row)
+
+    print(f"\nResults appended to {results_file}")
+    print_scaling_table(kernel, read_results(results_file))
+
+if __name__ == '__main__':
+    main()
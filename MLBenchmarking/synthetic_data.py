@@ -0,0 +1,101 @@
+"""
+Deterministic CIFAR-10 shaped data for the training benchmark.
+
+The images are generated once from a seed into .npy files that are memory-mapped, so
+the benchmark needs no network access and reads the same bytes on every machine. Each
+sample handed to the DataLoader is a tensor view of the mapping; the only copies are the
+float conversion (what ToTensor does for CIFAR-10) and the batch collation. The in-RAM
+variant generates the same bytes into memory instead, which takes the kernel's page
+cache and file I/O out of the measurement.
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+IMAGE_SHAPE = (3, 32, 32)   # Stored channels first, the layout the model consumes
+NUM_CLASSES = 10
+CHUNK = 4096                # Images generated per step, bounds the memory used while generating
+
+def generate(images, labels, seed):
+    """Fill images (uint8, N x 3 x 32 x 32) and labels (int64, N) from seed, chunk by chunk"""
+    rng = np.random.default_rng(seed)
+    for start in range(0, len(images), CHUNK):
+        end = min(start + CHUNK, len(images))
+        images[start:end] = rng.integers(0, 256, size=(end - start,) + IMAGE_SHAPE, dtype=np.uint8)
+        labels[start:end] = rng.integers(0, NUM_CLASSES, size=end - start)
+
+def dataset_paths(data_dir, samples, seed):
+    stem = Path(data_dir) / f"synthetic-cifar10-{samples}-{seed}"
+    return stem.with_name(stem.name + '-images.npy'), stem.with_name(stem.name + '-labels.npy')
+
+def create_mapped_files(data_dir, samples, seed):
+    """
+    Generate the dataset files unless they exist. Files are written under a temporary
+    name and renamed, so an interrupted run never leaves a partial dataset behind.
+    """
+    images_path, labels_path = dataset_paths(data_dir, samples, seed)
+    if images_path.exists() and labels_path.exists():
+        return images_path, labels_path
+    images_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_images = images_path.with_name(images_path.name + f'.tmp{os.getpid()}')
+    tmp_labels = labels_path.with_name(labels_path.name + f'.tmp{os.getpid()}')
+    images = np.lib.format.open_memmap(tmp_images, mode='w+', dtype=np.uint8, shape=(samples,) + IMAGE_SHAPE)
+    labels = np.lib.format.open_memmap(tmp_labels, mode='w+', dtype=np.int64, shape=(samples,))
+    generate(images, labels, seed)
+    images.flush()
+    labels.flush()
+    del images, labels
+    os.replace(tmp_labels, labels_path)
+    os.replace(tmp_images, images_path)
+    return images_path, labels_path
+
+class SyntheticCIFAR10(Dataset):
+    """
+    CIFAR-10 shaped samples normalized like the benchmark's torchvision transform,
+    read from memory-mapped files or from arrays already in memory.
+    """
+    def __init__(self, images_path=None, labels_path=None, arrays=None):
+        self.images_path = images_path
+        self.labels_path = labels_path
+        self.images, self.labels = arrays if arrays is not None else (None, None)
+        if arrays is None:
+            self._open()
+
+    def _open(self):
+        # Copy-on-write mapping: tensor views need a writable array, the file is never modified
+        self.images = np.load(self.images_path, mmap_mode='c')
+        self.labels = np.load(self.labels_path, mmap_mode='r')
+
+    def __getstate__(self):
+        # DataLoader workers map the files themselves instead of receiving a pickled copy
+        state = self.__dict__.copy()
+        if self.images_path is not None:
+            state['images'] = state['labels'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.images is None:
+            self._open()
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, index):
+        image = torch.from_numpy(self.images[index])
+        # Same values as ToTensor() followed by Normalize((0.5,) * 3, (0.5,) * 3)
+        return image.float().div_(127.5).sub_(1.0), int(self.labels[index])
+
+def mapped_dataset(data_dir, samples=50000, seed=0):
+    """Dataset backed by memory-mapped files in data_dir, generated on first use"""
+    return SyntheticCIFAR10(*create_mapped_files(data_dir, samples, seed))
+
+def in_memory_dataset(samples=50000, seed=0):
+    """The same dataset as mapped_dataset, generated into anonymous memory"""
+    images = np.empty((samples,) + IMAGE_SHAPE, dtype=np.uint8)
+    labels = np.empty(samples, dtype=np.int64)
+    generate(images, labels, seed)
+    return SyntheticCIFAR10(arrays=(images, labels))
@@ -1,31 +1,31 @@
 import re
-import matplotlib.pyplot as plt
 from collections import Counter
-import pandas as pd
-import numpy as np
 import sys
+import time
+import argparse
+from pathlib import Path
 
-def parse_strace_file(file_path):
-    # Updated pattern to match your strace format
-    # Matches: "PID  syscall_name(" or "PID  syscall_name = "
-    syscall_pattern = r'^\d+\s+(\w+)(?:\(|[\s]=)'
-    
-    syscalls = []
-    with open(file_path, 'r') as file:
-        for line in file:
-            match = re.match(syscall_pattern, line)
-            if match:
-                syscall_name = match.group(1)
-                syscalls.append(syscall_name)
-    
-    return syscalls
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'Common'))
+import strace_chunks
+from strace_timeline import build_timeline, detect_phases, plot_timeline, print_phases, summarize_phases
+
+# Updated pattern to match your strace format
+# Matches: "PID  syscall_name(" or "PID  syscall_name = ", with or without a -tt timestamp
+# Whitespace never crosses a newline, so where the file is split cannot change the result.
+SYSCALL_PATTERN = re.compile(rb'^\d+[^\S\n]+(?:[\d:.]+[^\S\n]+)?(\w+)(?:\(|[^\S\n]=)', re.MULTILINE)
+
+def parse_strace_file(file_path, jobs=1, chunk_size=strace_chunks.CHUNK_SIZE):
+    """Return a Counter of syscall names in the trace, see strace_chunks.parse_strace_file"""
+    return strace_chunks.parse_strace_file(file_path, SYSCALL_PATTERN, jobs, chunk_size)
 
 def analyze_syscalls(syscalls, min_percentage=1.0):
+    import pandas as pd
+
     if not syscalls:
         print("No syscalls were found in the input file!")
         return pd.DataFrame(), pd.DataFrame()
     
-    # Count syscalls
+    # Count syscalls (also accepts an already built Counter)
     syscall_counts = Counter(syscalls)
     
     # Convert to DataFrame for easier manipulation
@@ -57,6 +57,10 @@ def analyze_syscalls(syscalls, min_percentage=1.0):
     return df_filtered, df
 
 def create_visualizations(df_filtered, df_full, output_file='syscall_analysis.png'):
+    # Plotting libraries are only loaded when an image is requested
+    import matplotlib.pyplot as plt
+    import numpy as np
+
     if df_filtered.empty or df_full.empty:
         print("No data to visualize!")
         return
@@ -121,23 +125,68 @@ def print_statistics(df_filtered, df_full, total_syscalls):
     formatted_data['count'] = formatted_data['count'].apply(lambda x: f"{int(x):,}")
     print(formatted_data.to_string(index=False))
 
-def main():
-    if len(sys.argv) != 2:
-        print("Usage: python3 syscall_analyzer.py <strace file>")
-        sys.exit(1)
+def analyze_timeline(file_path, output_file, window=1.0):
+    """
+    Calls per second of every syscall over the run, split into phases (needs -tt or -ttt)
+    """
+    try:
+        timeline = build_timeline(file_path, window)
+    except ValueError as error:
+        print(f"Error: {error}")
+        return
+    phases = summarize_phases(timeline, detect_phases(timeline))
+    print_phases(timeline, phases)
+    plot_timeline(timeline, phases, output_file)
+    print(f"\nTimeline has been saved as '{output_file}'")
 
-    file_path = sys.argv[1]
+def analyze_processes(file_path, top=20):
+    """
+    Rank the benchmark's processes (the main process and every DataLoader worker, each
+    with its threads) and then its single threads by the syscalls they made
+    """
+    from strace_threads import count_thread_syscalls, print_thread_ranking, rank_processes, rank_threads
+    thread_counts = count_thread_syscalls(file_path)
+    print_thread_ranking(rank_processes(thread_counts), "Processes by syscalls (DataLoader workers are the "
+                         "child processes)", top)
+    print_thread_ranking(rank_threads(thread_counts), f"Threads by syscalls ({len(thread_counts.tids):,} traced)", top)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Analyze syscalls in a PyTorch benchmark strace log")
+    parser.add_argument('file', help="strace file")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="number of worker processes used to parse the trace (default: 1)")
+    parser.add_argument('--timeline', action='store_true',
+                        help="plot syscall rates over time and find the run's phases (needs -tt or -ttt)")
+    parser.add_argument('--window', type=float, default=1.0,
+                        help="seconds per timeline bin (default: 1)")
+    parser.add_argument('--threads', action='store_true',
+                        help="rank processes (DataLoader workers) and threads by syscall volume")
+    parser.add_argument('--top', type=int, default=20, help="rows shown with --threads (default: 20)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    file_path = args.file
     min_percentage = 1.0  # Minimum percentage threshold
+
+    if args.timeline:
+        analyze_timeline(file_path, 'syscall_timeline.png', args.window)
+        return
+    if args.threads:
+        analyze_processes(file_path, args.top)
+        return
     
     # Parse and analyze syscalls
     print(f"Analyzing {file_path}...")
-    syscalls = parse_strace_file(file_path)
+    start_time = time.perf_counter()
+    syscalls = parse_strace_file(file_path, jobs=args.jobs)
+    print(f"Parsed in {time.perf_counter() - start_time:.2f} seconds using {args.jobs} job(s)")
     
     if not syscalls:
         print("Error: No syscalls found in the input file!")
         return
         
-    total_syscalls = len(syscalls)
+    total_syscalls = sum(syscalls.values())
     df_filtered, df_full = analyze_syscalls(syscalls, min_percentage)
     
     # Create visualizations
@@ -8,6 +8,11 @@ then
 fi
 
 kernel_version=$(uname -r)
+timestamp=$(date +%Y%m%d_%H%M%S)
+
+# COMPRESS=gz|xz|zst compresses the strace output, see Common/compress.sh
+. "$(dirname "$0")/../../Common/compress.sh"
+strace_target "strace_log-${kernel_version}-${timestamp}.txt"
 
 sysbench oltp_read_write --db-driver=mysql --mysql-db=sysbench_test --mysql-user=sysbench_user --mysql-password=password --table-size=1000000 --threads=4 prepare
 
@@ -15,8 +20,8 @@ sysbench oltp_read_write --db-driver=mysql --mysql-db=sysbench_test --mysql-user
 # Use strace with the following flags:
 # -f: trace child processes
 # -tt: add time stamps with microsecond precision
-# -o: output to file
-strace -f -tt -o "strace_log-${kernel_version}-${timestamp}.txt" \
+# -o: output to file (or to the compressor)
+strace -f -tt -o "$strace_output" \
 sysbench oltp_read_write --db-driver=mysql --mysql-db=sysbench_test --mysql-user=sysbench_user --mysql-password=password --table-size=1000000 --threads=4 --time=120 run > "benchmark_log-${kernel_version}.txt" 2>&1
 
 
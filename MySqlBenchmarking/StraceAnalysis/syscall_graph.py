@@ -1,25 +1,27 @@
 import re
-import matplotlib.pyplot as plt
 from collections import Counter
-import pandas as pd
-import numpy as np
+import time
+import argparse
+import sys
+from pathlib import Path
 
-def parse_strace_file(file_path):
-    # Regular expression to match syscall names
-    syscall_pattern = r'\d+\s+[\d:.]+\s+(\w+)\('
-    
-    syscalls = []
-    with open(file_path, 'r') as file:
-        for line in file:
-            match = re.search(syscall_pattern, line)
-            if match:
-                syscall_name = match.group(1)
-                syscalls.append(syscall_name)
-    
-    return syscalls
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'Common'))
+import strace_chunks
+from strace_latency import collect_latencies, summarize_latency
+from strace_timeline import build_timeline, detect_phases, plot_timeline, print_phases, summarize_phases
+
+# Regular expression to match syscall names, first match on each line only.
+# Whitespace never crosses a newline, so where the file is split cannot change the result.
+SYSCALL_PATTERN = re.compile(rb'^.*?\d+[^\S\n]+[\d:.]+[^\S\n]+(\w+)\(', re.MULTILINE)
+
+def parse_strace_file(file_path, jobs=1, chunk_size=strace_chunks.CHUNK_SIZE):
+    """Return a Counter of syscall names in the trace, see strace_chunks.parse_strace_file"""
+    return strace_chunks.parse_strace_file(file_path, SYSCALL_PATTERN, jobs, chunk_size)
 
 def analyze_syscalls(syscalls, min_percentage=1.0):
-    # Count syscalls
+    import pandas as pd
+
+    # Count syscalls (also accepts an already built Counter)
     syscall_counts = Counter(syscalls)
     
     # Convert to DataFrame for easier manipulation
@@ -50,7 +52,11 @@ def analyze_syscalls(syscalls, min_percentage=1.0):
     
     return df_filtered, df
 
-def create_visualizations(df_filtered, df_full):
+def create_visualizations(df_filtered, df_full, output_file='syscall_analysis.png'):
+    # Plotting libraries are only loaded when an image is requested
+    import matplotlib.pyplot as plt
+    import numpy as np
+
     # Create a figure with two subplots
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 7))
     
@@ -80,7 +86,7 @@ def create_visualizations(df_filtered, df_full):
     plt.tight_layout()
     
     # Save the plots
-    plt.savefig('syscall_analysis.png', bbox_inches='tight', dpi=300)
+    plt.savefig(output_file, bbox_inches='tight', dpi=300)
     
     # Print tabular data
     print("\nFiltered Syscall Analysis (>= 1% of total):")
@@ -91,14 +97,129 @@ def create_visualizations(df_filtered, df_full):
     print("=" * 50)
     print(df_full.to_string(index=False))
 
+def create_latency_visualizations(df_latency, output_file, top_n=20):
+    # Plotting libraries are only loaded when an image is requested
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    if df_latency.empty:
+        print("No data to visualize!")
+        return
+
+    df_top = df_latency.head(top_n)
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(20, 10))
+    colors = plt.cm.Set3(np.linspace(0, 1, len(df_top)))
+
+    # Total time spent in each syscall
+    ax1.barh(df_top['syscall'], df_top['total'], color=colors)
+    ax1.invert_yaxis()
+    ax1.set_title(f'Total Time in System Calls (top {len(df_top)})', fontsize=14, pad=20)
+    ax1.set_xlabel('Seconds', fontsize=12)
+
+    # Typical and tail latency of the same syscalls
+    positions = np.arange(len(df_top))
+    ax2.barh(positions - 0.2, df_top['p50'] * 1e6, height=0.4, label='p50')
+    ax2.barh(positions + 0.2, df_top['p99'] * 1e6, height=0.4, label='p99')
+    ax2.set_yticks(positions)
+    ax2.set_yticklabels(df_top['syscall'])
+    ax2.invert_yaxis()
+    ax2.set_xscale('log')
+    ax2.set_title('System Call Latency', fontsize=14, pad=20)
+    ax2.set_xlabel('Microseconds', fontsize=12)
+    ax2.legend()
+
+    plt.tight_layout()
+    plt.savefig(output_file, bbox_inches='tight', dpi=300)
+    plt.close()
+
+def print_latency_statistics(df_latency, untimed):
+    print("\nSystem Call Latency Summary")
+    print("=" * 50)
+    print(f"Timed system calls: {int(df_latency['calls'].sum()):,}")
+    print(f"Total time in system calls: {df_latency['total'].sum():.6f} seconds")
+    if untimed:
+        print(f"System calls without timing information: {sum(untimed.values()):,}")
+
+    formatted = df_latency.copy()
+    formatted['calls'] = formatted['calls'].apply(lambda x: f"{int(x):,}")
+    formatted['total'] = formatted['total'].apply(lambda x: f"{x:.6f}")
+    for column in ['mean', 'p50', 'p99', 'max']:
+        formatted[column] = formatted[column].apply(lambda x: f"{x * 1e6:.1f}")
+    formatted = formatted.rename(columns={'total': 'total (s)', 'mean': 'mean (us)', 'p50': 'p50 (us)',
+                                          'p99': 'p99 (us)', 'max': 'max (us)'})
+    print(formatted.to_string(index=False))
+
+def analyze_latency(file_path, output_file, use_cache=False):
+    """
+    Pair unfinished/resumed records per pid and report where time in the kernel goes
+    """
+    import pandas as pd
+
+    if use_cache:
+        from trace_store import load_strace_store, store_syscall_durations
+        durations, untimed = store_syscall_durations(load_strace_store(file_path))
+    else:
+        durations, untimed = collect_latencies(file_path)
+    df_latency = pd.DataFrame(summarize_latency(durations))
+    if df_latency.empty:
+        print("Error: No syscall durations found! Record the trace with -T or -tt.")
+        return
+
+    print_latency_statistics(df_latency, untimed)
+    create_latency_visualizations(df_latency, output_file)
+    print(f"\nLatency charts have been saved as '{output_file}'")
+
+def analyze_timeline(file_path, output_file, window=1.0):
+    """
+    Calls per second of every syscall over the run, split into phases (needs -tt or -ttt)
+    """
+    try:
+        timeline = build_timeline(file_path, window)
+    except ValueError as error:
+        print(f"Error: {error}")
+        return
+    phases = summarize_phases(timeline, detect_phases(timeline))
+    print_phases(timeline, phases)
+    plot_timeline(timeline, phases, output_file)
+    print(f"\nTimeline has been saved as '{output_file}'")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Analyze syscalls in a sysbench strace log")
+    parser.add_argument('file', nargs='?', default='strace_log-5.19.0-32-generic-.txt',
+                        help="strace file")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="number of worker processes used to parse the trace (default: 1)")
+    parser.add_argument('--latency', action='store_true',
+                        help="report time spent per syscall instead of call counts (needs -T or -tt)")
+    parser.add_argument('--cache', action='store_true',
+                        help="parse through the columnar cache in .trace_cache, rebuilt when the trace changes "
+                             "(counts each call once, even when strace split it into unfinished/resumed lines)")
+    parser.add_argument('--timeline', action='store_true',
+                        help="plot syscall rates over time and find the run's phases (needs -tt or -ttt)")
+    parser.add_argument('--window', type=float, default=1.0,
+                        help="seconds per timeline bin (default: 1)")
+    return parser.parse_args()
+
 def main():
-    import numpy as np  # Added import for np.linspace
-    
-    file_path = 'strace_log-5.19.0-32-generic-.txt'  # Replace with your file path
+    args = parse_args()
+    file_path = args.file
     min_percentage = 1.0  # Minimum percentage threshold
+
+    if args.latency:
+        analyze_latency(file_path, 'syscall_latency.png', args.cache)
+        return
+    if args.timeline:
+        analyze_timeline(file_path, 'syscall_timeline.png', args.window)
+        return
     
     # Parse and analyze syscalls
-    syscalls = parse_strace_file(file_path)
+    start_time = time.perf_counter()
+    if args.cache:
+        from trace_store import load_strace_store, store_syscall_counts
+        syscalls = store_syscall_counts(load_strace_store(file_path))
+    else:
+        syscalls = parse_strace_file(file_path, jobs=args.jobs)
+    print(f"Parsed in {time.perf_counter() - start_time:.2f} seconds using {args.jobs} job(s)")
     df_filtered, df_full = analyze_syscalls(syscalls, min_percentage)
     
     # Create and save visualizations
@@ -1,4 +1,13 @@
-strace -f -p "$(pidof mysqld)" 2> "$(uname -r).strace"&
+# TRACER=proc samples /proc instead of attaching strace, which slows mysqld down much less
+# (report with: python3 proc_sampler.py --report "$(uname -r).psamp")
+# COMPRESS=gz|xz|zst compresses the strace output, see Common/compress.sh
+. "$(dirname "$0")/../Common/compress.sh"
+strace_target "$(uname -r).strace"
+if [ "${TRACER:-strace}" = "proc" ]; then
+    python3 proc_sampler.py --pid "$(pidof mysqld)" -o "$(uname -r).psamp"&
+else
+    strace -f -p "$(pidof mysqld)" -o "$strace_output"&
+fi
 STRACE_PID=$!
 
 sleep 5
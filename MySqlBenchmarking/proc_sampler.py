@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+Sample a running process's threads from /proc instead of tracing them with strace.
+
+`strace -f -p` stops every thread on each syscall entry and exit through ptrace, which
+slows mysqld down enough to distort the sysbench numbers measured at the same time.
+This collector never stops the target: at a fixed rate it reads, for every thread,
+
+    /proc/<pid>/task/<tid>/syscall     the syscall the thread is blocked in, or "running"
+    /proc/<pid>/task/<tid>/stat        state, user and system CPU ticks
+    /proc/<pid>/task/<tid>/schedstat   time on CPU, time waiting on a runqueue, timeslices
+    /proc/<pid>/task/<tid>/io          read/write syscalls and bytes (exact counters)
+
+and appends the samples to a compact binary log. The files of every thread are opened
+once and re-read with pread, so a sweep costs one read per file and thread. The report
+estimates each thread's syscall mix from the samples (the share of time it spent blocked
+in each syscall) and its time split from the counters, and shows what the collector
+itself cost:
+
+    python3 proc_sampler.py --pid "$(pidof mysqld)" --rate 100 --duration 60 -o mysql.psamp
+    python3 proc_sampler.py --report mysql.psamp --top 20 --format csv --output threads.csv
+
+Recording stops after --duration, on SIGINT/SIGTERM (like the strace runs in
+mytracer.sh) or when the process exits. Reading another user's syscall and io files
+needs root.
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import re
+import signal
+import struct
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'Common'))
+from strace_latency import percentile
+
+MAGIC = b'PROCSMP1'
+# Log layout after MAGIC: u32 length + JSON header, then tagged records
+HEADER_LENGTH = struct.Struct('<I')
+THREAD = struct.Struct('<cI16s')        # b'T', tid, comm; written when a thread is first seen
+SAMPLE = struct.Struct('<cfIic7Q')      # b'S', seconds since start, tid, syscall, state, counters
+OVERHEAD = struct.Struct('<cddIIff')    # b'E', wall s, collector CPU s, sweeps, late sweeps, sweep p50/p99 s
+RECORDS = {b'T': THREAD, b'S': SAMPLE, b'E': OVERHEAD}
+
+# Syscall field of a sample when the thread was not blocked in a syscall
+RUNNING = -2        # on a CPU
+USER = -1           # off CPU outside a syscall (preempted, or stopped)
+IO_PATTERN = re.compile(rb'syscr: (\d+)\nsyscw: (\d+)')
+COUNTERS = ['utime', 'stime', 'run_ns', 'wait_ns', 'slices', 'syscr', 'syscw']
+
+UNISTD_HEADERS = ['/usr/include/asm/unistd_64.h', '/usr/include/x86_64-linux-gnu/asm/unistd_64.h',
+                  '/usr/include/aarch64-linux-gnu/asm/unistd.h', '/usr/include/asm-generic/unistd.h']
+
+REPORT_FIELDS = ['tid', 'comm', 'samples', 'span_s', 'user_pct', 'system_pct', 'runqueue_pct', 'off_cpu_pct',
+                 'running_samples_pct', 'syscall_samples_pct', 'read_syscalls', 'write_syscalls',
+                 'timeslices', 'syscall_mix']
+
+def syscall_names():
+    """{number: name} from the kernel headers of this machine, empty when they are not installed"""
+    for header in UNISTD_HEADERS:
+        try:
+            text = Path(header).read_text()
+        except OSError:
+            continue
+        names = {int(number): name for name, number in re.findall(r'#define\s+__NR_(\w+)\s+(\d+)\b', text)}
+        if names:
+            return names
+    return {}
+
+class ThreadFiles:
+    """The open /proc files of one thread"""
+    def __init__(self, task_dir, tid, with_syscall, with_io):
+        base = f'{task_dir}/{tid}/'
+        self.fds = []
+        self.stat = self._open(base + 'stat')
+        self.schedstat = self._open(base + 'schedstat')
+        self.syscall = self._open(base + 'syscall') if with_syscall else None
+        self.io = self._open(base + 'io') if with_io else None
+
+    def _open(self, path):
+        fd = os.open(path, os.O_RDONLY)
+        self.fds.append(fd)
+        return fd
+
+    def close(self):
+        for fd in self.fds:
+            os.close(fd)
+
+def open_thread(task_dir, tid, with_syscall, with_io):
+    """ThreadFiles for tid, falling back to fewer files when permissions do not allow them"""
+    try:
+        return ThreadFiles(task_dir, tid, with_syscall, with_io), with_syscall, with_io
+    except PermissionError:
+        if not (with_syscall or with_io):
+            raise
+        print(f"Warning: no permission for /proc/{tid}/syscall or io, sampling stat and schedstat only "
+              f"(run as root for the syscall mix)", file=sys.stderr)
+        return ThreadFiles(task_dir, tid, False, False), False, False
+
+def read_thread(files):
+    """(syscall, state, counters) of a thread, or None when it has exited"""
+    try:
+        stat = os.pread(files.stat, 1024, 0)
+        schedstat = os.pread(files.schedstat, 128, 0)
+        syscall = os.pread(files.syscall, 256, 0) if files.syscall is not None else b''
+        io = os.pread(files.io, 512, 0) if files.io is not None else b''
+    except (ProcessLookupError, FileNotFoundError):
+        return None
+    if not stat:
+        return None
+
+    # comm may contain spaces and parentheses, the fields start after the last ')'
+    fields = stat[stat.rindex(b')') + 2:].split(b' ', 13)
+    state = fields[0]
+    utime, stime = int(fields[11]), int(fields[12])
+    run_ns, wait_ns, slices = (int(value) for value in schedstat.split()[:3])
+
+    match = IO_PATTERN.search(io)
+    syscr, syscw = (int(match.group(1)), int(match.group(2))) if match else (0, 0)
+
+    word = syscall.split(b' ', 1)[0].strip()
+    if word == b'running':
+        number = RUNNING
+    elif word and word != b'-1':
+        number = int(word)
+    else:
+        number = USER
+    return number, state, (utime, stime, run_ns, wait_ns, slices, syscr, syscw)
+
+def thread_comm(task_dir, tid):
+    try:
+        return Path(f'{task_dir}/{tid}/comm').read_bytes().strip()
+    except OSError:
+        return b'?'
+
+def record(pid, output_path, rate, duration=None, with_syscall=True, with_io=True):
+    """Sample the threads of pid into output_path. Returns the collector's overhead numbers."""
+    task_dir = f'/proc/{pid}/task'
+    if not os.path.isdir(task_dir):
+        raise FileNotFoundError(f"no process {pid}")
+    header = {
+        'pid': pid,
+        'comm': Path(f'/proc/{pid}/comm').read_text().strip(),
+        'kernel': platform.release(),
+        'rate': rate,
+        'clock_ticks': os.sysconf('SC_CLK_TCK'),
+        'started': time.time(),
+        'syscall_names': syscall_names(),
+    }
+
+    # Background jobs of a script start with SIGINT ignored, so it is handled explicitly
+    stop = []
+    previous = {signum: signal.signal(signum, lambda signum, frame: stop.append(signum))
+                for signum in (signal.SIGINT, signal.SIGTERM)}
+    threads = {}
+    sweep_times = []
+    late = 0
+    period = 1.0 / rate
+    pack_sample = SAMPLE.pack
+    with open(output_path, 'wb') as out:
+        encoded = json.dumps(header).encode()
+        out.write(MAGIC + HEADER_LENGTH.pack(len(encoded)) + encoded)
+        start = time.monotonic()
+        cpu_start = time.process_time()
+        deadline = start
+        try:
+            while not stop and (duration is None or deadline - start < duration):
+                sweep_start = time.monotonic()
+                try:
+                    tids = [int(name) for name in os.listdir(task_dir)]
+                except FileNotFoundError:
+                    break  # The process exited
+                elapsed = sweep_start - start
+                for tid in tids:
+                    files = threads.get(tid)
+                    if files is None:
+                        try:
+                            files, with_syscall, with_io = open_thread(task_dir, tid, with_syscall, with_io)
+                        except (FileNotFoundError, ProcessLookupError):
+                            continue
+                        threads[tid] = files
+                        out.write(THREAD.pack(b'T', tid, thread_comm(task_dir, tid)))
+                    sample = read_thread(files)
+                    if sample is None:
+                        threads.pop(tid).close()
+                        continue
+                    number, state, counters = sample
+                    out.write(pack_sample(b'S', elapsed, tid, number, state, *counters))
+                for tid in set(threads) - set(tids):
+                    threads.pop(tid).close()
+
+                now = time.monotonic()
+                sweep_times.append(now - sweep_start)
+                deadline += period
+                if now > deadline:
+                    # Fell behind: skip the missed slots instead of sampling in a burst
+                    late += 1
+                    deadline += (now - deadline) // period * period + period
+                time.sleep(max(0.0, deadline - time.monotonic()))
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+            for files in threads.values():
+                files.close()
+            wall = time.monotonic() - start
+            cpu = time.process_time() - cpu_start
+            sweep_times.sort()
+            overhead = {
+                'wall_s': wall, 'collector_cpu_s': cpu, 'sweeps': len(sweep_times), 'late_sweeps': late,
+                'sweep_p50_s': percentile(sweep_times, 0.50) if sweep_times else 0.0,
+                'sweep_p99_s': percentile(sweep_times, 0.99) if sweep_times else 0.0,
+            }
+            out.write(OVERHEAD.pack(b'E', wall, cpu, len(sweep_times), late,
+                                    overhead['sweep_p50_s'], overhead['sweep_p99_s']))
+    return overhead
+
+def read_log(path):
+    """
+    (header, {tid: comm}, {tid: list of samples}, overhead or None) from a sample log.
+    Every sample is (seconds, syscall, state, counters tuple). A log cut short by a crash
+    reads up to its last complete record.
+    """
+    data = Path(path).read_bytes()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a proc_sampler log")
+    offset = len(MAGIC)
+    (length,) = HEADER_LENGTH.unpack_from(data, offset)
+    offset += HEADER_LENGTH.size
+    header = json.loads(data[offset:offset + length])
+    offset += length
+
+    comms = {}
+    samples = defaultdict(list)
+    overhead = None
+    sample_size = SAMPLE.size
+    unpack_sample = SAMPLE.unpack_from
+    end = len(data)
+    while offset < end:
+        kind = data[offset:offset + 1]
+        if kind == b'S':
+            if offset + sample_size > end:
+                break
+            _, seconds, tid, number, state, *counters = unpack_sample(data, offset)
+            samples[tid].append((seconds, number, state, counters))
+            offset += sample_size
+            continue
+        layout = RECORDS.get(kind)
+        if layout is None or offset + layout.size > end:
+            break
+        fields = layout.unpack_from(data, offset)
+        offset += layout.size
+        if kind == b'T':
+            comms[fields[1]] = fields[2].rstrip(b'\0').decode(errors='replace')
+        else:
+            overhead = dict(zip(['wall_s', 'collector_cpu_s', 'sweeps', 'late_sweeps', 'sweep_p50_s',
+                                 'sweep_p99_s'], fields[1:]))
+    return header, comms, samples, overhead
+
+def summarize_thread(tid, comm, thread_samples, clock_ticks, names):
+    """
+    Estimated time split and syscall mix of one thread.
+
+    user/system come from the CPU tick counters, runqueue wait from schedstat, and
+    off-CPU (blocked or sleeping) is what remains of the thread's sampled span. The
+    syscall mix is the share of samples that found the thread blocked in each syscall.
+    """
+    first, last = thread_samples[0], thread_samples[-1]
+    span = last[0] - first[0]
+    delta = {name: after - before for name, before, after in zip(COUNTERS, first[3], last[3])}
+    states = Counter(number for _, number, _, _ in thread_samples)
+    total = len(thread_samples)
+    in_syscall = total - states[RUNNING] - states[USER]
+    mix = Counter({names.get(str(number), f'syscall_{number}'): count
+                   for number, count in states.items() if number >= 0})
+
+    def share(seconds):
+        return round(seconds / span * 100, 1) if span > 0 else None
+
+    user = delta['utime'] / clock_ticks
+    system = delta['stime'] / clock_ticks
+    runqueue = delta['wait_ns'] / 1e9
+    return {
+        'tid': tid,
+        'comm': comm,
+        'samples': total,
+        'span_s': round(span, 3),
+        'user_pct': share(user),
+        'system_pct': share(system),
+        'runqueue_pct': share(runqueue),
+        # schedstat's run time is exact, the tick counters are only used for the user/system split
+        'off_cpu_pct': share(max(0.0, span - delta['run_ns'] / 1e9 - runqueue)),
+        'running_samples_pct': round(states[RUNNING] / total * 100, 1),
+        'syscall_samples_pct': round(in_syscall / total * 100, 1),
+        'read_syscalls': delta['syscr'],
+        'write_syscalls': delta['syscw'],
+        'timeslices': delta['slices'],
+        'syscall_mix': {name: round(count / total * 100, 1) for name, count in mix.most_common()},
+    }
+
+def build_report(path):
+    header, comms, samples, overhead = read_log(path)
+    names = header['syscall_names']
+    threads = [summarize_thread(tid, comms.get(tid, '?'), thread_samples, header['clock_ticks'], names)
+               for tid, thread_samples in samples.items()]
+    # Busiest threads first: on-CPU share, then how often they were caught in a syscall
+    threads.sort(key=lambda row: (-((row['user_pct'] or 0) + (row['system_pct'] or 0)),
+                                  -row['syscall_samples_pct'], row['tid']))
+
+    process_mix = Counter()
+    for tid, thread_samples in samples.items():
+        process_mix.update(number for _, number, _, _ in thread_samples if number >= 0)
+    sample_count = sum(len(thread_samples) for thread_samples in samples.values())
+    if overhead:
+        overhead['collector_cpu_pct'] = round(overhead['collector_cpu_s'] / overhead['wall_s'] * 100, 2)
+        overhead['achieved_rate'] = round(overhead['sweeps'] / overhead['wall_s'], 1)
+        overhead['samples'] = sample_count
+        overhead['cpu_us_per_sample'] = round(overhead['collector_cpu_s'] / sample_count * 1e6, 2) if sample_count else None
+    return {
+        'pid': header['pid'],
+        'comm': header['comm'],
+        'kernel': header['kernel'],
+        'rate': header['rate'],
+        'samples': sample_count,
+        'threads': threads,
+        'syscall_mix': {names.get(str(number), f'syscall_{number}'): round(count / sample_count * 100, 2)
+                        for number, count in process_mix.most_common()},
+        'overhead': overhead,
+    }
+
+def print_report(report, top, mix_width):
+    overhead = report['overhead']
+    print(f"\n{report['comm']} (pid {report['pid']}) on {report['kernel']}: {report['samples']:,} samples "
+          f"of {len(report['threads'])} threads at {report['rate']} Hz")
+    if overhead:
+        print(f"Collector: {overhead['collector_cpu_pct']:.2f}% of a CPU over {overhead['wall_s']:.1f}s, "
+              f"{overhead['achieved_rate']:.1f} sweeps/s ({overhead['late_sweeps']} late), "
+              f"sweep p50 {overhead['sweep_p50_s'] * 1e3:.2f} ms p99 {overhead['sweep_p99_s'] * 1e3:.2f} ms, "
+              f"{overhead['cpu_us_per_sample']} μs CPU per thread sample")
+    else:
+        print("Collector: no overhead record, the recording was cut short")
+
+    print("\nWhere the process's threads were blocked (share of all samples):")
+    for name, share in list(report['syscall_mix'].items())[:mix_width]:
+        print(f"  {name:<24} {share:>6.2f}%")
+
+    print(f"\nThreads by CPU time (time split as % of the sampled span, syscall mix as % of samples):")
+    print(f"{'tid':>8} {'comm':<16} {'user':>6} {'sys':>6} {'runq':>6} {'off':>6} {'in sc':>6} "
+          f"{'rd sc':>9} {'wr sc':>9}  syscall mix")
+    for row in report['threads'][:top]:
+        def show(value):
+            return f"{value:>6.1f}" if value is not None else f"{'-':>6}"
+        mix = ', '.join(f"{name} {share:.0f}%" for name, share in list(row['syscall_mix'].items())[:mix_width])
+        print(f"{row['tid']:>8} {row['comm']:<16} {show(row['user_pct'])} {show(row['system_pct'])} "
+              f"{show(row['runqueue_pct'])} {show(row['off_cpu_pct'])} {row['syscall_samples_pct']:>6.1f} "
+              f"{row['read_syscalls']:>9,} {row['write_syscalls']:>9,}  {mix}")
+    if len(report['threads']) > top:
+        print(f"... {len(report['threads']) - top} more threads (--top)")
+
+def write_report(report, output, fmt):
+    if fmt == 'csv':
+        writer = csv.DictWriter(output, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        for row in report['threads']:
+            writer.writerow(dict(row, syscall_mix=' '.join(f"{name}:{share}" for name, share in
+                                                           row['syscall_mix'].items())))
+    else:
+        json.dump(report, output, indent=2)
+        output.write('\n')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sample a process's threads from /proc instead of strace")
+    parser.add_argument('--pid', type=int, help="process to sample, e.g. \"$(pidof mysqld)\"")
+    parser.add_argument('--rate', type=float, default=100, help="sweeps over all threads per second (default: 100)")
+    parser.add_argument('--duration', type=float, help="seconds to record (default: until SIGINT or exit)")
+    parser.add_argument('-o', '--output-log', default=f'{platform.release()}.psamp',
+                        help="sample log to write (default: <kernel>.psamp)")
+    parser.add_argument('--no-syscall', action='store_true', help="skip /proc/<tid>/syscall, the costliest file")
+    parser.add_argument('--no-io', action='store_true', help="skip /proc/<tid>/io")
+    parser.add_argument('--report', metavar='LOG', help="report on a recorded log instead of recording")
+    parser.add_argument('--top', type=int, default=20, help="threads shown in the text report (default: 20)")
+    parser.add_argument('--mix', type=int, default=5, help="syscalls shown per thread (default: 5)")
+    parser.add_argument('--format', choices=['text', 'json', 'csv'], default='text')
+    parser.add_argument('--output', help="write the json or csv report to this file instead of stdout")
+    args = parser.parse_args()
+    if not args.report and args.pid is None:
+        parser.error("--pid is required to record")
+    return args
+
+def main():
+    args = parse_args()
+    log = args.report
+    if not log:
+        print(f"Sampling pid {args.pid} at {args.rate} Hz into {args.output_log}...", file=sys.stderr)
+        try:
+            record(args.pid, args.output_log, args.rate, args.duration, not args.no_syscall, not args.no_io)
+        except FileNotFoundError as error:
+            print(f"Error: {error}", file=sys.stderr)
+            sys.exit(1)
+        log = args.output_log
+
+    try:
+        report = build_report(log)
+    except (OSError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        sys.exit(1)
+    if args.format == 'text':
+        print_report(report, args.top, args.mix)
+    elif args.output:
+        with open(args.output, 'w', newline='') as output:
+            write_report(report, output, args.format)
+    else:
+        write_report(report, sys.stdout, args.format)
+
+if __name__ == '__main__':
+    main()
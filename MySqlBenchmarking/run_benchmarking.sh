@@ -5,12 +5,22 @@ if [ "$EUID" -ne 0 ]; then
 fi
 
 sysbench oltp_read_write --db-driver=mysql --mysql-db=sysbench_test --mysql-user=sysbench_user --mysql-password=password --table-size=1000000 --threads=4 prepare
-strace -f -p "$(pidof mysqld)" 2> "mysql-$(uname -r).strace"&
+# TRACER=proc samples /proc instead of attaching strace, so the sysbench numbers are not
+# distorted by ptrace (report with: python3 proc_sampler.py --report mysql-$(uname -r).psamp)
+# COMPRESS=gz|xz|zst compresses the strace output, see Common/compress.sh
+. "$(dirname "$0")/../Common/compress.sh"
+strace_target "mysql-$(uname -r).strace"
+if [ "${TRACER:-strace}" = "proc" ]; then
+    python3 proc_sampler.py --pid "$(pidof mysqld)" -o "mysql-$(uname -r).psamp" > /dev/null&
+else
+    strace -f -p "$(pidof mysqld)" -o "$strace_output"&
+fi
 STRACE_PID=$!
 sleep 5
 sysbench oltp_read_write --db-driver=mysql --mysql-db=sysbench_test --mysql-user=sysbench_user --mysql-password=password --table-size=1000000 --threads=4 --time=120 run > $(uname -r)-log.txt
 sleep 5
 kill -s SIGINT "$STRACE_PID"
+wait "$STRACE_PID"
 sysbench oltp_read_write --db-driver=mysql --mysql-db=sysbench_test --mysql-user=sysbench_user --mysql-password=password cleanup
 
 
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Parse the sysbench OLTP logs written by run_benchmarking.sh (<kernel>-log.txt, and older
+<kernel>.res.txt files) and compare kernels.
+
+Every "SQL statistics" block of a log is one run. Runs are ranked by transactions per
+second and by 95th percentile latency, and each kernel is joined with the strace capture
+recorded during its run (mysql-<kernel>.strace, or .strace.gz/.xz/.zst) to give syscalls
+per transaction, which does not depend on how long strace was attached. When several runs
+share one capture, its syscalls are divided by the transactions of all of them:
+
+    python3 sysbench_report.py                    # logs and traces in this directory
+    python3 sysbench_report.py --format csv --output sysbench.csv
+"""
+import argparse
+import csv
+import json
+import re
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'Common'))
+from strace_chunks import parse_strace_file
+from strace_parser import CALL_START_PATTERN
+
+LOG_PATTERNS = ['*-log.txt', '*.res.txt']
+STRACE_PATTERNS = ['mysql-*.strace', 'mysql-*.strace.gz', 'mysql-*.strace.xz', 'mysql-*.strace.zst']
+
+# A run's summary, as sysbench 1.0 prints it after "SQL statistics:"
+FIELD_PATTERNS = {
+    'threads': r'Number of threads:\s+(\d+)',
+    'reads': r'read:\s+(\d+)',
+    'writes': r'write:\s+(\d+)',
+    'other': r'other:\s+(\d+)',
+    'transactions': r'transactions:\s+(\d+)',
+    'tps': r'transactions:\s+\d+\s+\(([\d.]+) per sec\.\)',
+    'queries': r'queries:\s+(\d+)',
+    'qps': r'queries:\s+\d+\s+\(([\d.]+) per sec\.\)',
+    'ignored_errors': r'ignored errors:\s+(\d+)',
+    'reconnects': r'reconnects:\s+(\d+)',
+    'total_time': r'total time:\s+([\d.]+)s',
+    'events': r'total number of events:\s+(\d+)',
+    'latency_min': r'min:\s+([\d.]+)',
+    'latency_avg': r'avg:\s+([\d.]+)',
+    'latency_max': r'max:\s+([\d.]+)',
+    'latency_p95': r'95th percentile:\s+([\d.]+)',
+    'events_avg': r'events \(avg/stddev\):\s+([\d.]+)/',
+    'events_stddev': r'events \(avg/stddev\):\s+[\d.]+/([\d.]+)',
+    'exec_time_avg': r'execution time \(avg/stddev\):\s+([\d.]+)/',
+    'exec_time_stddev': r'execution time \(avg/stddev\):\s+[\d.]+/([\d.]+)',
+}
+FIELD_PATTERNS = {field: re.compile(pattern) for field, pattern in FIELD_PATTERNS.items()}
+
+REPORT_FIELDS = ['kernel', 'run', 'source', 'threads', 'transactions', 'tps', 'queries', 'qps',
+                 'ignored_errors', 'reconnects', 'total_time', 'latency_min', 'latency_avg',
+                 'latency_p95', 'latency_max', 'events_avg', 'events_stddev', 'fairness_cv',
+                 'exec_time_avg', 'exec_time_stddev', 'tps_rank', 'p95_rank', 'strace',
+                 'syscalls', 'syscalls_per_transaction']
+
+def kernel_from_log(path):
+    """'6.12.1-log.txt' -> '6.12.1', '5.4.res.txt' -> '5.4'"""
+    name = path.name
+    for suffix in ('-log.txt', '.res.txt'):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return path.stem
+
+def parse_sysbench_log(path):
+    """
+    One dict per run in a sysbench log, latencies in milliseconds.
+    The thread count comes from the "Running the test" header of each run.
+    """
+    text = Path(path).read_text(errors='replace')
+    runs = []
+    # Each run's header precedes its statistics, so split before every "SQL statistics:"
+    blocks = text.split('SQL statistics:')
+    for number, block in enumerate(blocks[1:], 1):
+        run = {'kernel': kernel_from_log(Path(path)), 'run': number, 'source': str(path)}
+        header = FIELD_PATTERNS['threads'].findall(blocks[number - 1])
+        run['threads'] = int(header[-1]) if header else None
+        for field, pattern in FIELD_PATTERNS.items():
+            if field == 'threads':
+                continue
+            match = pattern.search(block)
+            if match:
+                value = match.group(1)
+                run[field] = float(value) if '.' in value else int(value)
+            else:
+                run[field] = None
+        # Coefficient of variation of events per thread, 0 when every thread did the same work
+        if run['events_avg']:
+            run['fairness_cv'] = round(run['events_stddev'] / run['events_avg'], 4)
+        else:
+            run['fairness_cv'] = None
+        runs.append(run)
+    return runs
+
+def find_strace(kernel, strace_files):
+    """
+    The capture of a kernel: mysql-<kernel>.strace, or the only capture whose full release
+    starts with the shortened name a log may use (5.4 -> mysql-5.4.0-150-generic.strace).
+    """
+    by_kernel = {path.name[len('mysql-'):path.name.rindex('.strace')]: path for path in strace_files}
+    if kernel in by_kernel:
+        return by_kernel[kernel]
+    candidates = [path for name, path in by_kernel.items() if re.match(re.escape(kernel) + r'[.-]', name)]
+    return candidates[0] if len(candidates) == 1 else None
+
+def count_trace_syscalls(strace_path, jobs=1, use_cache=False):
+    """Calls started in the capture, a call split by strace counted once on both paths"""
+    if use_cache:
+        from trace_store import load_strace_store, store_syscall_counts
+        return sum(store_syscall_counts(load_strace_store(str(strace_path))).values())
+    return sum(parse_strace_file(str(strace_path), CALL_START_PATTERN, jobs).values())
+
+def rank(runs, field, reverse):
+    """Dense 1-based rank of every run by field, runs without the field are left unranked"""
+    values = sorted({run[field] for run in runs if run[field] is not None}, reverse=reverse)
+    positions = {value: position for position, value in enumerate(values, 1)}
+    return [positions.get(run[field]) for run in runs]
+
+def build_report(directory, strace_dir=None, jobs=1, use_cache=False, with_syscalls=True):
+    directory = Path(directory)
+    logs = sorted({path for pattern in LOG_PATTERNS for path in directory.glob(pattern)})
+    runs = [run for log in logs for run in parse_sysbench_log(log)]
+
+    for field, reverse, rank_field in [('tps', True, 'tps_rank'), ('latency_p95', False, 'p95_rank')]:
+        for run, position in zip(runs, rank(runs, field, reverse)):
+            run[rank_field] = position
+
+    strace_dir = Path(strace_dir or directory)
+    strace_files = sorted({path for pattern in STRACE_PATTERNS for path in strace_dir.glob(pattern)}) if with_syscalls else []
+    syscall_totals = {}
+    transaction_totals = {}
+    strace_paths = [find_strace(run['kernel'], strace_files) for run in runs]
+    for run, strace_path in zip(runs, strace_paths):
+        run['strace'] = strace_path.name if strace_path else None
+        run['syscalls'] = run['syscalls_per_transaction'] = None
+        if strace_path is None:
+            continue
+        if strace_path not in syscall_totals:
+            print(f"Counting syscalls in {strace_path}...", file=sys.stderr)
+            syscall_totals[strace_path] = count_trace_syscalls(strace_path, jobs, use_cache)
+        run['syscalls'] = syscall_totals[strace_path]
+        transaction_totals[strace_path] = transaction_totals.get(strace_path, 0) + (run['transactions'] or 0)
+    # A capture spans every run of its log, so its syscalls are shared by all their transactions
+    for run, strace_path in zip(runs, strace_paths):
+        if strace_path is not None and transaction_totals[strace_path]:
+            run['syscalls_per_transaction'] = round(run['syscalls'] / transaction_totals[strace_path], 2)
+
+    runs.sort(key=lambda run: (run['tps_rank'] is None, run['tps_rank'] or 0, run['kernel'], run['run']))
+    return runs
+
+def print_report(runs):
+    best = max((run['tps'] for run in runs if run['tps']), default=None)
+    print("\nSysbench OLTP read/write by kernel (ranked by transactions/s)")
+    print("=" * 100)
+    print(f"{'kernel':<22} {'run':>3} {'thr':>4} {'TPS':>9} {'vs best':>8} {'QPS':>10} {'p95 ms':>8} "
+          f"{'p95 rank':>8} {'avg ms':>7} {'min ms':>7} {'max ms':>8} {'fair cv':>8} {'sc/txn':>8}")
+    for run in runs:
+        def show(value, spec):
+            return format(value, spec) if value is not None else format('-', spec.split('.')[0])
+        versus = f"{(run['tps'] / best - 1) * 100:+.1f}%" if run['tps'] and best else '-'
+        print(f"{run['kernel']:<22} {run['run']:>3} {show(run['threads'], '>4')} {show(run['tps'], '>9.2f')} "
+              f"{versus:>8} {show(run['qps'], '>10.2f')} {show(run['latency_p95'], '>8.2f')} "
+              f"{show(run['p95_rank'], '>8')} {show(run['latency_avg'], '>7.2f')} {show(run['latency_min'], '>7.2f')} "
+              f"{show(run['latency_max'], '>8.2f')} {show(run['fairness_cv'], '>8.4f')} "
+              f"{show(run['syscalls_per_transaction'], '>8.1f')}")
+    missing = sorted({run['kernel'] for run in runs if run['strace'] is None})
+    if missing:
+        print(f"\nNo mysql-<kernel>.strace capture found for: {', '.join(missing)}")
+
+def write_report(runs, output, fmt):
+    if fmt == 'csv':
+        writer = csv.DictWriter(output, fieldnames=REPORT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(runs)
+    else:
+        json.dump(runs, output, indent=2)
+        output.write('\n')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare sysbench OLTP results across kernels")
+    parser.add_argument('directory', nargs='?', default=str(Path(__file__).resolve().parent),
+                        help="folder with the <kernel>-log.txt files (default: this script's folder)")
+    parser.add_argument('--strace-dir', help="folder with the mysql-<kernel>.strace captures (default: directory)")
+    parser.add_argument('--no-syscalls', action='store_true', help="skip the join with the strace captures")
+    parser.add_argument('--jobs', type=int, default=1, help="worker processes used to count syscalls")
+    parser.add_argument('--cache', action='store_true', help="count syscalls through the columnar cache")
+    parser.add_argument('--format', choices=['text', 'json', 'csv'], default='text')
+    parser.add_argument('--output', help="write the json or csv report to this file instead of stdout")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    runs = build_report(args.directory, args.strace_dir, args.jobs, args.cache, not args.no_syscalls)
+    if not runs:
+        print(f"Error: no sysbench results found in {args.directory}", file=sys.stderr)
+        sys.exit(1)
+    if args.format == 'text':
+        print_report(runs)
+    elif args.output:
+        with open(args.output, 'w', newline='') as output:
+            write_report(runs, output, args.format)
+    else:
+        write_report(runs, sys.stdout, args.format)
+
+if __name__ == '__main__':
+    main()
@@ -1,32 +1,33 @@
-import re
-import matplotlib.pyplot as plt
 from collections import Counter
-import pandas as pd
-import numpy as np
 import sys
+import os
+import time
+import argparse
+from pathlib import Path
 
-def parse_strace_file(file_path):
-    # Updated pattern to match pid and syscall names even with resumed calls
-    syscall_pattern = r'\[pid\s+\d+\]\s+(?:<\.\.\.\s+)?(\w+)(?:\s+resumed>|\()'
-    
-    syscalls = []
-    with open(file_path, 'r') as file:
-        content = file.read()
-        matches = re.finditer(syscall_pattern, content)
-        for match in matches:
-            syscall_name = match.group(1)
-            # Skip if it's not actually a syscall
-            if syscall_name not in ['resumed']:
-                syscalls.append(syscall_name)
-    
-    return syscalls
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'Common'))
+import strace_chunks
+from strace_latency import collect_latencies, summarize_latency
+from strace_parser import CALL_START_PATTERN
+
+# The start of every call, "[pid N] name(" as strace -f writes it on stderr, "N name(" with
+# -o and "name(" for the traced process itself, with or without -tt timestamps.
+# "<... name resumed>" halves are not matched, so a call split by strace is counted once,
+# as by the columnar cache (--cache).
+SYSCALL_PATTERN = CALL_START_PATTERN
+
+def parse_strace_file(file_path, jobs=1, chunk_size=strace_chunks.CHUNK_SIZE):
+    """Return a Counter of syscall names in the trace, see strace_chunks.parse_strace_file"""
+    return strace_chunks.parse_strace_file(file_path, SYSCALL_PATTERN, jobs, chunk_size)
 
 def analyze_syscalls(syscalls, min_percentage=1.0):
+    import pandas as pd
+
     if not syscalls:
         print("No syscalls were found in the input file!")
         return pd.DataFrame(), pd.DataFrame()
     
-    # Count syscalls
+    # Count syscalls (also accepts an already built Counter)
     syscall_counts = Counter(syscalls)
     
     # Convert to DataFrame for easier manipulation
@@ -57,7 +58,11 @@ def analyze_syscalls(syscalls, min_percentage=1.0):
     
     return df_filtered, df
 
-def create_visualizations(df_filtered, df_full, output_file=f'syscall_analysis_{sys.argv[1]}.png'):
+def create_visualizations(df_filtered, df_full, output_file='syscall_analysis.png'):
+    # Plotting libraries are only loaded when an image is requested
+    import matplotlib.pyplot as plt
+    import numpy as np
+
     if df_filtered.empty or df_full.empty:
         print("No data to visualize!")
         return
@@ -128,32 +133,163 @@ def print_statistics(df_filtered, df_full, total_syscalls):
     formatted_full['count'] = formatted_full['count'].apply(lambda x: f"{int(x):,}")
     print(formatted_full.to_string(index=False))
 
-def main():
-    if len(sys.argv) != 2:
-        print("Usage: python3 syscall_analyzer.py <strace file>")
-        sys.exit(1)
+def print_throughput(file_path, elapsed, jobs=1):
+    size_mb = os.path.getsize(file_path) / (1024 * 1024)
+    rate = size_mb / elapsed if elapsed > 0 else float('inf')
+    print(f"\nParsed {size_mb:,.1f} MB in {elapsed:.2f} seconds ({rate:,.1f} MB/s, {jobs} job(s))")
+
+def create_latency_visualizations(df_latency, output_file, top_n=20):
+    # Plotting libraries are only loaded when an image is requested
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    if df_latency.empty:
+        print("No data to visualize!")
+        return
+
+    df_top = df_latency.head(top_n)
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(20, 10))
+    colors = plt.cm.Set3(np.linspace(0, 1, len(df_top)))
+
+    # Total time spent in each syscall
+    ax1.barh(df_top['syscall'], df_top['total'], color=colors)
+    ax1.invert_yaxis()
+    ax1.set_title(f'Total Time in System Calls (top {len(df_top)})', fontsize=14, pad=20)
+    ax1.set_xlabel('Seconds', fontsize=12)
+
+    # Typical and tail latency of the same syscalls
+    positions = np.arange(len(df_top))
+    ax2.barh(positions - 0.2, df_top['p50'] * 1e6, height=0.4, label='p50')
+    ax2.barh(positions + 0.2, df_top['p99'] * 1e6, height=0.4, label='p99')
+    ax2.set_yticks(positions)
+    ax2.set_yticklabels(df_top['syscall'])
+    ax2.invert_yaxis()
+    ax2.set_xscale('log')
+    ax2.set_title('System Call Latency', fontsize=14, pad=20)
+    ax2.set_xlabel('Microseconds', fontsize=12)
+    ax2.legend()
+
+    plt.tight_layout()
+    plt.savefig(output_file, bbox_inches='tight', dpi=300)
+    plt.close()
+
+def print_latency_statistics(df_latency, untimed):
+    print("\nSystem Call Latency Summary")
+    print("=" * 50)
+    print(f"Timed system calls: {int(df_latency['calls'].sum()):,}")
+    print(f"Total time in system calls: {df_latency['total'].sum():.6f} seconds")
+    if untimed:
+        print(f"System calls without timing information: {sum(untimed.values()):,}")
+
+    formatted = df_latency.copy()
+    formatted['calls'] = formatted['calls'].apply(lambda x: f"{int(x):,}")
+    formatted['total'] = formatted['total'].apply(lambda x: f"{x:.6f}")
+    for column in ['mean', 'p50', 'p99', 'max']:
+        formatted[column] = formatted[column].apply(lambda x: f"{x * 1e6:.1f}")
+    formatted = formatted.rename(columns={'total': 'total (s)', 'mean': 'mean (us)', 'p50': 'p50 (us)',
+                                          'p99': 'p99 (us)', 'max': 'max (us)'})
+    print(formatted.to_string(index=False))
+
+def analyze_latency(file_path, output_file, use_cache=False):
+    """
+    Pair unfinished/resumed records per pid and report where time in the kernel goes
+    """
+    import pandas as pd
+
+    if use_cache:
+        from trace_store import load_strace_store, store_syscall_durations
+        durations, untimed = store_syscall_durations(load_strace_store(file_path))
+    else:
+        durations, untimed = collect_latencies(file_path)
+    df_latency = pd.DataFrame(summarize_latency(durations))
+    if df_latency.empty:
+        print("Error: No syscall durations found! Record the trace with -T or -tt.")
+        return
+
+    print_latency_statistics(df_latency, untimed)
+    create_latency_visualizations(df_latency, output_file)
+    print(f"\nLatency charts have been saved as '{output_file}'")
 
-    file_path = sys.argv[1]
+def analyze_threads(file_path, top=20, use_cache=False):
+    """
+    Rank mysqld's threads by the syscalls they made
+    """
+    from strace_threads import count_thread_syscalls, print_thread_ranking, rank_threads
+    if use_cache:
+        from trace_store import load_strace_store
+        from strace_threads import store_thread_counts
+        thread_counts = store_thread_counts(load_strace_store(file_path))
+    else:
+        thread_counts = count_thread_syscalls(file_path)
+    print_thread_ranking(rank_threads(thread_counts), f"Hottest threads ({len(thread_counts.tids):,} traced, "
+                         f"pid 0 is the process strace attached to)", top)
+
+def analyze_sequences(file_path, n, top=20):
+    """
+    The syscall sequences mysqld's threads repeat most (futex ping-pong, pread64/pwrite64/fsync chains, ...)
+    """
+    from strace_ngrams import mine_ngrams, print_sequences, top_sequences
+    summary, threads = mine_ngrams(file_path, n)
+    print_sequences(file_path, top_sequences(summary, top), summary, threads, n)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Analyze syscalls in a mysqld strace capture")
+    parser.add_argument('file', help="strace file")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="number of worker processes used to parse the trace (default: 1)")
+    parser.add_argument('--latency', action='store_true',
+                        help="report time spent per syscall instead of call counts (needs -T or -tt)")
+    parser.add_argument('--cache', action='store_true',
+                        help="parse through the columnar cache in .trace_cache, rebuilt when the trace changes "
+                             "(counts each call once, even when strace split it into unfinished/resumed lines)")
+    parser.add_argument('--threads', action='store_true', help="rank mysqld's threads by syscall volume")
+    parser.add_argument('--ngrams', type=int, metavar='N',
+                        help="report the most frequent N-call sequences per thread instead of counts")
+    parser.add_argument('--top', type=int, default=20, help="rows shown with --threads or --ngrams (default: 20)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    file_path = args.file
     min_percentage = 1.0  # Minimum percentage threshold
+    output_file = f'syscall_analysis_{file_path}.png'
+
+    if args.threads:
+        analyze_threads(file_path, args.top, args.cache)
+        return
+    if args.ngrams:
+        analyze_sequences(file_path, args.ngrams, args.top)
+        return
+    if args.latency:
+        print(f"Analyzing syscall latency in {file_path}...")
+        analyze_latency(file_path, f'syscall_latency_{file_path}.png', args.cache)
+        return
     
     # Parse and analyze syscalls
     print(f"Analyzing {file_path}...")
-    syscalls = parse_strace_file(file_path)
+    start_time = time.perf_counter()
+    if args.cache:
+        from trace_store import load_strace_store, store_syscall_counts
+        syscalls = store_syscall_counts(load_strace_store(file_path))
+    else:
+        syscalls = parse_strace_file(file_path, jobs=args.jobs)
+    elapsed = time.perf_counter() - start_time
     
     if not syscalls:
         print("Error: No syscalls found in the input file!")
         return
         
-    total_syscalls = len(syscalls)
+    total_syscalls = sum(syscalls.values())
     df_filtered, df_full = analyze_syscalls(syscalls, min_percentage)
     
     # Create visualizations
-    create_visualizations(df_filtered, df_full)
+    create_visualizations(df_filtered, df_full, output_file)
     
     # Print statistics
     print_statistics(df_filtered, df_full, total_syscalls)
     
-    print(f"\nVisualizations have been saved as 'syscall_analysis.png'")
+    print(f"\nVisualizations have been saved as '{output_file}'")
+    print_throughput(file_path, elapsed, args.jobs)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Single entry point for the analysis scripts in this repository.
+
+    python3 linux_eval.py syscalls mysql-6.12.1.strace --trace-format mysql --format json
+    python3 linux_eval.py latency strace_log.txt --plot latency.png
+    python3 linux_eval.py timeline strace_log.txt --window 0.5 --plot timeline.png
+    python3 linux_eval.py threads mysql-6.12.1.strace --top 20 --format csv
+    python3 linux_eval.py ngrams MySqlBenchmarking/mysql-*.strace -n 3 --top 15
+    python3 linux_eval.py heatmap "Graphing Tool" --center 5.14
+    python3 linux_eval.py regressions "Graphing Tool" --format csv
+    python3 linux_eval.py sysbench MySqlBenchmarking --format csv
+    python3 linux_eval.py procsample --report mysql-6.12.1.psamp
+    python3 linux_eval.py flamegraph
+    python3 linux_eval.py flamediff 5.15-trace.dat 6.12-trace.dat
+    python3 linux_eval.py flamesvg output.folded -o flamegraph.svg
+
+Text and JSON output never import pandas, seaborn or matplotlib; the plotting
+stack is only loaded when an image is requested with --plot or by `heatmap`, and
+numpy only by `threads` and --cache.
+Keep module level imports here limited to the standard library so startup stays
+fast (see startup_benchmark.py).
+"""
+import argparse
+import importlib
+import importlib.abc
+import importlib.util
+import json
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+
+# Scripts live in directories that are not packages (and several share a file name),
+# so they are imported under these names straight from their paths.
+SCRIPTS = {
+    'mysql_syscall_graph': 'MySqlBenchmarking/syscall_graph.py',
+    'ml_syscall_graph': 'MLBenchmarking/syscall_graph.py',
+    'sysbench_syscall_graph': 'MySqlBenchmarking/StraceAnalysis/syscall_graph.py',
+    'Grapher': 'Graphing Tool/Grapher.py',
+    'regression_detector': 'Graphing Tool/regression_detector.py',
+    'sysbench_report': 'MySqlBenchmarking/sysbench_report.py',
+    'proc_sampler': 'MySqlBenchmarking/proc_sampler.py',
+    'tracecmd_to_flamegraph': 'Experimenting/tracecmd_to_flamegraph.py',
+    'flamegraph_diff': 'Experimenting/flamegraph_diff.py',
+    'flamegraph_svg': 'Experimenting/flamegraph_svg.py',
+}
+
+# Which syscall_graph.py understands which strace capture
+TRACE_FORMATS = {
+    'mysql': 'mysql_syscall_graph',        # strace -f -p, "[pid N] name(" lines
+    'ml': 'ml_syscall_graph',              # strace -f -o, "PID name(" lines
+    'sysbench': 'sysbench_syscall_graph',  # strace -f -tt -o, "PID HH:MM:SS name(" lines
+}
+
+# Subcommands that hand their arguments to a script's own parser
+PASSTHROUGH_COMMANDS = {
+    'regressions': 'regression_detector',
+    'sysbench': 'sysbench_report',
+    'procsample': 'proc_sampler',
+    'flamegraph': 'tracecmd_to_flamegraph',
+    'flamediff': 'flamegraph_diff',
+    'flamesvg': 'flamegraph_svg',
+}
+
+class ScriptFinder(importlib.abc.MetaPathFinder):
+    """
+    Resolve the names in SCRIPTS to their files. Installed at import time so that
+    worker processes started by the scripts' process pools can unpickle their functions.
+    """
+    def find_spec(self, name, path=None, target=None):
+        if name not in SCRIPTS:
+            return None
+        return importlib.util.spec_from_file_location(name, ROOT / SCRIPTS[name])
+
+sys.meta_path.append(ScriptFinder())
+sys.path.insert(0, str(ROOT / 'Common'))
+
+def load_script(name):
+    script_dir = str((ROOT / SCRIPTS[name]).parent)
+    if script_dir not in sys.path:
+        # Let the script import its siblings the same way it does when run directly
+        sys.path.append(script_dir)
+    return importlib.import_module(name)
+
+def summarize_counts(counts, min_percentage):
+    """
+    Rows of (syscall, count, percentage) sorted by count, with syscalls under
+    min_percentage folded into 'Others'. Same table as analyze_syscalls, without pandas.
+    """
+    total = sum(counts.values())
+    rows = [{'syscall': name, 'count': count, 'percentage': round(count / total * 100, 2)}
+            for name, count in counts.most_common()]
+    kept = [row for row in rows if row['percentage'] >= min_percentage]
+    others = [row for row in rows if row['percentage'] < min_percentage]
+    if others:
+        kept.append({'syscall': 'Others',
+                     'count': sum(row['count'] for row in others),
+                     'percentage': round(sum(row['percentage'] for row in others), 2)})
+    return kept, rows
+
+def print_table(rows, columns):
+    widths = {column: max([len(column)] + [len(row[column]) for row in rows]) for column in columns}
+    print(' '.join(column.rjust(widths[column]) for column in columns))
+    for row in rows:
+        print(' '.join(row[column].rjust(widths[column]) for column in columns))
+
+def run_syscalls(args):
+    module = load_script(TRACE_FORMATS[args.trace_format])
+    if args.cache:
+        from trace_store import load_strace_store, store_syscall_counts
+        counts = store_syscall_counts(load_strace_store(args.file))
+    else:
+        counts = module.parse_strace_file(args.file, jobs=args.jobs)
+    if not counts:
+        print("Error: No syscalls found in the input file!", file=sys.stderr)
+        return 1
+
+    filtered, full = summarize_counts(counts, args.min_percentage)
+    if args.format == 'json':
+        json.dump({'file': args.file, 'total': sum(counts.values()), 'syscalls': full}, sys.stdout, indent=2)
+        print()
+    else:
+        print("\nSystem Call Analysis Summary")
+        print("=" * 50)
+        print(f"Total number of system calls: {sum(counts.values()):,}")
+        print(f"Number of unique system calls: {len(full):,}")
+        print(f"\nTop System Calls (>= {args.min_percentage:g}% of total):")
+        print("=" * 50)
+        print_table([{'syscall': row['syscall'], 'count': f"{row['count']:,}", 'percentage': f"{row['percentage']:.2f}"}
+                     for row in filtered], ['syscall', 'count', 'percentage'])
+
+    if args.plot:
+        df_filtered, df_full = module.analyze_syscalls(counts, args.min_percentage)
+        module.create_visualizations(df_filtered, df_full, args.plot)
+        print(f"\nVisualizations have been saved as '{args.plot}'", file=sys.stderr)
+    return 0
+
+def run_latency(args):
+    # The Common modules are pure python until the cache or a plot is requested
+    from strace_latency import collect_latencies, summarize_latency
+    if args.cache:
+        from trace_store import load_strace_store, store_syscall_durations
+        durations, untimed = store_syscall_durations(load_strace_store(args.file))
+    else:
+        durations, untimed = collect_latencies(args.file)
+    rows = summarize_latency(durations)
+    if not rows:
+        print("Error: No syscall durations found! Record the trace with -T or -tt.", file=sys.stderr)
+        return 1
+
+    if args.format == 'json':
+        json.dump({'file': args.file, 'untimed': dict(untimed), 'syscalls': rows}, sys.stdout, indent=2)
+        print()
+    else:
+        print("\nSystem Call Latency Summary")
+        print("=" * 50)
+        print(f"Timed system calls: {sum(row['calls'] for row in rows):,}")
+        print(f"Total time in system calls: {sum(row['total'] for row in rows):.6f} seconds")
+        if untimed:
+            print(f"System calls without timing information: {sum(untimed.values()):,}")
+        print_table([{'syscall': row['syscall'], 'calls': f"{row['calls']:,}", 'total (s)': f"{row['total']:.6f}",
+                      'mean (us)': f"{row['mean'] * 1e6:.1f}", 'p50 (us)': f"{row['p50'] * 1e6:.1f}",
+                      'p99 (us)': f"{row['p99'] * 1e6:.1f}", 'max (us)': f"{row['max'] * 1e6:.1f}"}
+                     for row in rows],
+                    ['syscall', 'calls', 'total (s)', 'mean (us)', 'p50 (us)', 'p99 (us)', 'max (us)'])
+
+    if args.plot:
+        import pandas as pd
+        module = load_script(TRACE_FORMATS['mysql'])
+        module.create_latency_visualizations(pd.DataFrame(rows), args.plot)
+        print(f"\nLatency charts have been saved as '{args.plot}'", file=sys.stderr)
+    return 0
+
+def run_heatmap(args):
+    module = load_script('Grapher')
+    module.create_heatmap(args.csv_folder, args.center)
+    print("Heatmap created successfully as 'performance_heatmap.png'")
+    print("Per-version medians and confidence intervals written to 'performance_summary.csv'")
+    return 0
+
+def run_script_main(name, argv):
+    """
+    Hand the remaining arguments to a script's own main()
+    """
+    module = load_script(name)
+    sys.argv = [SCRIPTS[name]] + argv
+    module.main()
+    return 0
+
+def run_timeline(args):
+    from strace_timeline import build_timeline, detect_phases, plot_timeline, print_phases, summarize_phases
+    try:
+        timeline = build_timeline(args.file, args.window)
+    except ValueError as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    phases = summarize_phases(timeline, detect_phases(timeline, args.top, args.min_bins))
+
+    if args.format == 'json':
+        json.dump({'file': args.file, 'window': args.window, 'bins': timeline.bins, 'phases': phases,
+                   'calls': {name: list(timeline.counts[name]) for name in timeline.busiest(args.top)}},
+                  sys.stdout, indent=2)
+        print()
+    else:
+        print_phases(timeline, phases)
+
+    if args.plot:
+        plot_timeline(timeline, phases, args.plot, args.top)
+        print(f"\nTimeline has been saved as '{args.plot}'", file=sys.stderr)
+    return 0
+
+def run_threads(args):
+    from strace_threads import count_thread_syscalls, print_thread_ranking, rank_processes, rank_threads
+    if args.cache and args.processes:
+        # The cache drops clone results, so every thread would be ranked as its own process
+        print("Warning: --processes needs clone results, which .trace_cache does not keep; "
+              "counting from the trace instead of the cache", file=sys.stderr)
+    if args.cache and not args.processes:
+        from trace_store import load_strace_store
+        from strace_threads import store_thread_counts
+        thread_counts = store_thread_counts(load_strace_store(args.file))
+    else:
+        thread_counts = count_thread_syscalls(args.file)
+    if not thread_counts.tids:
+        print("Error: No syscalls found in the input file!", file=sys.stderr)
+        return 1
+    rows = rank_processes(thread_counts) if args.processes else rank_threads(thread_counts)
+
+    if args.format == 'json':
+        json.dump({'file': args.file, 'threads': len(thread_counts.tids), 'rows': rows[:args.top]},
+                  sys.stdout, indent=2)
+        print()
+    elif args.format == 'csv':
+        import csv
+        writer = csv.DictWriter(sys.stdout, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(dict(row, top_syscalls=' '.join(f"{name}:{count}" for name, count in
+                                                         row['top_syscalls'].items())) for row in rows[:args.top])
+    else:
+        title = "Processes by syscalls (with their threads)" if args.processes else "Threads by syscalls"
+        print_thread_ranking(rows, f"{title}, {len(thread_counts.tids):,} threads traced", args.top)
+    return 0
+
+def run_ngrams(args):
+    from strace_ngrams import mine_ngrams, print_sequences, top_sequences
+    rows = []
+    for file_path in args.files:
+        summary, threads = mine_ngrams(file_path, args.n, args.capacity)
+        if not summary.total:
+            print(f"Warning: no {args.n}-call sequences in {file_path}", file=sys.stderr)
+            continue
+        file_rows = top_sequences(summary, args.top)
+        if args.format == 'text':
+            print_sequences(file_path, file_rows, summary, threads, args.n)
+        rows += [dict(row, file=file_path, n=args.n, total=summary.total) for row in file_rows]
+
+    if args.format == 'json':
+        json.dump(rows, sys.stdout, indent=2)
+        print()
+    elif args.format == 'csv':
+        import csv
+        writer = csv.DictWriter(sys.stdout, fieldnames=['file', 'n', 'rank', 'sequence', 'count', 'error',
+                                                        'min_count', 'percentage', 'total'])
+        writer.writeheader()
+        writer.writerows(rows)
+    return 0 if rows else 1
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Linux evaluation analysis tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for command, help_text in [('syscalls', "count syscalls in an strace capture"),
+                               ('latency', "time spent per syscall in an strace capture (needs -T or -tt)")]:
+        sub = subparsers.add_parser(command, help=help_text)
+        sub.add_argument('file', help="strace file")
+        sub.add_argument('--format', choices=['text', 'json'], default='text')
+        sub.add_argument('--plot', metavar='PNG', help="also save charts to this image")
+        sub.add_argument('--cache', action='store_true', help="parse through the columnar cache in .trace_cache")
+        if command == 'syscalls':
+            sub.add_argument('--trace-format', choices=sorted(TRACE_FORMATS), default='mysql',
+                             help="which capture script produced the trace (default: mysql)")
+            sub.add_argument('--jobs', type=int, default=1, help="worker processes used to parse the trace")
+            sub.add_argument('--min-percentage', type=float, default=1.0,
+                             help="fold syscalls below this share into 'Others'")
+
+    sub = subparsers.add_parser('timeline', help="syscall rates over time and phases (needs -tt or -ttt)")
+    sub.add_argument('file', help="strace file")
+    sub.add_argument('--window', type=float, default=1.0, help="seconds per bin (default: 1)")
+    sub.add_argument('--top', type=int, default=8, help="syscalls plotted and used to find phases (default: 8)")
+    sub.add_argument('--min-bins', type=int, default=5, help="shortest phase, in bins (default: 5)")
+    sub.add_argument('--format', choices=['text', 'json'], default='text')
+    sub.add_argument('--plot', metavar='PNG', help="also save the rate plot to this image")
+
+    sub = subparsers.add_parser('threads', help="rank threads or processes of an strace -f capture by syscalls")
+    sub.add_argument('file', help="strace file")
+    sub.add_argument('--processes', action='store_true',
+                     help="one row per process and its threads (e.g. DataLoader workers)")
+    sub.add_argument('--top', type=int, default=20, help="rows shown (default: 20)")
+    sub.add_argument('--format', choices=['text', 'json', 'csv'], default='text')
+    sub.add_argument('--cache', action='store_true',
+                     help="count through the columnar cache in .trace_cache (not used with --processes)")
+
+    sub = subparsers.add_parser('ngrams', help="most frequent per-thread syscall sequences, one pass, bounded memory")
+    sub.add_argument('files', nargs='+', help="strace files, e.g. one per kernel")
+    sub.add_argument('-n', type=int, default=3, help="calls per sequence (default: 3)")
+    sub.add_argument('--capacity', type=int, default=10000,
+                     help="sequences monitored; more is tighter error bounds and more memory (default: 10000)")
+    sub.add_argument('--top', type=int, default=20, help="sequences reported per file (default: 20)")
+    sub.add_argument('--format', choices=['text', 'json', 'csv'], default='text')
+
+    sub = subparsers.add_parser('heatmap', help="LEBench percentage-change heatmap")
+    sub.add_argument('csv_folder', nargs='?', default='.')
+    sub.add_argument('--center', default='5.14', help="version to compare against (major.minor)")
+
+    subparsers.add_parser('regressions', add_help=False, help="LEBench changepoint report (regression_detector.py)")
+    subparsers.add_parser('sysbench', add_help=False, help="sysbench OLTP results and syscalls per transaction by kernel")
+    subparsers.add_parser('procsample', add_help=False, help="sample a process's threads from /proc instead of strace")
+    subparsers.add_parser('flamegraph', add_help=False, help="trace-cmd function graph to folded stacks")
+    subparsers.add_parser('flamediff', add_help=False, help="differential flame graph between two kernels")
+    subparsers.add_parser('flamesvg', add_help=False, help="render folded stacks as a flame, icicle or differential SVG")
+
+    args, rest = parser.parse_known_args(argv)
+    if rest and args.command not in PASSTHROUGH_COMMANDS:
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+    return args, rest
+
+def main(argv=None):
+    args, rest = parse_args(sys.argv[1:] if argv is None else argv)
+    if args.command == 'syscalls':
+        return run_syscalls(args)
+    if args.command == 'latency':
+        return run_latency(args)
+    if args.command == 'timeline':
+        return run_timeline(args)
+    if args.command == 'threads':
+        return run_threads(args)
+    if args.command == 'ngrams':
+        return run_ngrams(args)
+    if args.command == 'heatmap':
+        return run_heatmap(args)
+    return run_script_main(PASSTHROUGH_COMMANDS[args.command], rest)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Startup-time guard for linux_eval.py.
+
+Runs the text and JSON subcommands on a tiny generated trace in fresh interpreters,
+reports the median wall time of each and fails (exit status 1) when a command is
+slower than --budget-ms or when it imports any of the heavy libraries that are
+only meant to load for plots. Run it after touching imports in any analysis script.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+CLI = ROOT / 'linux_eval.py'
+
+# Modules that must never be imported on the text/JSON paths
+HEAVY_MODULES = ['pandas', 'numpy', 'matplotlib', 'seaborn']
+
+SAMPLE_TRACE = (
+    "[pid  1234] futex(0x7f, FUTEX_WAIT_PRIVATE, 0, NULL <unfinished ...>\n"
+    "[pid  1235] read(3, \"abc\", 3) = 3 <0.000010>\n"
+    "[pid  1234] <... futex resumed>) = 0 <0.002000>\n"
+    "[pid  1236] pwrite64(5, \"x\", 1, 0) = 1 <0.000020>\n"
+)
+
+# The same calls recorded with -tt, for the timeline
+TIMED_TRACE = (
+    "1234  12:00:01.000100 futex(0x7f, FUTEX_WAIT_PRIVATE, 0, NULL <unfinished ...>\n"
+    "1235  12:00:01.000200 read(3, \"abc\", 3) = 3\n"
+    "1234  12:00:01.002100 <... futex resumed>) = 0\n"
+    "1236  12:00:02.500000 pwrite64(5, \"x\", 1, 0) = 1\n"
+)
+
+COMMANDS = [
+    ['syscalls', '{trace}'],
+    ['syscalls', '{trace}', '--format', 'json'],
+    ['latency', '{trace}'],
+    ['latency', '{trace}', '--format', 'json'],
+    ['timeline', '{timed}'],
+    ['timeline', '{timed}', '--format', 'json'],
+]
+
+def imported_modules(command):
+    """
+    Top-level package names imported while running command, from -X importtime
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', str(CLI)] + command,
+                            capture_output=True, text=True, check=True)
+    modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            modules.add(line.rsplit('|', 1)[1].strip().split('.')[0])
+    return modules
+
+def time_command(command, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, str(CLI)] + command, stdout=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Guard linux_eval.py text/JSON startup time")
+    parser.add_argument('--repeat', type=int, default=5, help="runs per command (default: 5)")
+    parser.add_argument('--budget-ms', type=float, default=300.0, help="maximum median wall time per command")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        trace = Path(tmp_dir) / 'sample.strace'
+        trace.write_text(SAMPLE_TRACE)
+        timed = Path(tmp_dir) / 'timed.strace'
+        timed.write_text(TIMED_TRACE)
+
+        print(f"{'command':<40} {'median (ms)':>12}  heavy imports")
+        for template in COMMANDS:
+            command = [part.format(trace=trace, timed=timed) for part in template]
+            heavy = sorted(set(HEAVY_MODULES) & imported_modules(command))
+            median_ms = time_command(command, args.repeat)
+            label = ' '.join(template).replace('{trace}', 'TRACE').replace('{timed}', 'TRACE')
+            print(f"{label:<40} {median_ms:>12.1f}  {', '.join(heavy) or '-'}")
+            if heavy or median_ms > args.budget_ms:
+                failed = True
+
+    if failed:
+        print(f"\nFAILED: a command imported the plotting stack or took longer than {args.budget_ms:g} ms")
+        sys.exit(1)
+    print("\nOK")
+
+if __name__ == "__main__":
+    main()